@@ -1,9 +1,9 @@
 "use client";
 
-import { useState, useEffect } from "react";
+import { useState, useEffect, useRef } from "react";
 import Link from "next/link";
 import axios from "axios";
-import io from "socket.io-client";
+import io, { Socket } from "socket.io-client";
 import styles from "./page.module.css";
 import Avatar from "../components/Avatar/Avatar";
 
@@ -19,6 +19,7 @@ interface VideoHistoryItem {
 }
 
 interface VideoReadyEvent {
+  id?: string;
   result_url?: string;
 }
 
@@ -33,26 +34,47 @@ export default function Home() {
   const [isPlaying, setIsPlaying] = useState(false);
   const [videoHistory, setVideoHistory] = useState<VideoHistoryItem[]>([]);
   const maxChars = 350;
+  const socketRef = useRef<Socket | null>(null);
+  const textRef = useRef(text);
+  textRef.current = text;
 
-  // Function to poll the GET endpoint for talk status.
+  // Show a finished video. Clips from the pre-rendered library arrive both in
+  // the HTTP response and as a video_ready event, so skip repeats.
+  const playVideo = (url: string) => {
+    setVideoUrl(url);
+    setIsPlaying(true);
+    setVideoHistory(prev =>
+      prev[0]?.url === url ? prev : [{ url, text: textRef.current }, ...prev].slice(0, 2)
+    );
+    setIsProcessing(false);
+  };
+
+  // Connect once; the server only sends this client the events for its own talks.
   useEffect(() => {
     const socket = io(SERVER_URL);
+    socketRef.current = socket;
 
     // Listen for the video_ready event.
     socket.on("video_ready", (data: VideoReadyEvent) => {
       console.log("Received video_ready event:", data);
       if (data.result_url) {
-        setVideoUrl(data.result_url);
-        setIsPlaying(true);
-        setVideoHistory(prev => [{ url: data.result_url || "", text }, ...prev].slice(0, 2));
-        setIsProcessing(false);
+        playVideo(data.result_url);
       }
     });
 
     // Clean up the socket when the component unmounts.
     return () => {
       socket.disconnect();
+      socketRef.current = null;
     };
+  }, []);
+
+  // Stream the draft to the server as the user types, so that with
+  // speculative TTS enabled finished sentences are voiced before the click.
+  useEffect(() => {
+    if (!text.trim()) return;
+    const timer = setTimeout(() => socketRef.current?.emit("draft_text", { text }), 300);
+    return () => clearTimeout(timer);
   }, [text]);
 
   const handleGenerate = async (e: React.FormEvent) => {
@@ -68,12 +90,17 @@ export default function Home() {
     try {
       const response = await axios.post<AvatarResponse>(
         `${SERVER_URL}/api/fast-generate`,
-        { text },
+        { text, socket_id: socketRef.current?.id },
         { headers: { "Content-Type": "application/json" } }
       );
 
-      if (response.data.talk_id) {
+      if (response.data.status === "done" && response.data.result_url) {
+        // Served from the clip library or talk cache: no need to wait for the socket.
+        playVideo(response.data.result_url);
+      } else if (response.data.talk_id) {
         console.log("Talk ID:", response.data.talk_id);
+        // Also join from the socket side, in case it is connected to another server process.
+        socketRef.current?.emit("subscribe", { talk_id: response.data.talk_id });
       } else {
         setError("Avatar generation failed.");
       }
@@ -1,25 +1,123 @@
 from flask import Flask
 from flask_cors import CORS
 from routes import register_routes
+from routes.socket_events import register_socket_events
 from config import Config
 from flask_socketio import SocketIO
+from services.audio_cache import AudioCache
+from services.http_client import HTTPClient
+from services.talk_cache import TalkCache
+from services.job_tracker import JobTracker
+from services.job_queue import JobQueue
+from services.scheduler import JobScheduler, UpstreamLimiter
+from services.clip_library import ClipLibrary
+from services.media import HotFileCache
+from services.profiles import ProfileRegistry
+from services.speculative import SpeculativeAudio
+from services.container import ServiceContainer
+from services.logs import configure_logging
+from services.storage import store_from_config
+from services.socket_bus import socketio_options
 
 def create_app():
     app = Flask(__name__)
     app.config.from_object(Config)
+    configure_logging(app.config)
 
     # Configure CORS
     CORS(app, resources={
         r"/api/*": {
             "origins": app.config['CORS_ORIGINS'],
             "methods": ["GET", "POST", "OPTIONS"],
-            "allow_headers": ["Content-Type"]
+            "allow_headers": ["Content-Type", "Idempotency-Key"]
         }
     })
 
+    # Shared singletons; the ones that touch the disk or the network are
+    # built on first use, so a cold start can answer requests sooner.
+    services = app.extensions = ServiceContainer(app.extensions)
+
+    # Pooled keep-alive sessions shared by all service instances
+    services.register('http_client', lambda: HTTPClient.from_config(app.config))
+
+    # Recently generated and served media kept in memory
+    services['media_cache'] = HotFileCache(
+        max_bytes=app.config['MEDIA_HOT_CACHE_BYTES'],
+        max_file_bytes=app.config['MEDIA_HOT_CACHE_MAX_FILE']
+    )
+
+    # Shared content-addressed cache for generated TTS audio
+    services.register('audio_cache', lambda: AudioCache(
+        app.config['AUDIO_DIR'],
+        max_files=app.config['AUDIO_CACHE_MAX_FILES'],
+        max_bytes=app.config['AUDIO_CACHE_MAX_BYTES'],
+        min_age=app.config['AUDIO_CACHE_MIN_AGE'],
+        hot_cache=services['media_cache'],
+        store=store_from_config(app.config, lambda: services['http_client'])
+    ))
+
+    # Persistent cache of rendered D-ID talks
+    services.register('talk_cache', lambda: TalkCache(
+        app.config['TALK_CACHE_PATH'],
+        ttl=app.config['TALK_CACHE_TTL'],
+        pending_ttl=app.config['TALK_CACHE_PENDING_TTL']
+    ))
+
+    # Status of submitted D-ID talks, updated by the webhook
+    services.register('job_tracker', lambda: JobTracker(
+        app.config['JOBS_DB_PATH'], retention=app.config['JOB_TRACKER_RETENTION']
+    ))
+
+    # Clips rendered ahead of time for common phrases
+    services.register('clip_library', lambda: ClipLibrary(app.config['CLIP_LIBRARY_DIR']))
+
+    # Admission control: bounded job queue and per-upstream limits
+    services['job_scheduler'] = JobScheduler(
+        workers=app.config['GENERATION_WORKERS'],
+        max_queued=app.config['GENERATION_QUEUE_SIZE']
+    )
+    # Durable queue shared with the worker processes (DURABLE_JOBS)
+    services.register('job_queue', lambda: JobQueue(
+        app.config['JOB_QUEUE_PATH'],
+        max_attempts=app.config['JOB_MAX_ATTEMPTS'],
+        retry_backoff=app.config['JOB_RETRY_BACKOFF'],
+        lease=app.config['JOB_LEASE_SECONDS'],
+        retention=app.config['JOB_RETENTION']
+    ))
+    services['upstream_limits'] = {
+        'elevenlabs': UpstreamLimiter(
+            'elevenlabs',
+            max_concurrent=app.config['ELEVENLABS_MAX_CONCURRENT'],
+            rate=app.config['ELEVENLABS_RATE_LIMIT'],
+            wait_timeout=app.config['UPSTREAM_WAIT_TIMEOUT']
+        ),
+        'did': UpstreamLimiter(
+            'did',
+            max_concurrent=app.config['DID_MAX_CONCURRENT'],
+            rate=app.config['DID_RATE_LIMIT'],
+            wait_timeout=app.config['UPSTREAM_WAIT_TIMEOUT']
+        ),
+    }
+
+    # Avatar/voice profiles selectable per request
+    services.register('profiles', lambda: ProfileRegistry.from_config(app.config))
+
+    # TTS segments synthesized from draft text ahead of /generate
+    services['speculative_audio'] = SpeculativeAudio(
+        ttl=app.config['SPECULATIVE_TTS_TTL'],
+        max_bytes=app.config['SPECULATIVE_TTS_MAX_BYTES'],
+        debounce=app.config['SPECULATIVE_TTS_DEBOUNCE']
+    )
+
     # Register routes
     register_routes(app)
     return app
 
 app = create_app()
-socketio = SocketIO(app, cors_allowed_origins=app.config['CORS_ORIGINS'])
+socketio = SocketIO(
+    app,
+    cors_allowed_origins=app.config['CORS_ORIGINS'],
+    async_mode=app.config['SOCKETIO_ASYNC_MODE'],
+    **socketio_options(app.config['SOCKETIO_MESSAGE_QUEUE'])
+)
+register_socket_events(socketio)
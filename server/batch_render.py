@@ -0,0 +1,203 @@
+"""
+Render a campaign of avatar clips from a manifest.
+
+The manifest is JSONL (one object per line) or CSV with a header row. Each
+item needs "text" and may set "id", "source_url", "voice_id" and
+"voice_config" (a JSON object; a JSON string in CSV files).
+
+    python batch_render.py campaign.jsonl --concurrency 8 --rate 2
+
+Progress is written to a state file after every step, so re-running the same
+command skips finished items and resumes submitted ones without creating
+new talks. Items whose talk failed on D-ID are submitted again, and videos
+left undownloaded get a fresh result_url first.
+"""
+import os
+import csv
+import json
+import time
+import logging
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, Any, List
+
+from create_speech import (
+    DID_SOURCE_URL,
+    ELEVENLABS_VOICE_CLIP_ID,
+    create_talk,
+    fetch_talk,
+    poll_talk_status,
+    download_video,
+    get_job_tracker,
+)
+from services.job_tracker import JobTracker
+from services.rate_limit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+
+def load_manifest(path: str) -> List[Dict[str, Any]]:
+    """Read manifest items from a .jsonl or .csv file."""
+    items = []
+    with open(path, newline="", encoding="utf-8") as f:
+        if path.endswith(".csv"):
+            rows = list(csv.DictReader(f))
+        else:
+            rows = [json.loads(line) for line in f if line.strip()]
+    for index, row in enumerate(rows):
+        if not row.get("text"):
+            raise ValueError(f"Manifest item {index} has no text")
+        voice_config = row.get("voice_config")
+        if isinstance(voice_config, str):
+            voice_config = json.loads(voice_config) if voice_config else None
+        items.append({
+            "id": str(row.get("id") or index),
+            "text": row["text"],
+            "source_url": row.get("source_url") or DID_SOURCE_URL,
+            "voice_id": row.get("voice_id") or ELEVENLABS_VOICE_CLIP_ID,
+            "voice_config": voice_config,
+        })
+    return items
+
+
+class BatchState:
+    """Per-item progress, persisted to a JSON file with an atomic rename on every change."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self.items: Dict[str, Dict[str, Any]] = {}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self.items = json.load(f)
+
+    def get(self, item_id: str) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self.items.get(item_id, {}))
+
+    def update(self, item_id: str, **fields: Any) -> None:
+        with self._lock:
+            self.items.setdefault(item_id, {}).update(fields)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self.items, f, indent=2)
+            os.replace(tmp_path, self.path)
+
+
+def render_item(item: Dict[str, Any], state: BatchState, tracker: JobTracker, bucket: TokenBucket) -> str:
+    """
+    Submit an item (unless it already has a live talk) and wait for D-ID to
+    finish it. A talk that failed on D-ID, or an item that failed in an
+    earlier run without a finished talk, is submitted again.
+    """
+    entry = state.get(item["id"])
+    talk_id = entry.get("talk_id")
+    if talk_id:
+        job = tracker.get(talk_id)
+        status = job["status"] if job else None
+        if status in ("error", "rejected") or (entry.get("status") == "failed" and status != "done"):
+            logger.info(f"Item {item['id']}: talk {talk_id} {status or 'failed'}, submitting again")
+            talk_id = None
+    if not talk_id:
+        bucket.acquire()
+        talk = create_talk(item["text"], item["source_url"], item["voice_id"], item["voice_config"])
+        talk_id = talk["talk_id"]
+        tracker.record_submitted(talk_id, talk["status"])
+        state.update(item["id"], status="submitted", talk_id=talk_id, submitted_at=time.time(), error=None)
+    result = poll_talk_status(talk_id, tracker)
+    state.update(item["id"], status="rendered", result_url=result.get("result_url"), rendered_at=time.time())
+    return item["id"]
+
+
+def download_item(item: Dict[str, Any], state: BatchState, out_dir: str,
+                  tracker: JobTracker = None) -> str:
+    """
+    Download an item's video. Given the tracker (for items left rendered by
+    an earlier run), first re-fetch the talk for a fresh result_url, as
+    D-ID's signed URLs expire.
+    """
+    entry = state.get(item["id"])
+    result_url = entry["result_url"]
+    if tracker is not None:
+        result_url = fetch_talk(entry["talk_id"], tracker).get("result_url") or result_url
+        state.update(item["id"], result_url=result_url)
+    path = download_video(result_url, out_dir, filename=f"{item['id']}.mp4")
+    state.update(item["id"], status="downloaded", path=path)
+    return path
+
+
+def run_batch(items: List[Dict[str, Any]], state: BatchState, out_dir: str,
+              concurrency: int, rate: float, download_workers: int) -> Dict[str, Any]:
+    tracker = get_job_tracker()
+    bucket = TokenBucket(rate, capacity=max(1, concurrency))
+    by_id = {item["id"]: item for item in items}
+    pending = [item for item in items if state.get(item["id"]).get("status") != "downloaded"]
+    skipped = len(items) - len(pending)
+    logger.info(f"{len(items)} items, {skipped} already done, {len(pending)} to render")
+
+    started = time.time()
+    failures = 0
+    downloads = []
+    with ThreadPoolExecutor(max_workers=concurrency) as render_pool, \
+            ThreadPoolExecutor(max_workers=download_workers) as download_pool:
+        renders = {}
+        for item in pending:
+            if state.get(item["id"]).get("status") == "rendered":
+                downloads.append(download_pool.submit(download_item, item, state, out_dir, tracker))
+            else:
+                renders[render_pool.submit(render_item, item, state, tracker, bucket)] = item["id"]
+        for future in as_completed(renders):
+            item_id = renders[future]
+            try:
+                future.result()
+                downloads.append(download_pool.submit(download_item, by_id[item_id], state, out_dir))
+            except Exception as e:
+                failures += 1
+                state.update(item_id, status="failed", error=str(e))
+                logger.error(f"Item {item_id} failed: {e}")
+        for future in as_completed(downloads):
+            try:
+                future.result()
+            except Exception as e:
+                failures += 1
+                logger.error(f"Download failed: {e}")
+
+    elapsed = time.time() - started
+    render_times = [
+        entry["rendered_at"] - entry["submitted_at"]
+        for item_id, entry in state.items.items()
+        if item_id in by_id and entry.get("rendered_at") and entry.get("submitted_at")
+        and entry["rendered_at"] >= started
+    ]
+    completed = len(pending) - failures
+    return {
+        "items": len(items),
+        "skipped": skipped,
+        "completed": completed,
+        "failures": failures,
+        "elapsed_seconds": round(elapsed, 1),
+        "jobs_per_minute": round(completed / elapsed * 60, 2) if elapsed else 0.0,
+        "mean_render_seconds": round(sum(render_times) / len(render_times), 1) if render_times else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render avatar clips from a JSONL or CSV manifest.")
+    parser.add_argument("manifest", help="Path to a .jsonl or .csv manifest")
+    parser.add_argument("--state", help="Progress file (default: <manifest>.state.json)")
+    parser.add_argument("--out", default="talks", help="Directory for downloaded videos")
+    parser.add_argument("--concurrency", type=int, default=4, help="Talks rendering at once")
+    parser.add_argument("--rate", type=float, default=1.0, help="Maximum talk submissions per second")
+    parser.add_argument("--download-workers", type=int, default=4, help="Parallel video downloads")
+    args = parser.parse_args()
+
+    items = load_manifest(args.manifest)
+    state = BatchState(args.state or f"{args.manifest}.state.json")
+    summary = run_batch(items, state, args.out, args.concurrency, args.rate, args.download_workers)
+    logger.info(f"Batch summary: {json.dumps(summary)}")
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
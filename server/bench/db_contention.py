@@ -0,0 +1,137 @@
+"""
+Shared-database contention benchmark for the Socket.IO async modes.
+
+Several processes (worker.py, other instances) share the SQLite files in
+DATA_DIR, so a write can wait up to its busy timeout for another process's
+lock. This starts the server once per async mode, then repeatedly holds the
+write lock on its jobs.db from this process for --hold seconds while
+clients POST D-ID webhooks (which write to jobs.db and wait for the lock)
+and probe /api/health/health (which touches no database).
+
+With threading, only the webhooks wait. With eventlet, a waiting sqlite3
+call blocks the whole hub, so the health probes stall for as long as the
+lock is held.
+
+    python -m bench.db_contention --hold 2 --rounds 3
+"""
+import os
+import json
+import time
+import uuid
+import sqlite3
+import argparse
+import tempfile
+import threading
+from typing import Dict, Any, List
+
+import requests
+
+from bench.harness import start_server, stop_server, summarize
+from bench.mock_upstreams import MockUpstreams
+from services.job_tracker import JobTracker
+
+
+def hold_lock(db_path: str, hold: float, rounds: int, gap: float) -> None:
+    """Take the database's write lock for hold seconds, rounds times, gap seconds apart."""
+    conn = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+    for _ in range(rounds):
+        time.sleep(gap)
+        conn.execute("BEGIN IMMEDIATE")
+        time.sleep(hold)
+        conn.execute("COMMIT")
+    conn.close()
+
+
+def run_mode(mode: str, args, upstream_url: str, workdir: str) -> Dict[str, Any]:
+    data_dir = os.path.join(workdir, "data")
+    jobs_db = os.path.join(data_dir, "jobs.db")
+    JobTracker(jobs_db)  # Create the table before the server and the lock holder open it
+    process = start_server(args.port, upstream_url, workdir,
+                           {"SOCKETIO_ASYNC_MODE": mode, "DATA_DIR": data_dir, "WARMUP": "false"})
+    base_url = f"http://127.0.0.1:{args.port}"
+    stop = threading.Event()
+    probes: List[float] = []
+    webhooks: List[float] = []
+    errors = {"probe": 0, "webhook": 0}
+    lock = threading.Lock()
+
+    def probe() -> None:
+        session = requests.Session()
+        while not stop.is_set():
+            started = time.perf_counter()
+            try:
+                ok = session.get(f"{base_url}/api/health/health", timeout=60).status_code == 200
+            except requests.RequestException:
+                ok = False
+            with lock:
+                if ok:
+                    probes.append(time.perf_counter() - started)
+                else:
+                    errors["probe"] += 1
+            time.sleep(args.probe_interval)
+
+    def webhook() -> None:
+        session = requests.Session()
+        while not stop.is_set():
+            talk_id = f"tlk_{uuid.uuid4().hex}"
+            started = time.perf_counter()
+            try:
+                ok = session.post(f"{base_url}/api/webhook", timeout=60, json={
+                    "id": talk_id, "status": "done", "result_url": f"https://example.com/{talk_id}.mp4"
+                }).status_code == 200
+            except requests.RequestException:
+                ok = False
+            with lock:
+                if ok:
+                    webhooks.append(time.perf_counter() - started)
+                else:
+                    errors["webhook"] += 1
+            time.sleep(args.webhook_interval)
+
+    clients = [threading.Thread(target=probe, daemon=True) for _ in range(args.probers)]
+    clients += [threading.Thread(target=webhook, daemon=True) for _ in range(args.webhook_senders)]
+    started = time.perf_counter()
+    try:
+        for client in clients:
+            client.start()
+        hold_lock(jobs_db, args.hold, args.rounds, args.gap)
+        time.sleep(args.gap)
+        stop.set()
+        for client in clients:
+            client.join()
+    finally:
+        stop_server(process)
+    elapsed = time.perf_counter() - started
+    probe_result = summarize(probes, errors["probe"], elapsed)
+    probe_result["max_ms"] = round(max(probes) * 1000) if probes else 0
+    return {"health": probe_result, "webhook": summarize(webhooks, errors["webhook"], elapsed)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the async modes while the shared jobs.db is locked.")
+    parser.add_argument("--modes", default="threading,eventlet")
+    parser.add_argument("--hold", type=float, default=2.0, help="Seconds the write lock is held each round")
+    parser.add_argument("--gap", type=float, default=1.0, help="Seconds between rounds")
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--probers", type=int, default=4)
+    parser.add_argument("--probe-interval", type=float, default=0.05)
+    parser.add_argument("--webhook-senders", type=int, default=2)
+    parser.add_argument("--webhook-interval", type=float, default=0.2)
+    parser.add_argument("--port", type=int, default=5130)
+    parser.add_argument("--upstream-port", type=int, default=8130)
+    args = parser.parse_args()
+
+    upstreams = MockUpstreams(args.upstream_port).start()
+    results = {}
+    try:
+        for mode in args.modes.split(","):
+            with tempfile.TemporaryDirectory() as workdir:
+                results[mode] = run_mode(mode, args, f"http://127.0.0.1:{args.upstream_port}", workdir)
+            print(f"{mode}: {json.dumps(results[mode])}", flush=True)
+    finally:
+        upstreams.shutdown()
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+"""
+End-to-end latency benchmark against the mock upstreams.
+
+Runs the server against bench.mock_upstreams and drives each scenario at
+every concurrency level:
+
+  fast_generate  POST /api/fast-generate, then wait for video_ready
+  generate       POST /api/generate, then wait for job_status "submitted"
+                 and video_ready for each of the job's talks
+  generate_drafted
+                 like generate, but the client first types the text as
+                 draft_text events and pauses before the request, so the
+                 server can synthesize it speculatively (SPECULATIVE_TTS)
+  serve_audio    GET /api/audio/<file>, alternating full and ranged requests
+
+For the generation scenarios "accept" is the HTTP response time and "e2e"
+runs from the request to the last video_ready event, which the mock's
+webhook triggers after --render-time. Peak server RSS and thread count are
+reported for each run. Save a baseline with --out and compare later runs
+against it. With --workers N, /api/generate jobs go through the durable
+queue (DURABLE_JOBS) and N worker.py processes run them.
+
+    python -m bench.e2e --concurrency 1,10,50 --requests 100 --out baseline.json
+"""
+import os
+import json
+import time
+import uuid
+import argparse
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional, Tuple
+
+import requests
+import socketio
+
+from bench.harness import Sampler, start_server, start_worker, stop_server, summarize
+from bench.mock_upstreams import MockUpstreams, SILENT_FRAME
+
+SCENARIOS = ("fast_generate", "generate", "generate_drafted", "serve_audio")
+TYPING_INTERVAL = 0.05  # Seconds between draft_text events, one per word
+THINK_TIME = 1.5  # Seconds between the last keystroke and the generate request
+
+
+class GenerationClient:
+    """One Socket.IO connection that starts a generation and waits for its videos."""
+
+    def __init__(self, base_url: str):
+        self.base_url = base_url
+        self.sio = socketio.Client(reconnection=False)
+        self.talks = set()
+        self.ready = set()
+        self.submitted = threading.Event()
+        self.failed = None
+        self._changed = threading.Condition()
+        self.sio.on("job_status", self._on_job_status)
+        self.sio.on("video_ready", self._on_video_ready)
+        self.sio.connect(base_url, transports=["polling"])
+
+    def _notify(self) -> None:
+        with self._changed:
+            self._changed.notify_all()
+
+    def _on_job_status(self, data: Dict[str, Any]) -> None:
+        if data.get("status") == "submitted":
+            self.talks.update(talk_ids(data["talk"]))
+            self.submitted.set()
+        elif data.get("status") == "error":
+            self.failed = data.get("error")
+        self._notify()
+
+    def _on_video_ready(self, data: Dict[str, Any]) -> None:
+        if data.get("status") == "done":
+            self.ready.add(data["id"])
+        else:
+            self.failed = data.get("status")
+        self._notify()
+
+    def wait(self, timeout: float) -> bool:
+        with self._changed:
+            return self._changed.wait_for(
+                lambda: self.failed or (self.submitted.is_set() and self.talks <= self.ready), timeout
+            ) and not self.failed
+
+    def close(self) -> None:
+        self.sio.disconnect()
+
+
+def talk_ids(talk_result: Dict[str, Any]) -> List[str]:
+    return [talk["talk_id"] for talk in talk_result.get("segments", [talk_result]) if talk.get("talk_id")]
+
+
+def type_drafts(client: GenerationClient, text: str) -> None:
+    """Send text word by word as draft_text events, then pause like a user about to click."""
+    words = text.split()
+    for count in range(1, len(words) + 1):
+        client.sio.emit("draft_text", {"text": " ".join(words[:count])})
+        time.sleep(TYPING_INTERVAL)
+    time.sleep(THINK_TIME)
+
+
+def run_generation(base_url: str, endpoint: str, text: str, timeout: float,
+                   drafted: Optional[bool] = False) -> Tuple[float, float]:
+    """Return (accept, e2e) seconds for one generation; raises on failure."""
+    client = GenerationClient(base_url)
+    try:
+        if drafted:
+            type_drafts(client, text)
+        started = time.perf_counter()
+        response = requests.post(f"{base_url}/api/{endpoint}",
+                                 json={"text": text, "socket_id": client.sio.get_sid()}, timeout=timeout)
+        accepted = time.perf_counter() - started
+        if response.status_code not in (200, 202):
+            raise RuntimeError(f"{endpoint} returned {response.status_code}")
+        if endpoint == "fast-generate":
+            client.talks.update(talk_ids(response.json()))
+            client.submitted.set()
+        if not client.wait(timeout):
+            raise RuntimeError(client.failed or "timed out waiting for video_ready")
+        return accepted, time.perf_counter() - started
+    finally:
+        client.close()
+
+
+def seed_audio(audio_dir: str, frames: int) -> str:
+    """Put a finished MP3 in the audio cache directory and return its filename."""
+    os.makedirs(audio_dir, exist_ok=True)
+    filename = f"{uuid.uuid4().hex}{uuid.uuid4().hex}.mp3"
+    with open(os.path.join(audio_dir, filename), "wb") as f:
+        f.write(SILENT_FRAME * frames)
+    return filename
+
+
+def run_scenario(name: str, base_url: str, total: int, concurrency: int,
+                 audio_filename: str, timeout: float) -> Dict[str, Any]:
+    tag = uuid.uuid4().hex[:6]
+    local = threading.local()
+
+    def one(index: int) -> Any:
+        try:
+            if name == "serve_audio":
+                session = getattr(local, "session", None)
+                if session is None:
+                    session = local.session = requests.Session()
+                headers = {"Range": "bytes=0-16383"} if index % 2 else {}
+                started = time.perf_counter()
+                response = session.get(f"{base_url}/api/audio/{audio_filename}", headers=headers, timeout=timeout)
+                if response.status_code not in (200, 206):
+                    raise RuntimeError(f"audio returned {response.status_code}")
+                return time.perf_counter() - started, None
+            endpoint = "fast-generate" if name == "fast_generate" else "generate"
+            text = f"Benchmark sentence {tag} number {index}. It has a second sentence too."
+            return run_generation(base_url, endpoint, text, timeout, drafted=name == "generate_drafted")
+        except Exception:
+            return None
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(one, range(total)))
+    elapsed = time.perf_counter() - started
+    ok = [r for r in results if r is not None]
+    errors = total - len(ok)
+    if name == "serve_audio":
+        return summarize([r[0] for r in ok], errors, elapsed)
+    return {
+        "accept": summarize([r[0] for r in ok], errors, elapsed),
+        "e2e": summarize([r[1] for r in ok], errors, elapsed),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end benchmark against mock ElevenLabs and D-ID.")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--concurrency", default="1,10,50", help="Comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=50, help="Requests per scenario and level")
+    parser.add_argument("--mode", default="threading", help="SOCKETIO_ASYNC_MODE for the server")
+    parser.add_argument("--tts-latency", type=float, default=0.5)
+    parser.add_argument("--did-latency", type=float, default=0.3)
+    parser.add_argument("--render-time", type=float, default=2.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--no-webhooks", action="store_true", help="Make the server fall back to polling")
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--port", type=int, default=5104)
+    parser.add_argument("--upstream-port", type=int, default=8104)
+    parser.add_argument("--out", help="Write the results to this JSON file")
+    parser.add_argument("--server-env", action="append", default=[], metavar="NAME=VALUE",
+                        help="Extra environment for the server, e.g. JOB_WEBHOOK_GRACE=5")
+    parser.add_argument("--workers", type=int, default=0,
+                        help="Run /api/generate jobs in this many worker.py processes")
+    args = parser.parse_args()
+
+    upstreams = MockUpstreams(args.upstream_port, args.tts_latency, args.did_latency, args.render_time,
+                              args.error_rate, webhooks=not args.no_webhooks).start()
+    base_url = f"http://127.0.0.1:{args.port}"
+    levels = [int(level) for level in args.concurrency.split(",")]
+    extra_env = dict(pair.split("=", 1) for pair in args.server_env)
+    extra_env["SOCKETIO_ASYNC_MODE"] = args.mode
+    if "generate_drafted" in args.scenarios:
+        extra_env.setdefault("SPECULATIVE_TTS", "true")
+    if args.workers:
+        extra_env["DURABLE_JOBS"] = "true"
+    results: Dict[str, Any] = {"config": vars(args), "runs": {}}
+
+    with tempfile.TemporaryDirectory() as workdir:
+        audio_filename = seed_audio(os.path.join(workdir, "audio"), frames=480)
+        process = start_server(args.port, f"http://127.0.0.1:{args.upstream_port}", workdir, extra_env)
+        worker = None
+        if args.workers:
+            worker = start_worker(args.port, f"http://127.0.0.1:{args.upstream_port}", workdir,
+                                  args.workers, extra_env)
+        try:
+            for name in args.scenarios.split(","):
+                for level in levels:
+                    sampler = Sampler(process.pid)
+                    sampler.start()
+                    run = run_scenario(name, base_url, args.requests, level, audio_filename, args.timeout)
+                    run["server"] = sampler.stop()
+                    results["runs"][f"{name}@{level}"] = run
+                    print(f"{name} @ {level}: {json.dumps(run)}", flush=True)
+        finally:
+            if worker is not None:
+                stop_server(worker)
+            stop_server(process)
+            upstreams.shutdown()
+    results["upstream_calls"] = upstreams.counts
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    print(json.dumps(results["upstream_calls"]))
+
+
+if __name__ == "__main__":
+    main()
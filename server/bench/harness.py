@@ -0,0 +1,133 @@
+"""Helpers shared by the benchmarks: starting the server, sampling it and summarizing latencies."""
+import os
+import sys
+import time
+import threading
+import subprocess
+from typing import Dict, Any, List, Optional
+
+import requests
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(latencies: List[float], errors: int, elapsed: float) -> Dict[str, Any]:
+    """Throughput and latency percentiles for a run; latencies are in seconds."""
+    ms = [latency * 1000 for latency in latencies]
+    return {
+        "ok": len(ms),
+        "errors": errors,
+        "elapsed_s": round(elapsed, 2),
+        "throughput_rps": round(len(ms) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(ms, 50)),
+        "p95_ms": round(percentile(ms, 95)),
+        "p99_ms": round(percentile(ms, 99)),
+    }
+
+
+def process_stats(pid: int) -> Dict[str, int]:
+    """Resident memory (KiB) and OS thread count of a process, read from /proc."""
+    stats = {"rss_kb": 0, "threads": 0}
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    stats["rss_kb"] = int(line.split()[1])
+                elif line.startswith("Threads:"):
+                    stats["threads"] = int(line.split()[1])
+    except FileNotFoundError:
+        pass
+    return stats
+
+
+class Sampler(threading.Thread):
+    """Records the peak RSS and thread count of a process while a run is going."""
+
+    def __init__(self, pid: int, interval: float = 0.1):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.interval = interval
+        self.idle = process_stats(pid)
+        self.peak = dict(self.idle)
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            for name, value in process_stats(self.pid).items():
+                self.peak[name] = max(self.peak[name], value)
+            self._stop_event.wait(self.interval)
+
+    def stop(self) -> Dict[str, Any]:
+        self._stop_event.set()
+        self.join()
+        return {
+            "idle_threads": self.idle["threads"],
+            "peak_threads": self.peak["threads"],
+            "idle_rss_mb": round(self.idle["rss_kb"] / 1024, 1),
+            "peak_rss_mb": round(self.peak["rss_kb"] / 1024, 1),
+        }
+
+
+def server_env(port: int, upstream_url: str, workdir: str,
+               extra_env: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+    """Environment pointing the server (or a worker) at the mock upstreams and workdir."""
+    env = dict(os.environ)
+    env.update({
+        "PORT": str(port),
+        "SOCKETIO_MESSAGE_QUEUE": "",
+        "SERVER_URL": f"http://127.0.0.1:{port}",
+        "ELEVENLABS_API_KEY": "bench",
+        "ELEVENLABS_API_URL": f"{upstream_url}/v1/text-to-speech",
+        "DID_API_KEY": "bench",
+        "DID_API_URL": f"{upstream_url}/talks",
+        "AUDIO_DIR": os.path.join(workdir, "audio"),
+        "DATA_DIR": os.path.join(workdir, "data"),
+    })
+    env.update(extra_env or {})
+    return env
+
+
+def start_server(port: int, upstream_url: str, workdir: str,
+                 extra_env: Optional[Dict[str, str]] = None) -> subprocess.Popen:
+    """Run run.py against the mock upstreams, with its audio and data in workdir."""
+    env = server_env(port, upstream_url, workdir, extra_env)
+    process = subprocess.Popen([sys.executable, "run.py"], cwd=SERVER_DIR, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    health_url = f"http://127.0.0.1:{port}/api/health/health"
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            if requests.get(health_url, timeout=1).status_code == 200:
+                return process
+        except requests.RequestException:
+            pass
+        if process.poll() is not None:
+            raise RuntimeError(f"Server exited with {process.returncode}")
+        time.sleep(0.2)
+    process.kill()
+    raise RuntimeError("Server did not start")
+
+
+def start_worker(port: int, upstream_url: str, workdir: str, processes: int,
+                 extra_env: Optional[Dict[str, str]] = None) -> subprocess.Popen:
+    """Run worker.py for the server started with the same port and workdir."""
+    env = server_env(port, upstream_url, workdir, extra_env)
+    return subprocess.Popen([sys.executable, "worker.py", "--processes", str(processes)], cwd=SERVER_DIR,
+                            env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def stop_server(process: subprocess.Popen) -> None:
+    process.terminate()
+    try:
+        process.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
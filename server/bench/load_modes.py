@@ -0,0 +1,80 @@
+"""
+Compare the server's Socket.IO async modes under concurrent load.
+
+Starts the mock upstreams, then runs the server once per async mode
+(eventlet with a monkey-patched standard library, and plain threading) and
+fires concurrent /api/fast-generate requests at it. Each request waits on a
+mocked D-ID submission, so the numbers show how many slow upstream calls one
+process can keep in flight and what that costs in OS threads and memory.
+
+    python -m bench.load_modes --requests 400 --concurrency 200 --did-latency 1.0
+"""
+import os
+import json
+import time
+import argparse
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any
+
+import requests
+
+from bench.harness import Sampler, start_server, stop_server, summarize
+from bench.mock_upstreams import MockUpstreams
+
+
+def run_load(port: int, total: int, concurrency: int, tag: str) -> Dict[str, Any]:
+    url = f"http://127.0.0.1:{port}/api/fast-generate"
+    local = threading.local()
+
+    def one(index: int) -> Any:
+        session = getattr(local, "session", None)
+        if session is None:
+            session = local.session = requests.Session()
+        started = time.perf_counter()
+        try:
+            response = session.post(url, json={"text": f"Benchmark request {tag} {index}."}, timeout=120)
+            ok = response.status_code == 200
+        except requests.RequestException:
+            ok = False
+        return time.perf_counter() - started, ok
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(one, range(total)))
+    latencies = [latency for latency, ok in results if ok]
+    return summarize(latencies, total - len(latencies), time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark eventlet vs threading async modes.")
+    parser.add_argument("--modes", default="eventlet,threading")
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--did-latency", type=float, default=1.0)
+    parser.add_argument("--port", type=int, default=5103)
+    parser.add_argument("--upstream-port", type=int, default=8103)
+    args = parser.parse_args()
+
+    upstreams = MockUpstreams(args.upstream_port, did_latency=args.did_latency).start()
+    upstream_url = f"http://127.0.0.1:{args.upstream_port}"
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        for mode in args.modes.split(","):
+            process = start_server(args.port, upstream_url, os.path.join(workdir, mode),
+                                   {"SOCKETIO_ASYNC_MODE": mode})
+            try:
+                sampler = Sampler(process.pid)
+                sampler.start()
+                result = run_load(args.port, args.requests, args.concurrency, mode)
+                result.update(sampler.stop())
+                results[mode] = result
+            finally:
+                stop_server(process)
+    upstreams.shutdown()
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+In-memory stand-in for an S3-compatible object store (like a local MinIO),
+for benchmarks.
+
+    python -m bench.mock_object_store --port 9100
+
+Point the server at it with
+    MEDIA_STORE=s3://media
+    MEDIA_STORE_ENDPOINT=http://127.0.0.1:9100
+    MEDIA_STORE_ACCESS_KEY=bench MEDIA_STORE_SECRET_KEY=bench-secret
+
+Objects are addressed path-style (/bucket/key) and kept in memory. Requests
+must carry an AWS Signature V4 Authorization header for the configured
+access key, but the signature itself is not checked.
+"""
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict
+
+
+class MockObjectStore(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, port: int, access_key: str = "bench"):
+        super().__init__(("127.0.0.1", port), ObjectStoreHandler)
+        self.access_key = access_key
+        self.objects: Dict[str, bytes] = {}
+        self.counts: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def count(self, name: str) -> None:
+        with self._lock:
+            self.counts[name] = self.counts.get(name, 0) + 1
+
+    def start(self) -> "MockObjectStore":
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+class ObjectStoreHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status: int, body: bytes = b"", content_type: str = "application/xml") -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    def _authorized(self) -> bool:
+        expected = f"AWS4-HMAC-SHA256 Credential={self.server.access_key}/"
+        if self.headers.get("Authorization", "").startswith(expected) and self.headers.get("x-amz-date"):
+            return True
+        self._send(403, b"<Error><Code>AccessDenied</Code></Error>")
+        return False
+
+    def do_PUT(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        if not self._authorized():
+            return
+        self.server.count("put")
+        with self.server._lock:
+            self.server.objects[self.path] = body
+        self._send(200)
+
+    def do_GET(self):
+        if not self._authorized():
+            return
+        self.server.count("get")
+        data = self.server.objects.get(self.path)
+        if data is None:
+            self._send(404, b"<Error><Code>NoSuchKey</Code></Error>")
+            return
+        self._send(200, data, "application/octet-stream")
+
+    def do_HEAD(self):
+        self.do_GET()
+
+    def do_DELETE(self):
+        if not self._authorized():
+            return
+        self.server.count("delete")
+        with self.server._lock:
+            self.server.objects.pop(self.path, None)
+        self._send(204)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mock S3-compatible object store.")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--access-key", default="bench")
+    args = parser.parse_args()
+    server = MockObjectStore(args.port, args.access_key)
+    print(f"Mock object store listening on http://127.0.0.1:{args.port}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
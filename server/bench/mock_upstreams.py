@@ -0,0 +1,225 @@
+"""
+Local stand-ins for the ElevenLabs and D-ID APIs, for benchmarks.
+
+    python -m bench.mock_upstreams --port 8100 --tts-latency 0.5 --did-latency 0.3 --render-time 2
+
+Point the server at it with
+    ELEVENLABS_API_URL=http://127.0.0.1:8100/v1/text-to-speech
+    DID_API_URL=http://127.0.0.1:8100/talks
+
+Like D-ID, the mock accepts audio uploads at /audios, fetches a script's
+audio_url before accepting a talk unless it points at an upload, and once
+the render time has passed it calls the talk's webhook with the finished
+record. A fraction of requests can be failed with --error-rate, and
+--handshake-latency delays each new connection like the DNS, TCP and TLS
+setup of the real APIs would.
+"""
+import json
+import time
+import uuid
+import random
+import argparse
+import threading
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Any, Iterator
+
+import requests
+
+# One silent MPEG-1 Layer III frame (128 kbps, 44.1 kHz): 417 bytes.
+SILENT_FRAME = b"\xff\xfb\x90\x64" + b"\x00" * 413
+
+
+class MockUpstreams(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, port: int, tts_latency: float = 0.5, did_latency: float = 0.3,
+                 render_time: float = 2.0, error_rate: float = 0.0, error_status: int = 503,
+                 webhooks: bool = True, fetch_audio: bool = True, audio_frames: int = 120,
+                 audio_uploads: bool = True, handshake_latency: float = 0.0):
+        super().__init__(("127.0.0.1", port), MockHandler)
+        self.tts_latency = tts_latency
+        self.did_latency = did_latency
+        self.render_time = render_time
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.webhooks = webhooks
+        self.fetch_audio = fetch_audio
+        self.audio_uploads = audio_uploads
+        self.handshake_latency = handshake_latency
+        self.uploads: Dict[str, int] = {}  # upload URL -> bytes received
+        self.audio = SILENT_FRAME * audio_frames
+        self.video = b"\x00" * 256 * 1024
+        self.talks: Dict[str, Dict[str, Any]] = {}
+        self.counts: Dict[str, int] = {}
+        self.in_flight: Dict[str, int] = {}
+        self.peak_in_flight: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def count(self, name: str) -> None:
+        with self._lock:
+            self.counts[name] = self.counts.get(name, 0) + 1
+
+    @contextmanager
+    def busy(self, name: str) -> Iterator[None]:
+        """Track how many requests to an endpoint are being handled at once."""
+        with self._lock:
+            self.in_flight[name] = self.in_flight.get(name, 0) + 1
+            self.peak_in_flight[name] = max(self.peak_in_flight.get(name, 0), self.in_flight[name])
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.in_flight[name] -= 1
+
+    def should_fail(self) -> bool:
+        return self.error_rate > 0 and random.random() < self.error_rate
+
+    def start(self) -> "MockUpstreams":
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def talk_record(self, talk: Dict[str, Any]) -> Dict[str, Any]:
+        done = time.time() >= talk["ready_at"]
+        record = {"id": talk["id"], "status": "done" if done else "started"}
+        if done:
+            record["result_url"] = f"http://127.0.0.1:{self.server_port}/videos/{talk['id']}.mp4"
+        return record
+
+    def _deliver_webhook(self, talk: Dict[str, Any]) -> None:
+        try:
+            requests.post(talk["webhook"], json=self.talk_record(talk), timeout=10)
+            self.count("webhook")
+        except requests.RequestException:
+            self.count("webhook_failed")
+
+    def schedule_webhook(self, talk: Dict[str, Any]) -> None:
+        if self.webhooks and talk.get("webhook"):
+            timer = threading.Timer(max(0.0, talk["ready_at"] - time.time()), self._deliver_webhook, (talk,))
+            timer.daemon = True
+            timer.start()
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def setup(self):
+        super().setup()
+        if self.server.handshake_latency:
+            self.server.count("connections")
+            time.sleep(self.server.handshake_latency)
+
+    def _send(self, status: int, body: bytes, content_type: str = "application/json") -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, status: int, data: Dict[str, Any]) -> None:
+        self._send(status, json.dumps(data).encode("utf-8"))
+
+    def _read_body(self) -> bytes:
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length)
+
+    def do_POST(self):
+        server = self.server
+        body = self._read_body()
+        if self.path.rstrip("/") == "/audios":
+            server.count("audios")
+            if not server.audio_uploads or not self.headers.get("Content-Type", "").startswith("multipart/form-data"):
+                self._send_json(404 if not server.audio_uploads else 400, {"kind": "UploadError"})
+                return
+            with server.busy("audios"):
+                time.sleep(server.did_latency)
+            url = f"s3://mock-audios/{uuid.uuid4().hex[:12]}/audio.mp3"
+            server.uploads[url] = len(body)
+            self._send_json(201, {"url": url})
+            return
+        payload = json.loads(body or b"{}") if self.headers.get("Content-Type", "").startswith("application/json") else {}
+        if self.path.startswith("/v1/text-to-speech/"):
+            server.count("tts")
+            with server.busy("tts"):
+                time.sleep(server.tts_latency)
+            if server.should_fail():
+                server.count("tts_error")
+                self._send_json(server.error_status, {"detail": "mock failure"})
+                return
+            self._send(200, server.audio, "audio/mpeg")
+        elif self.path.rstrip("/") == "/talks":
+            server.count("talks")
+            with server.busy("talks"):
+                time.sleep(server.did_latency)
+            if server.should_fail():
+                server.count("talks_error")
+                self._send_json(server.error_status, {"kind": "MockFailure"})
+                return
+            audio_url = (payload.get("script") or {}).get("audio_url")
+            if audio_url and audio_url.startswith("s3://"):
+                if audio_url not in server.uploads:
+                    self._send_json(400, {"kind": "ValidationError", "description": "unknown audio upload"})
+                    return
+            elif audio_url and server.fetch_audio:
+                try:
+                    ok = requests.get(audio_url, timeout=10).status_code == 200
+                except requests.RequestException:
+                    ok = False
+                if not ok:
+                    server.count("audio_fetch_failed")
+                    self._send_json(400, {"kind": "ValidationError",
+                                          "description": "audio_url could not be fetched"})
+                    return
+            talk_id = f"tlk_{uuid.uuid4().hex[:12]}"
+            talk = {"id": talk_id, "ready_at": time.time() + server.render_time,
+                    "webhook": payload.get("webhook")}
+            server.talks[talk_id] = talk
+            server.schedule_webhook(talk)
+            self._send_json(201, {"id": talk_id, "status": "created"})
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def do_HEAD(self):
+        self.send_response(405)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_GET(self):
+        server = self.server
+        if self.path.startswith("/talks/"):
+            server.count("poll")
+            talk = server.talks.get(self.path.rsplit("/", 1)[1])
+            if talk is None:
+                self._send_json(404, {"error": "not found"})
+                return
+            self._send_json(200, server.talk_record(talk))
+        elif self.path.startswith("/videos/"):
+            self._send(200, server.video, "video/mp4")
+        else:
+            self._send_json(404, {"error": "not found"})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mock ElevenLabs and D-ID endpoints.")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--tts-latency", type=float, default=0.5, help="Seconds per TTS request")
+    parser.add_argument("--did-latency", type=float, default=0.3, help="Seconds per talk submission")
+    parser.add_argument("--render-time", type=float, default=2.0, help="Seconds until a talk is done")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests to fail")
+    parser.add_argument("--error-status", type=int, default=503)
+    parser.add_argument("--no-webhooks", action="store_true", help="Never call webhooks (forces polling)")
+    parser.add_argument("--handshake-latency", type=float, default=0.0, help="Seconds per new connection")
+    args = parser.parse_args()
+    server = MockUpstreams(args.port, args.tts_latency, args.did_latency, args.render_time,
+                           args.error_rate, args.error_status, webhooks=not args.no_webhooks,
+                           handshake_latency=args.handshake_latency)
+    print(f"Mock upstreams listening on http://127.0.0.1:{args.port}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
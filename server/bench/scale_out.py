@@ -0,0 +1,245 @@
+"""
+Scale-out benchmark: several server instances behind a load balancer.
+
+Starts the mock upstreams, the mock object store, --instances copies of
+run.py (each with its own AUDIO_DIR, as on separate machines) and a local
+round-robin load balancer in front of them. SERVER_URL points at the
+balancer, so D-ID's webhooks and the audio URLs given to clients land on
+any instance. Each client keeps its Socket.IO connection on one instance,
+like sticky sessions would, and:
+
+  1. POSTs /api/generate through the balancer and subscribes to the job
+  2. on "audio_ready", GETs the audio URL through the balancer
+  3. on "submitted", subscribes to the job's talks and waits for video_ready
+
+Variants:
+
+  isolated     every instance keeps its own data, audio and Socket.IO events
+  shared_dir   shared DATA_DIR, MEDIA_STORE=file:// and a sqlite:///
+               SOCKETIO_MESSAGE_QUEUE
+  shared_s3    the same with MEDIA_STORE=s3:// on the mock object store
+
+For each variant it reports generations that got all their video_ready
+events, audio fetches that failed, end-to-end latency and how the balancer
+spread the requests.
+
+    python -m bench.scale_out --instances 3 --requests 30 --concurrency 6
+"""
+import os
+import json
+import time
+import uuid
+import argparse
+import tempfile
+import itertools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Any, List, Tuple
+
+import requests
+
+from bench.e2e import GenerationClient, talk_ids
+from bench.harness import start_server, stop_server, summarize
+from bench.mock_upstreams import MockUpstreams
+from bench.mock_object_store import MockObjectStore
+
+VARIANTS = ("isolated", "shared_dir", "shared_s3")
+HOP_BY_HOP = {"connection", "keep-alive", "transfer-encoding", "content-length", "content-encoding"}
+
+
+class LoadBalancer(ThreadingHTTPServer):
+    """Round-robin HTTP reverse proxy over the backends."""
+
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, port: int, backends: List[str]):
+        super().__init__(("127.0.0.1", port), ProxyHandler)
+        self.backends = backends
+        self.counts = {backend: 0 for backend in backends}
+        self._next = itertools.cycle(backends)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def pick(self) -> str:
+        with self._lock:
+            backend = next(self._next)
+            self.counts[backend] += 1
+            return backend
+
+    def session(self) -> requests.Session:
+        if not hasattr(self._local, "session"):
+            self._local.session = requests.Session()
+        return self._local.session
+
+    def start(self) -> "LoadBalancer":
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+class ProxyHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _proxy(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0)) or None
+        headers = {name: value for name, value in self.headers.items() if name.lower() not in HOP_BY_HOP}
+        try:
+            response = self.server.session().request(self.command, self.server.pick() + self.path,
+                                                     headers=headers, data=body, timeout=60)
+            status, content = response.status_code, response.content
+            response_headers = [(name, value) for name, value in response.headers.items()
+                                if name.lower() not in HOP_BY_HOP]
+        except requests.RequestException:
+            status, content, response_headers = 502, b"", []
+        self.send_response(status)
+        for name, value in response_headers:
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(content)
+
+    do_GET = do_POST = do_HEAD = do_OPTIONS = _proxy
+
+
+class ScaleOutClient(GenerationClient):
+    """A GenerationClient that subscribes to its job and talks itself, as it may sit on another instance."""
+
+    def __init__(self, base_url: str):
+        self.audio_url = None
+        super().__init__(base_url)
+
+    def _on_job_status(self, data: Dict[str, Any]) -> None:
+        if data.get("status") == "audio_ready":
+            self.audio_url = data.get("audio_url")
+        elif data.get("status") == "submitted":
+            for talk_id in talk_ids(data["talk"]):
+                self.sio.emit("subscribe", {"talk_id": talk_id})
+        super()._on_job_status(data)
+
+
+def run_generation(lb_url: str, instance_url: str, text: str, timeout: float) -> Tuple[float, bool]:
+    """Return (e2e seconds, whether the audio URL was served); raises if video_ready never came."""
+    client = ScaleOutClient(instance_url)
+    try:
+        started = time.perf_counter()
+        response = requests.post(f"{lb_url}/api/generate",
+                                 json={"text": text, "socket_id": client.sio.get_sid()}, timeout=timeout)
+        if response.status_code != 202:
+            raise RuntimeError(f"generate returned {response.status_code}")
+        client.sio.emit("subscribe", {"job_id": response.json()["job_id"]})
+        done = client.wait(timeout)
+        elapsed = time.perf_counter() - started
+        audio_ok = client.audio_url is not None and requests.get(client.audio_url, timeout=timeout).status_code == 200
+        if not done:
+            raise RuntimeError(client.failed or "timed out waiting for video_ready")
+        return elapsed, audio_ok
+    finally:
+        client.close()
+
+
+def variant_env(name: str, shared_dir: str, store_url: str) -> Dict[str, str]:
+    if name == "isolated":
+        return {}
+    env = {
+        "DATA_DIR": os.path.join(shared_dir, "data"),
+        "SOCKETIO_MESSAGE_QUEUE": f"sqlite:///{os.path.join(shared_dir, 'socketio.db')}",
+    }
+    if name == "shared_dir":
+        env["MEDIA_STORE"] = f"file://{os.path.join(shared_dir, 'media')}"
+    else:
+        env.update({
+            "MEDIA_STORE": "s3://media/audio",
+            "MEDIA_STORE_ENDPOINT": store_url,
+            "MEDIA_STORE_ACCESS_KEY": "bench",
+            "MEDIA_STORE_SECRET_KEY": "bench-secret",
+        })
+    return env
+
+
+def run_variant(name: str, args, upstream_url: str, store_url: str) -> Dict[str, Any]:
+    lb_url = f"http://127.0.0.1:{args.port}"
+    instance_ports = [args.port + 1 + index for index in range(args.instances)]
+    instance_urls = [f"http://127.0.0.1:{port}" for port in instance_ports]
+    with tempfile.TemporaryDirectory() as workdir:
+        env = {"SERVER_URL": lb_url, "WARMUP": "false",
+               **variant_env(name, os.path.join(workdir, "shared"), store_url)}
+        servers = [start_server(port, upstream_url, os.path.join(workdir, f"instance{port}"), env)
+                   for port in instance_ports]
+        balancer = LoadBalancer(args.port, instance_urls).start()
+        tag = uuid.uuid4().hex[:6]
+        latencies: List[float] = []
+        errors = audio_failures = 0
+        lock = threading.Lock()
+
+        def one(index: int) -> None:
+            nonlocal errors, audio_failures
+            text = f"Scale-out check {tag} number {index}."
+            try:
+                elapsed, audio_ok = run_generation(lb_url, instance_urls[index % len(instance_urls)],
+                                                   text, args.timeout)
+            except Exception:
+                with lock:
+                    errors += 1
+                return
+            with lock:
+                latencies.append(elapsed)
+                audio_failures += not audio_ok
+
+        started = time.perf_counter()
+        try:
+            with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+                list(pool.map(one, range(args.requests)))
+        finally:
+            elapsed = time.perf_counter() - started
+            balancer.shutdown()
+            balancer.server_close()
+            for server in servers:
+                stop_server(server)
+    result = summarize(latencies, errors, elapsed)
+    result["audio_failures"] = audio_failures
+    result["balanced"] = list(balancer.counts.values())
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Scale-out benchmark behind a local load balancer.")
+    parser.add_argument("--instances", type=int, default=3)
+    parser.add_argument("--requests", type=int, default=30)
+    parser.add_argument("--concurrency", type=int, default=6)
+    parser.add_argument("--variants", default=",".join(VARIANTS))
+    parser.add_argument("--timeout", type=float, default=15)
+    parser.add_argument("--tts-latency", type=float, default=0.5)
+    parser.add_argument("--did-latency", type=float, default=0.3)
+    parser.add_argument("--render-time", type=float, default=2.0)
+    parser.add_argument("--port", type=int, default=5120, help="Balancer port; instances use the next ones")
+    parser.add_argument("--upstream-port", type=int, default=8120)
+    parser.add_argument("--store-port", type=int, default=9120)
+    parser.add_argument("--out", help="Write the results to this JSON file")
+    args = parser.parse_args()
+
+    upstreams = MockUpstreams(args.upstream_port, tts_latency=args.tts_latency, did_latency=args.did_latency,
+                              render_time=args.render_time).start()
+    store = MockObjectStore(args.store_port).start()
+    results: Dict[str, Any] = {"config": vars(args), "runs": {}}
+    try:
+        for name in args.variants.split(","):
+            results["runs"][name] = run_variant(name, args, f"http://127.0.0.1:{args.upstream_port}",
+                                                f"http://127.0.0.1:{args.store_port}")
+            print(f"{name}: {json.dumps(results['runs'][name])}", flush=True)
+    finally:
+        upstreams.shutdown()
+        store.shutdown()
+    print(json.dumps({"upstreams": upstreams.counts, "object_store": store.counts}))
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
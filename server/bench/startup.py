@@ -0,0 +1,119 @@
+"""
+Cold-start benchmark: from starting run.py to the first served requests.
+
+Starts the mock upstreams (with --handshake-latency standing in for the
+DNS, TCP and TLS setup of a new connection to ElevenLabs or D-ID), then for
+each variant and trial starts a fresh server on an empty workdir and
+measures
+
+  ready_ms       process start -> first 200 from /api/health/health
+  first_ms       latency of the first /api/fast-generate
+  second_ms      latency of the next one, for comparison
+  total_ms       process start -> first /api/fast-generate answered
+
+The first request is sent --idle seconds after the health check passes,
+like a platform that routes traffic only once the instance is healthy.
+Medians over the trials are reported.
+
+    python -m bench.startup --trials 5 --handshake-latency 0.15
+"""
+import sys
+import json
+import time
+import argparse
+import statistics
+import tempfile
+import subprocess
+from typing import Dict, Any, List
+
+import requests
+
+from bench.harness import server_env, stop_server, SERVER_DIR
+from bench.mock_upstreams import MockUpstreams
+
+VARIANTS = {
+    "no_warmup": {"WARMUP": "false"},
+    "warmup": {"WARMUP": "true"},
+}
+
+
+def run_trial(port: int, upstream_url: str, env: Dict[str, str], idle: float, tag: str) -> Dict[str, float]:
+    base_url = f"http://127.0.0.1:{port}"
+    with tempfile.TemporaryDirectory() as workdir:
+        started = time.perf_counter()
+        process = subprocess.Popen([sys.executable, "run.py"], cwd=SERVER_DIR,
+                                   env=server_env(port, upstream_url, workdir, env),
+                                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            while True:
+                try:
+                    if requests.get(f"{base_url}/api/health/health", timeout=1).status_code == 200:
+                        break
+                except requests.RequestException:
+                    pass
+                if process.poll() is not None or time.perf_counter() - started > 30:
+                    raise RuntimeError("Server did not start")
+                time.sleep(0.005)
+            ready = time.perf_counter()
+            time.sleep(idle)
+
+            latencies = []
+            for index in range(2):
+                sent = time.perf_counter()
+                response = requests.post(f"{base_url}/api/fast-generate",
+                                         json={"text": f"Startup check {tag} {index}."}, timeout=60)
+                response.raise_for_status()
+                latencies.append(time.perf_counter() - sent)
+                if index == 0:
+                    first_done = time.perf_counter()
+        finally:
+            stop_server(process)
+    return {
+        "ready_ms": (ready - started) * 1000,
+        "first_ms": latencies[0] * 1000,
+        "second_ms": latencies[1] * 1000,
+        "total_ms": (first_done - started) * 1000,
+    }
+
+
+def summarize_trials(trials: List[Dict[str, float]]) -> Dict[str, Any]:
+    return {name: round(statistics.median(trial[name] for trial in trials)) for name in trials[0]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold-start benchmark of the server.")
+    parser.add_argument("--trials", type=int, default=5)
+    parser.add_argument("--variants", default=",".join(VARIANTS))
+    parser.add_argument("--idle", type=float, default=0.5,
+                        help="Seconds between the health check passing and the first request")
+    parser.add_argument("--handshake-latency", type=float, default=0.15,
+                        help="Seconds the mock takes to accept each new connection")
+    parser.add_argument("--did-latency", type=float, default=0.05)
+    parser.add_argument("--port", type=int, default=5105)
+    parser.add_argument("--upstream-port", type=int, default=8105)
+    parser.add_argument("--out", help="Write the results to this JSON file")
+    args = parser.parse_args()
+
+    upstreams = MockUpstreams(args.upstream_port, did_latency=args.did_latency,
+                              handshake_latency=args.handshake_latency).start()
+    upstream_url = f"http://127.0.0.1:{args.upstream_port}"
+    results: Dict[str, Any] = {"config": vars(args), "runs": {}}
+    try:
+        for name in args.variants.split(","):
+            trials = [
+                run_trial(args.port, upstream_url, VARIANTS[name], args.idle, f"{name}-{trial}")
+                for trial in range(args.trials)
+            ]
+            results["runs"][name] = summarize_trials(trials)
+            print(f"{name}: {json.dumps(results['runs'][name])}", flush=True)
+    finally:
+        upstreams.shutdown()
+    print(json.dumps(upstreams.counts))
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
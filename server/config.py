@@ -21,22 +21,151 @@ class Config:
     # Server settings
     # NGROK_URL = "https://f9ee-94-205-217-109.ngrok-free.app"
     # SERVER_URL = 'http://localhost:5003'
-    SERVER_URL = 'https://avatar-tts.onrender.com'
+    SERVER_URL = os.environ.get('SERVER_URL') or 'https://avatar-tts.onrender.com'
+    PORT = int(os.environ.get('PORT', 5003))
+
+    # Socket.IO async mode. 'threading' runs each request on an OS thread.
+    # With 'eventlet', run.py monkey patches the standard library so requests
+    # waiting on ElevenLabs or D-ID are green threads, but sqlite3 calls are
+    # not patched: a write waiting for another process's lock on DATA_DIR
+    # stalls every request (see bench/db_contention.py), and under load it
+    # also measured slower (bench/load_modes.py). Threading stays the default.
+    SOCKETIO_ASYNC_MODE = os.environ.get('SOCKETIO_ASYNC_MODE') or 'threading'
+
+    # Socket.IO message queue shared by several server processes, e.g.
+    # redis://localhost:6379/0, or sqlite:///shared/socketio.db for
+    # instances on one host. None keeps events inside this process.
+    SOCKETIO_MESSAGE_QUEUE = os.environ.get('SOCKETIO_MESSAGE_QUEUE')
+
+    # Logging. Records go through a queue to a background writer, so log
+    # I/O never blocks a request. LOG_FORMAT is json (one object per line,
+    # with job_id/talk_id fields) or text. LOG_SAMPLING keeps a fraction of
+    # the records below WARNING of noisy loggers, e.g. "routes.api.webhook=0.1".
+    LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+    LOG_FORMAT = os.environ.get('LOG_FORMAT', 'json').lower()
+    LOG_SAMPLING = os.environ.get('LOG_SAMPLING', '')
+    LOG_QUEUE_SIZE = int(os.environ.get('LOG_QUEUE_SIZE', 10000))  # Records dropped beyond this
+
+    # Build the caches and services and open connections to ElevenLabs and
+    # D-ID in the background as soon as the server is listening, instead of
+    # on the first request after a cold start.
+    WARMUP = os.environ.get('WARMUP', 'true').lower() == 'true'
 
     # BASE_DIR: set to the server folder
     BASE_DIR = os.path.abspath(os.path.dirname(__file__))
 
     # Audio settings
-    AUDIO_DIR = os.path.join(BASE_DIR, 'audio')
-    os.makedirs(AUDIO_DIR, exist_ok=True)
+    AUDIO_DIR = os.environ.get('AUDIO_DIR') or os.path.join(BASE_DIR, 'audio')
+    AUDIO_CACHE_MAX_FILES = int(os.environ.get('AUDIO_CACHE_MAX_FILES', 200))
+    AUDIO_CACHE_MAX_BYTES = int(os.environ.get('AUDIO_CACHE_MAX_BYTES', 200 * 1024 * 1024))
+    AUDIO_CACHE_MIN_AGE = 300  # Seconds a new file is kept so D-ID can fetch it
+    # Shared store of generated audio, so any instance can serve any file:
+    # file:///shared/dir or s3://bucket/prefix (S3, MinIO, ...). Empty keeps
+    # audio on this instance's AUDIO_DIR only.
+    MEDIA_STORE = os.environ.get('MEDIA_STORE', '')
+    MEDIA_STORE_ENDPOINT = os.environ.get('MEDIA_STORE_ENDPOINT')  # e.g. http://minio:9000; default AWS
+    MEDIA_STORE_REGION = os.environ.get('MEDIA_STORE_REGION', 'us-east-1')
+    MEDIA_STORE_ACCESS_KEY = os.environ.get('MEDIA_STORE_ACCESS_KEY')
+    MEDIA_STORE_SECRET_KEY = os.environ.get('MEDIA_STORE_SECRET_KEY')
+    # Long scripts are synthesized in parts and joined at MP3 frame
+    # boundaries, without re-encoding; this much silence goes between parts.
+    AUDIO_SEGMENT_GAP_MS = float(os.environ.get('AUDIO_SEGMENT_GAP_MS', 0))
+    # Tag joined audio with its ReplayGain (needs ffmpeg to decode it)
+    AUDIO_REPLAYGAIN = os.environ.get('AUDIO_REPLAYGAIN', 'false').lower() == 'true'
+    FFMPEG_PATH = os.environ.get('FFMPEG_PATH', 'ffmpeg')
+
+    # In-memory copies of recently generated or served media files
+    MEDIA_HOT_CACHE_BYTES = int(os.environ.get('MEDIA_HOT_CACHE_BYTES', 64 * 1024 * 1024))
+    MEDIA_HOT_CACHE_MAX_FILE = int(os.environ.get('MEDIA_HOT_CACHE_MAX_FILE', 8 * 1024 * 1024))
+
+    # Upstream HTTP settings (shared keep-alive pools per host)
+    HTTP_POOL_SIZE = int(os.environ.get('HTTP_POOL_SIZE', 10))
+    HTTP_CONNECT_TIMEOUT = 5  # Seconds
+    HTTP_READ_TIMEOUT = 60  # Seconds; long scripts take a while to synthesize
+    HTTP_RETRIES = 3
+    HTTP_RETRY_BACKOFF = 0.5  # Seconds, doubled on each retry
+    HTTP_RETRY_STATUSES = [429, 500, 502, 503, 504]
+
+    # Admission control. /api/generate jobs wait in a bounded queue for one of
+    # GENERATION_WORKERS; a full queue is answered with 429 and Retry-After.
+    # Each upstream is held to a concurrency cap and a request rate; set them
+    # just under the account's plan limits. Rates must be above zero.
+    GENERATION_WORKERS = int(os.environ.get('GENERATION_WORKERS', 8))
+    GENERATION_QUEUE_SIZE = int(os.environ.get('GENERATION_QUEUE_SIZE', 100))
+    ELEVENLABS_MAX_CONCURRENT = int(os.environ.get('ELEVENLABS_MAX_CONCURRENT', 4))
+    ELEVENLABS_RATE_LIMIT = float(os.environ.get('ELEVENLABS_RATE_LIMIT', 5))  # requests per second
+    DID_MAX_CONCURRENT = int(os.environ.get('DID_MAX_CONCURRENT', 8))
+    DID_RATE_LIMIT = float(os.environ.get('DID_RATE_LIMIT', 4))  # requests per second, polls included
+    UPSTREAM_WAIT_TIMEOUT = float(os.environ.get('UPSTREAM_WAIT_TIMEOUT', 30))  # Seconds to wait for a slot
+
+    # Local state (talk result cache and job tracker)
+    DATA_DIR = os.environ.get('DATA_DIR') or os.path.join(BASE_DIR, 'data')
+    TALK_CACHE_PATH = os.path.join(DATA_DIR, 'talks.db')
+    TALK_CACHE_TTL = 12 * 3600  # D-ID result URLs are signed and expire
+    TALK_CACHE_PENDING_TTL = 600  # Seconds before a talk without a webhook is resubmitted
+    JOBS_DB_PATH = os.path.join(DATA_DIR, 'jobs.db')
+    JOB_WEBHOOK_GRACE = 60  # Seconds to wait for the webhook before polling D-ID
+    JOB_POLL_TIMEOUT = 600  # Seconds before a talk is given up on
+    JOB_POLL_MAX_INTERVAL = 30  # Upper bound on the backoff between polls
+    JOB_TRACKER_RETENTION = 7 * 24 * 3600  # Seconds a tracked talk is kept after its last update
+
+    # Durable generation jobs. With DURABLE_JOBS on, /api/generate only adds
+    # the job to a SQLite queue and worker.py runs it in separate processes,
+    # so queued and in-flight jobs survive a restart or redeploy of the web
+    # process and the two tiers are scaled independently.
+    DURABLE_JOBS = os.environ.get('DURABLE_JOBS', 'false').lower() == 'true'
+    JOB_QUEUE_PATH = os.path.join(DATA_DIR, 'queue.db')
+    JOB_MAX_ATTEMPTS = int(os.environ.get('JOB_MAX_ATTEMPTS', 3))  # Then the job is dead-lettered
+    JOB_RETRY_BACKOFF = 2  # Seconds before the first retry, doubled on each one
+    JOB_LEASE_SECONDS = 300  # A job whose worker went silent this long is run again
+    JOB_RETENTION = 24 * 3600  # Seconds finished jobs (and their idempotency keys) are kept
+    JOB_EVENT_POLL_INTERVAL = 0.1  # Seconds between checks for worker events to relay
+    WORKER_PROCESSES = int(os.environ.get('WORKER_PROCESSES', 2))
+    WORKER_THREADS = int(os.environ.get('WORKER_THREADS', 4))  # Jobs each worker process runs at once
+    WORKER_POLL_INTERVAL = 0.2  # Seconds an idle worker thread waits before checking the queue again
+
+    # Speculative TTS: clients stream draft text over Socket.IO (draft_text) and
+    # finished sentences are synthesized before /api/generate is called. Each
+    # draft sentence costs ElevenLabs characters even if it is never used.
+    SPECULATIVE_TTS = os.environ.get('SPECULATIVE_TTS', 'false').lower() == 'true'
+    SPECULATIVE_TTS_DEBOUNCE = 0.6  # Seconds without a newer draft before acting on one
+    SPECULATIVE_TTS_TTL = 300  # Seconds a drafted sentence is kept
+    SPECULATIVE_TTS_MAX_BYTES = 32 * 1024 * 1024
+    SPECULATIVE_TTS_MAX_CHARS = 2000  # Longer drafts are ignored
+    SPECULATIVE_TTS_WAIT = 10  # Seconds /generate waits for a sentence still being drafted
+
+    # Avatar/voice profiles that requests select by name; see services/profiles.py.
+    # Profiles fall back to the ElevenLabs and D-ID defaults below.
+    PROFILES_PATH = os.environ.get('PROFILES_PATH') or os.path.join(BASE_DIR, 'profiles.json')
+
+    # Pre-rendered clips for common phrases, built by precompute_clips.py
+    CLIP_LIBRARY_DIR = os.environ.get('CLIP_LIBRARY_DIR') or os.path.join(DATA_DIR, 'clips')
+    CLIP_PHRASES_PATH = os.environ.get('CLIP_PHRASES_PATH') or os.path.join(BASE_DIR, 'clip_phrases.txt')
 
     # ElevenLabs settings
     ELEVENLABS_API_KEY = os.environ.get("ELEVENLABS_API_KEY")
-    ELEVENLABS_VOICE_ID = "XrExE9yKIg1WjnnlVkGX"
+    ELEVENLABS_API_URL = os.environ.get("ELEVENLABS_API_URL") or "https://api.elevenlabs.io/v1/text-to-speech"
+    ELEVENLABS_VOICE_ID = "XrExE9yKIg1WjnnlVkGX"  # Default profile voice
     ELEVENLABS_MAX_CHARS = 350  # Maximum characters per request (approximately 30 seconds of audio)
+    TTS_MAX_WORKERS = 4  # Concurrent ElevenLabs requests when a long script is split into chunks
+    ELEVENLABS_MODEL_ID = "eleven_multilingual_v2"
+    ELEVENLABS_OUTPUT_FORMAT = "mp3_44100_128"
+    # Stream audio to disk and listeners as it arrives instead of buffering it
+    ELEVENLABS_STREAMING = os.environ.get('ELEVENLABS_STREAMING', 'false').lower() == 'true'
+    ELEVENLABS_VOICE_SETTINGS = {
+        "stability": 0.8,
+        "similarity_boost": 0.75,
+        "style": 0.0,
+        "use_speaker_boost": True,
+        "speed": 0.8
+    }
 
     # D-ID settings
     DID_API_KEY = os.environ.get("DID_API_KEY")
-    DID_API_URL = "https://api.d-id.com/talks"
+    DID_API_URL = os.environ.get("DID_API_URL") or "https://api.d-id.com/talks"
     DID_SOURCE_URL = "https://res.cloudinary.com/drvwan14l/image/upload/v1743239627/magen_igp4ts.png"
     DID_WEBHOOK_URL = f"{SERVER_URL}/api/webhook"
+    # Upload generated audio to D-ID's /audios endpoint instead of having D-ID
+    # fetch it back from SERVER_URL; the URL is still used if the upload fails.
+    DID_AUDIO_UPLOAD = os.environ.get('DID_AUDIO_UPLOAD', 'true').lower() == 'true'
+    DID_AUDIOS_URL = os.environ.get("DID_AUDIOS_URL") or f"{DID_API_URL.rsplit('/', 1)[0]}/audios"
@@ -1,46 +1,55 @@
 import os
 import sys
-import time
 import json
+import argparse
 import requests
 import logging
 
 from dotenv import load_dotenv
+from config import Config
+from services.http_client import HTTPClient
+from services.job_tracker import JobTracker, make_did_poller
+from services.downloader import Downloader
+from services.profiles import ProfileRegistry
+from services.logs import configure_logging
 load_dotenv()
 
 # Configure logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+configure_logging(vars(Config))
 logger = logging.getLogger(__name__)
 
 # Configuration
 DID_API_KEY = os.environ.get("DID_API_KEY")
-TALK_API_URL = "https://api.d-id.com/talks"
-DID_SOURCE_URL = "https://res.cloudinary.com/drvwan14l/image/upload/v1743403431/Joaquin_xmhhqp.jpg"
-ELEVENLABS_VOICE_CLIP_ID = "CwhRBWXzGAHq8TQ4Fs17"
-POLL_INTERVAL = 5
+TALK_API_URL = Config.DID_API_URL
+# The demo presenter's avatar and voice come from the server's profile registry.
+PROFILE = ProfileRegistry.from_config(vars(Config)).get(os.environ.get("DEMO_PROFILE", "joaquin"))
+DID_SOURCE_URL = PROFILE.source_url
+ELEVENLABS_VOICE_CLIP_ID = PROFILE.voice_id
+ELEVENLABS_VOICE_CONFIG = PROFILE.voice_config
+POLL_INTERVAL = 2  # Initial interval; doubles up to MAX_POLL_INTERVAL
+MAX_POLL_INTERVAL = 30
 TIMEOUT = 300
+# The same job table as the server, under DATA_DIR.
+JOBS_DB_PATH = Config.JOBS_DB_PATH
 
-def create_talk(text: str) -> dict:
+# One pooled client for the whole run, so polling reuses the D-ID connection.
+http_client = HTTPClient()
+
+def create_talk(text: str, source_url: str = DID_SOURCE_URL,
+                voice_id: str = ELEVENLABS_VOICE_CLIP_ID, voice_config: dict = None) -> dict:
     """
     Sends a request to D-ID's talks endpoint using a text script payload.
     """
 
     payload = {
-        "source_url": DID_SOURCE_URL,
+        "source_url": source_url,
         "script": {
             "type": "text",
             "input": text,
             "provider": {
                 "type": "elevenlabs",
-                "voice_id": ELEVENLABS_VOICE_CLIP_ID,
-                "voice_config": {
-                    "model_id": "eleven_multilingual_v2",
-                    "stability": 0.85,
-                    "similarity_boost": 1,
-                    "style": 0.0,
-                    "use_speaker_boost": True,
-                    "speed": 0.75
-                }
+                "voice_id": voice_id,
+                "voice_config": voice_config or ELEVENLABS_VOICE_CONFIG
             }
         },
         "config": {
@@ -59,7 +68,7 @@ def create_talk(text: str) -> dict:
     logger.info(json.dumps(payload, indent=2))
 
     try:
-        response = requests.post(TALK_API_URL, headers=headers, json=payload)
+        response = http_client.post(TALK_API_URL, headers=headers, json=payload)
         if response.status_code not in (200, 201):
             raise Exception(f"Talk creation failed with status {response.status_code}: {response.text}")
         result = response.json()
@@ -78,57 +87,70 @@ def create_talk(text: str) -> dict:
         raise Exception(f"Failed to generate talk: {e}")
 
 
-def poll_talk_status(talk_id: str) -> dict:
+def get_job_tracker() -> JobTracker:
+    """Open the job table shared with the server."""
+    os.makedirs(os.path.dirname(JOBS_DB_PATH), exist_ok=True)
+    return JobTracker(JOBS_DB_PATH, retention=Config.JOB_TRACKER_RETENTION)
+
+
+def poll_talk_status(talk_id: str, tracker: JobTracker) -> dict:
     """
-    Polls the talk status endpoint until the talk status is 'done'
-    or a timeout occurs.
+    Waits until the talk reaches a final status, polling D-ID with
+    exponential backoff and jitter. Raises on timeout or polling errors.
     """
-    headers = {
-        "accept": "application/json",
-        "Authorization": f"Basic {DID_API_KEY}"
-    }
-    talk_url = f"{TALK_API_URL}/{talk_id}"
-    logger.info(f"Polling talk status at: {talk_url}")
-    start_time = time.time()
-    while True:
-        response = requests.get(talk_url, headers=headers)
-        if response.status_code != 200:
-            logger.error(f"Error polling talk status: {response.status_code} {response.text}")
-            sys.exit(1)
-        result = response.json()
-        status = result.get("status")
-        logger.info(f"Talk status: {status}")
-        if status == "done":
-            return result
-        if time.time() - start_time > TIMEOUT:
-            logger.error("Polling timed out.")
-            sys.exit(1)
-        time.sleep(POLL_INTERVAL)
+    logger.info(f"Polling talk status at: {TALK_API_URL}/{talk_id}")
+    poll = make_did_poller(http_client, TALK_API_URL, DID_API_KEY)
+    job = tracker.wait_for_result(
+        talk_id, poll,
+        timeout=TIMEOUT,
+        initial_interval=POLL_INTERVAL,
+        max_interval=MAX_POLL_INTERVAL
+    )
+    if job["status"] != "done":
+        raise Exception(f"Talk {talk_id} finished with status {job['status']}: {job['data']}")
+    return job["data"]
+
+def fetch_talk(talk_id: str, tracker: JobTracker) -> dict:
+    """
+    Fetches the talk's current record from D-ID and records it, e.g. for a
+    fresh result_url once the signed one from an earlier run has expired.
+    """
+    talk = make_did_poller(http_client, TALK_API_URL, DID_API_KEY)(talk_id)
+    tracker.update(talk_id, talk, source="poll")
+    return talk
 
-def download_video(video_url: str, save_dir: str = "talks") -> str:
+def download_video(video_url: str, save_dir: str = "talks", filename: str = None) -> str:
     """
-    Downloads the video from the given URL and saves it locally.
+    Downloads the video from the given URL and saves it locally, using
+    parallel range requests and resuming any earlier partial download.
     Returns the local file path.
     """
-    if not os.path.exists(save_dir):
-        os.makedirs(save_dir)
-    filename = f"talk_{int(time.time())}.mp4"
-    save_path = os.path.join(save_dir, filename)
     logger.info(f"Downloading video from {video_url}...")
-    response = requests.get(video_url, stream=True)
-    if response.status_code == 200:
-        with open(save_path, "wb") as f:
-            for chunk in response.iter_content(chunk_size=8192):
-                if chunk:
-                    f.write(chunk)
-        logger.info(f"Video saved to {save_path}")
-        return save_path
-    else:
-        logger.error(f"Failed to download video. Status: {response.status_code}")
-        sys.exit(1)
+    return Downloader(http_client).download(video_url, save_dir, filename)
+
+def render_incremental(text: str) -> dict:
+    """
+    Synthesize text with the server's TTS service, one sentence at a time,
+    reusing the sentences cached by earlier renders of the script, and submit
+    the stitched audio to D-ID as one talk. Returns the talk result, with a
+    'delta' report of what was reused. The audio is uploaded to D-ID, so the
+    server does not need to be running (keep DID_AUDIO_UPLOAD on).
+    """
+    from app import app
+    from services.pipeline import generate_talk
+
+    with app.app_context():
+        talk = generate_talk(app, text, PROFILE.name, lambda status, **extra: None, incremental=True)
+    delta = talk["delta"]
+    logger.info(
+        f"Reused {delta['reused']} of {delta['sentences']} sentences "
+        f"({delta['chars_reused']} of {delta['chars_reused'] + delta['chars_synthesized']} characters); "
+        f"synthesized sentences {delta['changed']}"
+    )
+    return talk
 
-def main():
-    text = """Hello there! I'm Joaquin, your AI avatar host for today. Welcome to the Avatar Text-to-Speech project demonstration.
+
+DEMO_TEXT = """Hello there! I'm Joaquin, your AI avatar host for today. Welcome to the Avatar Text-to-Speech project demonstration.
 
         What you're witnessing right now is exactly what this project is all about – a synthetic voice synchronized with facial animations to create a natural-looking digital presenter. Pretty cool, right?
 
@@ -142,13 +164,41 @@ def main():
 
         Until next time, this is Joaquin signing off. I hope to speak your words soon!"""
 
-    talk_metadata = create_talk(text)
+
+def main():
+    parser = argparse.ArgumentParser(description="Render a demo video of the avatar reading a script.")
+    parser.add_argument("--script", help="Text file with the script (default: the built-in demo text)")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Synthesize the audio here and only re-synthesize sentences changed since "
+                             "the last render, instead of having D-ID synthesize the whole script")
+    args = parser.parse_args()
+    if args.script:
+        with open(args.script, encoding="utf-8") as f:
+            text = f.read()
+    else:
+        text = DEMO_TEXT
+
+    tracker = get_job_tracker()
+    talk_metadata = render_incremental(text) if args.incremental else create_talk(text)
     talk_id = talk_metadata["talk_id"]
     logger.info(f"Talk ID: {talk_id}")
-    final_result = poll_talk_status(talk_id)
+    if talk_metadata.get("cached"):
+        final_result = talk_metadata
+    else:
+        tracker.record_submitted(talk_id, talk_metadata["status"])
+        try:
+            final_result = poll_talk_status(talk_id, tracker)
+        except Exception as e:
+            logger.error(f"Talk did not complete: {e}")
+            sys.exit(1)
     video_url = final_result.get("result_url")
     if video_url:
-        download_video(video_url)
+        try:
+            # Named after the talk, so a re-run resumes an interrupted download of it.
+            download_video(video_url, filename=f"{talk_id}.mp4")
+        except Exception as e:
+            logger.error(str(e))
+            sys.exit(1)
     else:
         logger.error("Video URL not found in final talk result.")
         sys.exit(1)
@@ -0,0 +1,117 @@
+"""
+Render the clip library ahead of time.
+
+Every phrase in CLIP_PHRASES_PATH (one per line; blank lines and lines
+starting with # are skipped) is rendered through FastGenService, exactly as
+/api/fast-generate would render it, and the video is downloaded into
+CLIP_LIBRARY_DIR. The live endpoints then answer those phrases without
+calling ElevenLabs or D-ID.
+
+    python precompute_clips.py            # render missing and stale clips
+    python precompute_clips.py --prune    # also drop clips for phrases no longer listed
+    python precompute_clips.py --list     # show each phrase and whether its clip is current
+    python precompute_clips.py --profile joaquin --phrases joaquin.txt   # clips for another profile
+
+A clip is stale when the source image, voice or voice settings changed
+since it was rendered, so re-running the command after such a change
+refreshes exactly the clips that need it. A running server picks up the
+new index without a restart.
+"""
+import json
+import logging
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional
+
+from app import app
+from services.downloader import Downloader
+from services.fast_gen import FastGenService
+from services.job_tracker import make_did_poller
+from services.text_chunker import chunk_text
+
+logger = logging.getLogger(__name__)
+
+
+def load_phrases(path: str) -> List[str]:
+    with open(path, encoding="utf-8") as f:
+        lines = [line.strip() for line in f]
+    return [line for line in lines if line and not line.startswith("#")]
+
+
+def clip_status(service: FastGenService, text: str) -> str:
+    entry = app.extensions["clip_library"].get(text, service.profile.library_scope)
+    if entry is None:
+        return "missing"
+    return "current" if entry["fingerprint"] == service.fingerprint_for(text) else "stale"
+
+
+def render_clip(text: str, profile_name: Optional[str] = None) -> Dict[str, Any]:
+    """Render one phrase (reusing a cached talk if there is one) and store its video."""
+    with app.app_context():
+        service = FastGenService(profile=app.extensions["profiles"].get(profile_name))
+        library = app.extensions["clip_library"]
+        fingerprint = service.fingerprint_for(text)
+        if len(chunk_text(text, service.max_chars)) > 1:
+            raise ValueError(f"Phrase is over {service.max_chars} characters; clips must be a single segment")
+        talk = service.generate_avatar_video_text(text)
+        result_url = talk.get("result_url")
+        if not result_url:
+            tracker = app.extensions["job_tracker"]
+            tracker.record_submitted(talk["talk_id"], talk.get("status"))
+            poll = make_did_poller(app.extensions["http_client"], app.config["DID_API_URL"], app.config["DID_API_KEY"],
+                                   limiter=service.profile.limiter("did", app.extensions["upstream_limits"]["did"]))
+            job = tracker.wait_for_result(talk["talk_id"], poll, timeout=app.config["JOB_POLL_TIMEOUT"],
+                                          max_interval=app.config["JOB_POLL_MAX_INTERVAL"])
+            app.extensions["talk_cache"].complete(job["data"])
+            if job["status"] != "done":
+                raise RuntimeError(f"Talk {talk['talk_id']} ended with status {job['status']}")
+            result_url = job["result_url"]
+        filename = f"{fingerprint[:32]}.mp4"
+        Downloader(app.extensions["http_client"]).download(result_url, library.directory, filename=filename)
+        return library.add(text, fingerprint, filename, talk.get("talk_id"), scope=service.profile.library_scope)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-render avatar clips for common phrases.")
+    parser.add_argument("--phrases", default=app.config["CLIP_PHRASES_PATH"], help="Phrase list, one per line")
+    parser.add_argument("--prune", action="store_true", help="Remove clips for phrases not in the list")
+    parser.add_argument("--list", action="store_true", help="Only report the state of each clip")
+    parser.add_argument("--concurrency", type=int, default=2, help="Clips rendering at once")
+    parser.add_argument("--profile", help="Profile to render the clips for (default profile if omitted)")
+    args = parser.parse_args()
+
+    phrases = load_phrases(args.phrases)
+    library = app.extensions["clip_library"]
+    with app.app_context():
+        service = FastGenService(profile=app.extensions["profiles"].get(args.profile))
+        scope = service.profile.library_scope
+        states = {text: clip_status(service, text) for text in phrases}
+    if args.list:
+        for text, state in states.items():
+            print(f"{state:8} {text}")
+        return
+
+    pending = [text for text, state in states.items() if state != "current"]
+    logger.info(f"{len(phrases)} phrases, {len(phrases) - len(pending)} current, {len(pending)} to render")
+    summary = {"current": len(phrases) - len(pending), "rendered": 0, "failed": 0, "pruned": 0}
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        for text, future in [(text, pool.submit(render_clip, text, args.profile)) for text in pending]:
+            try:
+                entry = future.result()
+                summary["rendered"] += 1
+                logger.info(f"Rendered clip {entry['filename']} for '{text}'")
+            except Exception as e:
+                summary["failed"] += 1
+                logger.error(f"Could not render '{text}': {e}")
+
+    if args.prune:
+        listed = {library.key_for(text, scope) for text in phrases}
+        for entry in library.entries():
+            if entry.get("scope") == scope and library.key_for(entry["text"], scope) not in listed:
+                library.remove(entry["text"], scope)
+                summary["pruned"] += 1
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,24 @@
-import os
-import time
-import requests
-from flask import Blueprint, request, jsonify, send_file, current_app
-from services.fast_gen import FastGenService
-from services.tts_service import TTSService
-from services.avatar_service import AvatarService
+import logging
+from flask import Blueprint, Response, request, jsonify, current_app
+from services.pipeline import start_generation_job, handle_talk_result, handle_talk_update, find_library_clip
+from services.metrics import STAGE_SECONDS
+from services.scheduler import Overloaded
+from services.media import resolve_media_path, send_media
+from services.profiles import UnknownProfile
 
 api_bp = Blueprint('api', __name__)
 
+# One record per D-ID callback; sample it with LOG_SAMPLING=routes.api.webhook=<rate>.
+webhook_logger = logging.getLogger(f"{__name__}.webhook")
+
+
+def _overloaded_response(error: Overloaded):
+    """429 with a Retry-After hint, so clients back off instead of failing."""
+    response = jsonify({"error": str(error), "retry_after": error.retry_after})
+    response.status_code = 429
+    response.headers["Retry-After"] = str(error.retry_after)
+    return response
+
 
 @api_bp.route("/fast-generate", methods=["POST"])
 def fast_generate():
@@ -15,6 +26,11 @@ def fast_generate():
     Fast endpoint to generate an avatar video directly from text.
     This endpoint sends the text directly to D-ID using a text script payload.
     It includes ElevenLabs provider details so that D-ID can internally generate the audio.
+    An optional "socket_id" binds the caller's Socket.IO session to the talk's room,
+    so only that client receives its video_ready event. An optional "profile"
+    selects the avatar and voice (see /api/profiles).
+    Text that exactly matches a pre-rendered clip is answered at once with
+    the clip's result_url.
     """
     try:
         data = request.get_json()
@@ -22,13 +38,22 @@ def fast_generate():
             return jsonify({"error": "No text provided"}), 400
 
         text = data["text"]
-
-        # Create an instance of FastGenService
-        fast_gen_service = FastGenService()
-        # Call the new function to generate a talk directly from text.
-        talk_result = fast_gen_service.generate_avatar_video_text(text)
+        app = current_app._get_current_object()
+        profile = app.extensions["profiles"].get(data.get("profile"))
+
+        talk_result = find_library_clip(app, text, profile)
+        if talk_result is None:
+            # The app's shared FastGenService for this profile
+            fast_gen_service = app.extensions.service("fast_gen", profile)
+            # Call the new function to generate a talk directly from text.
+            talk_result = fast_gen_service.generate_avatar_video_text(text)
+        handle_talk_result(app, talk_result, data.get("socket_id"))
         return jsonify(talk_result), 200
 
+    except UnknownProfile as e:
+        return jsonify({"error": str(e)}), 400
+    except Overloaded as e:
+        return _overloaded_response(e)
     except Exception as e:
         current_app.logger.error("Error in /fast-generate: %s", str(e))
         return jsonify({"error": str(e)}), 500
@@ -38,62 +63,133 @@ def fast_generate():
 def generate():
     """
     Endpoint to generate TTS audio and then create an avatar video using D-ID.
+    Returns a job ID and queue position immediately; TTS, audio publishing and
+    the D-ID submission run in the background and report progress, including
+    queue position changes, as job_status Socket.IO events. Answers 429 with
+    Retry-After when the job queue is full. Text that exactly matches a
+    pre-rendered clip is answered at once with 200 and the clip's talk result.
     Expected JSON payload:
     {
         "text": "Text to be converted to speech",
-        // Optionally, "audio_url": "https://yourdomain.com/path/to/audio.mp3"
+        // Optionally, "socket_id": the caller's Socket.IO sid, which joins the job's room
+        // Optionally, "profile": the avatar and voice to use (default profile if omitted)
+        // Optionally, "incremental": true to re-synthesize only the sentences changed since earlier renders
     }
+    With DURABLE_JOBS, an Idempotency-Key header (or "idempotency_key" field)
+    makes a retried request return the job it first created.
     """
     try:
         data = request.get_json()
         if not data or "text" not in data:
             return jsonify({"error": "No text provided"}), 400
 
-        text = data["text"]
-
-        # Generate TTS audio.
-        tts_service = TTSService()
-        tts_result = tts_service.generate_speech(text)
-        audio_url = f"{current_app.config['SERVER_URL']}/api/audio/{tts_result['filename']}"
-        # audio_url = f"{current_app.config['NGROK_URL']}/api/audio/{tts_result['filename']}"
-
-        time.sleep(3)
-
-         # Verify audio file is accessible before proceeding
-        audio_path = os.path.join(current_app.config["AUDIO_DIR"], tts_result['filename'])
-        if not os.path.exists(audio_path):
-            return jsonify({"error": "Generated audio file not found"}), 500
-
-        # Generate Avatar Video using the audio.
-        avatar_service = AvatarService()
-        talk_result = avatar_service.generate_avatar_video(text, audio_url)
-
-        return jsonify(talk_result), 200
-
+        app = current_app._get_current_object()
+        profile = app.extensions["profiles"].get(data.get("profile"))
+        clip = find_library_clip(app, data["text"], profile)
+        if clip is not None:
+            handle_talk_result(app, clip, data.get("socket_id"))
+            return jsonify(clip), 200
+
+        idempotency_key = request.headers.get("Idempotency-Key") or data.get("idempotency_key")
+        job = start_generation_job(app, data["text"], data.get("socket_id"), profile.name, idempotency_key,
+                                   incremental=bool(data.get("incremental")))
+        return jsonify(job), 202
+
+    except UnknownProfile as e:
+        return jsonify({"error": str(e)}), 400
+    except Overloaded as e:
+        return _overloaded_response(e)
     except Exception as e:
         current_app.logger.error("Error in /generate: %s", str(e))
         return jsonify({"error": str(e)}), 500
 
 
+def _serve_growing_audio(stream):
+    """
+    Serve an audio file that is still being streamed from ElevenLabs.
+    Without a Range header the file is sent with chunked transfer encoding as
+    it grows. A bounded range is answered as soon as those bytes exist; any
+    other range waits for the file to finish and is handled by send_media.
+    """
+    byte_range = request.range
+    if byte_range is None:
+        response = Response(stream.iter_bytes(), mimetype="audio/mpeg", direct_passthrough=True)
+        response.headers["Cache-Control"] = "no-cache"
+        response.headers["Access-Control-Allow-Origin"] = "*"
+        return response
+
+    timeout = current_app.config["HTTP_READ_TIMEOUT"]
+    if byte_range.units == "bytes" and len(byte_range.ranges) == 1:
+        start, end = byte_range.ranges[0]
+        if start >= 0 and end is not None and stream.wait_for_size(end, timeout):
+            response = Response(stream.iter_bytes(start, end), status=206,
+                                mimetype="audio/mpeg", direct_passthrough=True)
+            response.headers["Content-Range"] = f"bytes {start}-{end - 1}/*"
+            response.headers["Content-Length"] = str(end - start)
+            response.headers["Access-Control-Allow-Origin"] = "*"
+            return response
+
+    stream.wait(timeout)
+    return None
+
+
 @api_bp.route("/audio/<filename>")
 def serve_audio(filename):
     """
-    Serve generated TTS audio files.
+    Serve generated TTS audio files, including files still being streamed.
     """
+    with STAGE_SECONDS.time(stage="audio_serve"):
+        return _serve_audio(filename)
+
+
+def _serve_audio(filename):
+    # Only finished audio; never the .part and .tmp files of writes in progress.
+    if not filename.endswith(".mp3"):
+        return jsonify({"error": "Audio file not found"}), 404
     try:
-        audio_path = os.path.join(current_app.config["AUDIO_DIR"], filename)
-        if os.path.exists(audio_path):
-            # Set CORS headers to allow D-ID to access the file
-            response = send_file(audio_path, mimetype="audio/mpeg")
-            response.headers.add("Access-Control-Allow-Origin", "*")
-            return response
-        else:
+        stream = current_app.extensions["audio_cache"].get_stream(filename)
+        if stream is not None:
+            response = _serve_growing_audio(stream)
+            if response is not None:
+                return response
+
+        audio_path = resolve_media_path(current_app.config["AUDIO_DIR"], filename)
+        response = None
+        # Audio generated by another instance is copied from the shared media store.
+        if audio_path and current_app.extensions["audio_cache"].fetch(filename):
+            # Sent with CORS headers so D-ID can fetch the file
+            response = send_media(audio_path, "audio/mpeg", current_app.extensions["media_cache"])
+        if response is None:
             return jsonify({"error": "Audio file not found"}), 404
+        return response
     except Exception as e:
         current_app.logger.error("Error serving audio: %s", str(e))
         return jsonify({"error": "Internal server error"}), 500
 
 
+@api_bp.route("/clips/<filename>")
+def serve_clip(filename):
+    """
+    Serve a pre-rendered clip from the clip library.
+    """
+    path = resolve_media_path(current_app.extensions["clip_library"].directory, filename)
+    response = None
+    if path and filename.endswith(".mp4"):
+        response = send_media(path, "video/mp4", current_app.extensions["media_cache"])
+    if response is None:
+        return jsonify({"error": "Clip not found"}), 404
+    return response
+
+
+@api_bp.route("/profiles")
+def list_profiles():
+    """
+    The avatar/voice profiles that requests can select by name.
+    """
+    profiles = current_app.extensions["profiles"].profiles()
+    return jsonify({"profiles": [profile.describe() for profile in profiles]})
+
+
 @api_bp.route("/webhook", methods=["POST"])
 def webhook():
     """
@@ -101,13 +197,45 @@ def webhook():
     """
     try:
         data = request.get_json()
-        current_app.logger.info("D-ID webhook received: %s", data)
+        if not data or "id" not in data:
+            return jsonify({"error": "No talk id provided"}), 400
+        webhook_logger.info("D-ID webhook received for talk %s: %s", data["id"], data.get("status"),
+                            extra={"talk_id": data["id"]})
+        webhook_logger.debug("D-ID webhook body: %s", data, extra={"talk_id": data["id"]})
 
-        # Import socketio locally to avoid circular dependency
-        from app import socketio
-        socketio.emit("video_ready", data)
+        handle_talk_update(current_app._get_current_object(), data)
 
         return jsonify({"status": "received"}), 200
     except Exception as e:
         current_app.logger.error("Webhook error: %s", str(e))
         return jsonify({"error": "Webhook processing failed"}), 500
+
+
+@api_bp.route("/generate/<job_id>")
+def generation_status(job_id):
+    """
+    Status of a durable generation job (DURABLE_JOBS): queued, running,
+    done (with the talk result) or dead (out of attempts, with the error).
+    """
+    job = current_app.extensions["job_queue"].get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify({
+        "job_id": job["job_id"],
+        "status": job["status"],
+        "position": job["position"],
+        "attempts": job["attempts"],
+        "talk": job["result"],
+        "error": job["error"],
+    }), 200
+
+
+@api_bp.route("/jobs/<talk_id>")
+def job_status(talk_id):
+    """
+    Return the tracked status of a D-ID talk without calling D-ID.
+    """
+    job = current_app.extensions["job_tracker"].get(talk_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job), 200
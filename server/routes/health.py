@@ -1,4 +1,4 @@
-from flask import Blueprint, jsonify
+from flask import Blueprint, jsonify, current_app
 
 health_bp = Blueprint('health', __name__)
 
@@ -8,3 +8,27 @@ def health_check():
         'status': 'ok',
         'message': 'Server is running'
     })
+
+@health_bp.route('/cache')
+def cache_stats():
+    """Counters for the audio, talk and clip caches, in-memory media and speculative TTS."""
+    return jsonify({
+        'audio': current_app.extensions['audio_cache'].stats(),
+        'talks': current_app.extensions['talk_cache'].stats(),
+        'clips': current_app.extensions['clip_library'].stats(),
+        'media': current_app.extensions['media_cache'].stats(),
+        'speculative': current_app.extensions['speculative_audio'].stats()
+    })
+
+@health_bp.route('/queue')
+def queue_stats():
+    """Generation queue depth and per-upstream (and per-profile) concurrency, waiters and rejections."""
+    return jsonify({
+        'jobs': current_app.extensions['job_scheduler'].stats(),
+        'durable': current_app.extensions['job_queue'].stats(),
+        'upstreams': {
+            name: limiter.stats()
+            for name, limiter in current_app.extensions['upstream_limits'].items()
+        },
+        'profiles': current_app.extensions['profiles'].stats()
+    })
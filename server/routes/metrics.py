@@ -0,0 +1,9 @@
+from flask import Blueprint, Response
+from services.metrics import REGISTRY
+
+metrics_bp = Blueprint('metrics', __name__)
+
+@metrics_bp.route('/metrics')
+def metrics():
+    """Stage latency histograms and upstream/fallback counters in the Prometheus text format."""
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,40 @@
+from flask import request, current_app
+from flask_socketio import SocketIO, join_room, leave_room
+from services.pipeline import talk_room, job_room, prefetch_draft
+
+
+def register_socket_events(socketio: SocketIO) -> None:
+    @socketio.on("subscribe")
+    def subscribe(data):
+        """Join the rooms for a talk and/or generation job so their events reach this client."""
+        data = data or {}
+        if data.get("talk_id"):
+            join_room(talk_room(data["talk_id"]))
+        if data.get("job_id"):
+            join_room(job_room(data["job_id"]))
+        return {"sid": request.sid}
+
+    @socketio.on("draft_text")
+    def draft_text(data):
+        """
+        Draft text as the user types. With SPECULATIVE_TTS on, finished
+        sentences are synthesized ahead of the /generate request.
+        """
+        data = data or {}
+        text = data.get("text") or ""
+        app = current_app._get_current_object()
+        if not app.config["SPECULATIVE_TTS"] or len(text) > app.config["SPECULATIVE_TTS_MAX_CHARS"]:
+            return
+        prefetch_draft(app, request.sid, text, data.get("profile"))
+
+    @socketio.on("disconnect")
+    def disconnect():
+        current_app.extensions["speculative_audio"].forget(request.sid)
+
+    @socketio.on("unsubscribe")
+    def unsubscribe(data):
+        data = data or {}
+        if data.get("talk_id"):
+            leave_room(talk_room(data["talk_id"]))
+        if data.get("job_id"):
+            leave_room(job_room(data["job_id"]))
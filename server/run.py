@@ -1,4 +1,40 @@
+from config import Config
+
+if Config.SOCKETIO_ASYNC_MODE == 'eventlet':
+    # Must run before anything else imports socket, ssl or threading, so that
+    # blocking upstream calls yield to other requests instead of stalling the hub.
+    import eventlet
+    eventlet.monkey_patch()
+
 from app import app, socketio
 
+
+def server_options():
+    """Extra arguments for the WSGI server behind socketio.run()."""
+    if Config.SOCKETIO_ASYNC_MODE != 'eventlet':
+        return {}
+    import socket
+    import eventlet.wsgi
+
+    class NoDelayHttpProtocol(eventlet.wsgi.HttpProtocol):
+        # eventlet writes the headers and a mid-sized body as separate
+        # segments; with Nagle on, the body waits for the client's delayed
+        # ACK (~40 ms), which hit every ranged media request.
+        def setup(self):
+            self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            super().setup()
+
+    return {'protocol': NoDelayHttpProtocol}
+
+
 if __name__ == '__main__':
-    socketio.run(app, host='0.0.0.0', port=5003, debug=False)
+    if app.config['WARMUP']:
+        from services.container import warm_up
+        socketio.start_background_task(
+            warm_up, app, [app.config['ELEVENLABS_API_URL'], app.config['DID_API_URL']]
+        )
+    if app.config['DURABLE_JOBS']:
+        # Relay progress of jobs run by worker.py, including ones queued before a restart.
+        from services.pipeline import start_event_relay
+        start_event_relay(app)
+    socketio.run(app, host='0.0.0.0', port=app.config['PORT'], debug=False, **server_options())
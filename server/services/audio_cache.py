@@ -0,0 +1,367 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, Any, Iterator, Optional, Tuple
+
+from services.metrics import STAGE_SECONDS, FALLBACKS
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_text(text: str) -> str:
+    """Normalize text so that trivially different scripts share a cache entry."""
+    text = unicodedata.normalize("NFC", text)
+    return " ".join(text.split())
+
+
+class AudioStream:
+    """
+    An audio file that is still being written.
+
+    The writer appends chunks to a .part file and renames it into place on
+    commit. Readers tail the .part file through their own file handle, which
+    stays valid across the rename, so they can start sending bytes before
+    the upstream response is finished.
+    """
+
+    def __init__(self, cache: "AudioCache", key: str):
+        self.cache = cache
+        self.key = key
+        self.filename = cache.filename_for(key)
+        self.path = os.path.join(cache.directory, self.filename)
+        self.part_path = f"{self.path}.part"
+        self.size = 0
+        self.done = False
+        self.error = None
+        self._cond = threading.Condition()
+        self._file = open(self.part_path, "wb")
+
+    def write(self, chunk: bytes) -> None:
+        self._file.write(chunk)
+        self._file.flush()
+        with self._cond:
+            self.size += len(chunk)
+            self._cond.notify_all()
+
+    def commit(self) -> str:
+        """Fsync the finished file, rename it into place and add it to the cache."""
+        with STAGE_SECONDS.time(stage="audio_write"):
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+            os.replace(self.part_path, self.path)
+        self.cache._finish_stream(self)
+        self._finish()
+        if self.cache.store is not None:
+            with open(self.path, "rb") as f:
+                self.cache._share(self.filename, f.read())
+        return self.filename
+
+    def abort(self, error: Exception) -> None:
+        self._file.close()
+        try:
+            os.remove(self.part_path)
+        except FileNotFoundError:
+            pass
+        self.cache._finish_stream(self, stored=False)
+        self.error = error
+        self._finish()
+
+    def _finish(self) -> None:
+        with self._cond:
+            self.done = True
+            self._cond.notify_all()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Block until the stream is committed or aborted."""
+        with self._cond:
+            self._cond.wait_for(lambda: self.done, timeout)
+        return self.done and self.error is None
+
+    def wait_for_size(self, size: int, timeout: Optional[float] = None) -> bool:
+        """Block until at least size bytes are written or the stream ends."""
+        with self._cond:
+            self._cond.wait_for(lambda: self.size >= size or self.done, timeout)
+        return self.size >= size
+
+    def iter_bytes(self, start: int = 0, end: Optional[int] = None,
+                   chunk_size: int = 64 * 1024) -> Iterator[bytes]:
+        """Yield bytes [start, end) of the file, following it as it grows."""
+        try:
+            f = open(self.part_path, "rb")
+        except FileNotFoundError:
+            # Committed between lookup and open; the finished file is complete.
+            f = open(self.path, "rb")
+        with f:
+            f.seek(start)
+            position = start
+            while end is None or position < end:
+                size = chunk_size if end is None else min(chunk_size, end - position)
+                chunk = f.read(size)
+                if chunk:
+                    position += len(chunk)
+                    yield chunk
+                    continue
+                with self._cond:
+                    if self.done and position >= self.size:
+                        return
+                    self._cond.wait_for(lambda: self.size > position or self.done, 1.0)
+
+
+class AudioCache:
+    """
+    Content-addressed store for generated MP3 files.
+
+    Files are named after the hash of the request that produced them, so a
+    repeated request maps to the same file. Entries are evicted least recently
+    used first once either the file count or the total size exceeds its limit.
+    Files younger than min_age seconds are never evicted, because D-ID may
+    still be fetching them. If a hot_cache is given, newly stored files are
+    also put there so their first fetches are served from memory.
+
+    With a shared store (see services.storage), every file is also written
+    there, and a file missing from this instance's directory is copied from
+    it, so audio generated by one server instance is a cache hit and can be
+    served on all of them. Eviction only affects the local copies.
+    """
+
+    def __init__(self, directory: str, max_files: int = 200,
+                 max_bytes: int = 200 * 1024 * 1024, min_age: float = 300,
+                 hot_cache=None, store=None):
+        self.directory = directory
+        self.hot_cache = hot_cache
+        self.store = store
+        self.max_files = max_files
+        self.max_bytes = max_bytes
+        self.min_age = min_age
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.shared_hits = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # filename -> size, oldest first
+        self._streams = {}  # filename -> AudioStream still being written
+        self._total_bytes = 0
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    @staticmethod
+    def make_key(text: str, voice_id: str, model_id: str, voice_settings: Dict[str, Any],
+                 context: Optional[Dict[str, Any]] = None) -> str:
+        """
+        Hash the normalized text together with everything that affects the
+        audio, including any prosody context sent alongside it.
+        """
+        fields = {
+            "text": normalize_text(text),
+            "voice_id": voice_id,
+            "model_id": model_id,
+            "voice_settings": voice_settings,
+        }
+        if context:
+            fields["context"] = {k: normalize_text(v) for k, v in context.items() if v}
+        material = json.dumps(fields, sort_keys=True)
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def filename_for(key: str) -> str:
+        return f"{key}.mp3"
+
+    def _load(self) -> None:
+        """
+        Index the files already on disk, ordered by last use, and delete the
+        .part and .tmp files left by writes that crashed. Those younger than
+        min_age are left alone, as another process may still be writing them.
+        """
+        files = []
+        now = time.time()
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if not os.path.isfile(path):
+                continue
+            stat = os.stat(path)
+            if name.endswith(".mp3"):
+                files.append((stat.st_mtime, name, stat.st_size))
+            elif name.endswith((".part", ".tmp")) and now - stat.st_mtime >= self.min_age:
+                try:
+                    os.remove(path)
+                    logger.info(f"Removed unfinished audio file: {name}")
+                except FileNotFoundError:
+                    pass
+        for _, name, size in sorted(files):
+            self._entries[name] = size
+            self._total_bytes += size
+        logger.info(f"Audio cache loaded {len(self._entries)} files ({self._total_bytes} bytes)")
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the cached filename for key, or None on a miss."""
+        filename = self.filename_for(key)
+        path = os.path.join(self.directory, filename)
+        with self._lock:
+            if filename in self._entries and os.path.exists(path):
+                self._entries.move_to_end(filename)
+                self.hits += 1
+                # Bump mtime so LRU order survives a restart.
+                os.utime(path, None)
+                return filename
+            if filename in self._entries:
+                # File was removed behind our back.
+                self._total_bytes -= self._entries.pop(filename)
+        if self.fetch(filename):
+            with self._lock:
+                self.hits += 1
+            return filename
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def fetch(self, filename: str) -> bool:
+        """
+        Make sure filename is in the local directory, copying it from the
+        shared store if another instance generated it. Returns whether it is.
+        A file another process wrote to the directory (e.g. a worker) is
+        indexed, so it counts against this cache's limits too.
+        """
+        path = os.path.join(self.directory, filename)
+        try:
+            size = os.path.getsize(path)
+        except FileNotFoundError:
+            size = None
+        if size is not None:
+            with self._lock:
+                if filename not in self._entries and filename not in self._streams:
+                    self._entries[filename] = size
+                    self._total_bytes += size
+                    self._evict()
+            return True
+        if self.store is None:
+            return False
+        try:
+            data = self.store.get(filename)
+        except Exception as e:
+            logger.warning(f"Could not read {filename} from the media store: {e}")
+            return False
+        if data is None:
+            return False
+        self._write(filename, data)
+        with self._lock:
+            self.shared_hits += 1
+        return True
+
+    def read(self, filename: str) -> bytes:
+        path = os.path.join(self.directory, filename)
+        if self.hot_cache is not None:
+            data = self.hot_cache.get(path, os.stat(path))
+            if data is not None:
+                return data
+        with open(path, "rb") as f:
+            return f.read()
+
+    def put(self, key: str, data: bytes) -> str:
+        """
+        Store audio bytes under key and return the filename.
+        The file is fsync'd and renamed into place, so it is either absent or
+        complete for anyone reading it.
+        """
+        filename = self.filename_for(key)
+        self._write(filename, data)
+        if self.store is not None:
+            self._share(filename, data)
+        return filename
+
+    def _write(self, filename: str, data: bytes) -> None:
+        path = os.path.join(self.directory, filename)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with STAGE_SECONDS.time(stage="audio_write"):
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+        if self.hot_cache is not None:
+            self.hot_cache.put(path, data)
+        with self._lock:
+            if filename in self._entries:
+                self._total_bytes -= self._entries.pop(filename)
+            self._entries[filename] = len(data)
+            self._total_bytes += len(data)
+            self._evict()
+
+    def _share(self, filename: str, data: bytes) -> None:
+        """Copy a new file to the shared store; other instances 404 on it if this fails."""
+        try:
+            with STAGE_SECONDS.time(stage="media_store"):
+                self.store.put(filename, data)
+        except Exception as e:
+            FALLBACKS.inc(kind="media_store")
+            logger.error(f"Could not copy {filename} to the media store: {e}")
+
+    def open_stream(self, key: str) -> Tuple[AudioStream, bool]:
+        """
+        Start writing audio for key incrementally; see AudioStream.
+        Returns the stream and whether the caller owns it. If another thread
+        is already writing the same key, its stream is returned instead and
+        the caller should only wait on it.
+        """
+        filename = self.filename_for(key)
+        with self._lock:
+            stream = self._streams.get(filename)
+            if stream is not None:
+                return stream, False
+            stream = AudioStream(self, key)
+            self._streams[filename] = stream
+            return stream, True
+
+    def get_stream(self, filename: str) -> Optional[AudioStream]:
+        """Return the in-progress stream for filename, if it is still being written."""
+        with self._lock:
+            return self._streams.get(filename)
+
+    def _finish_stream(self, stream: AudioStream, stored: bool = True) -> None:
+        with self._lock:
+            self._streams.pop(stream.filename, None)
+            if not stored:
+                return
+            if stream.filename in self._entries:
+                self._total_bytes -= self._entries.pop(stream.filename)
+            self._entries[stream.filename] = stream.size
+            self._total_bytes += stream.size
+            self._evict()
+
+    def _evict(self) -> None:
+        """Drop least recently used files until the cache is within its limits."""
+        now = time.time()
+        for filename in list(self._entries):
+            if len(self._entries) <= self.max_files and self._total_bytes <= self.max_bytes:
+                break
+            path = os.path.join(self.directory, filename)
+            try:
+                if now - os.path.getmtime(path) < self.min_age:
+                    continue
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            if self.hot_cache is not None:
+                self.hot_cache.discard(path)
+            self._total_bytes -= self._entries.pop(filename)
+            self.evictions += 1
+            logger.info(f"Evicted cached audio file: {filename}")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "shared_hits": self.shared_hits,
+                "store": self.store.describe() if self.store is not None else None,
+                "files": len(self._entries),
+                "bytes": self._total_bytes,
+                "max_files": self.max_files,
+                "max_bytes": self.max_bytes,
+            }
@@ -1,52 +1,85 @@
 import json
 import requests
 import logging
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 from flask import current_app
+from services.metrics import STAGE_SECONDS, FALLBACKS
+from services.scheduler import raise_if_throttled
 
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 class AvatarService:
-    def __init__(self):
+    def __init__(self, http_client=None, profile=None):
+        self.http = http_client or current_app.extensions["http_client"]
+        self.profile = profile or current_app.extensions["profiles"].get()
         self.did_api_key = current_app.config["DID_API_KEY"]
         self.api_url = current_app.config["DID_API_URL"]
-        self.source_url = current_app.config["DID_SOURCE_URL"]
+        self.source_url = self.profile.source_url
+        self.audios_url = current_app.config["DID_AUDIOS_URL"]
+        self.upload_audio_enabled = current_app.config["DID_AUDIO_UPLOAD"]
+        self.talk_cache = current_app.extensions["talk_cache"]
+        self.limiter = self.profile.limiter("did", current_app.extensions["upstream_limits"]["did"])
 
         if not self.did_api_key:
             logger.error("DID_API_KEY not set")
             raise ValueError("DID_API_KEY environment variable is not set")
 
-        logger.info(f"AvatarService initialized with source URL: {self.source_url}")
+        logger.info(f"AvatarService initialized with profile {self.profile.name} (source URL: {self.source_url})")
 
-    def generate_avatar_video(self, text: str, audio_url: str) -> Dict[str, Any]:
-        auth_header = f"Basic {self.did_api_key}"
-
-        headers = {
-            "accept": "application/json",
-            "Content-Type": "application/json",
-            "Authorization": auth_header
-        }
+    def generate_avatar_video(self, text: str, audio_url: str, audio: Optional[bytes] = None) -> Dict[str, Any]:
+        """
+        Submit a talk that lip-syncs to the generated audio. With audio bytes
+        and DID_AUDIO_UPLOAD on, the audio is uploaded to D-ID first and the
+        talk refers to the upload; audio_url (served by this app) is the
+        fallback if the upload fails.
+        """
+        headers = self.profile.did_headers
 
         # Primary payload using the audio file.
-        payload = {
-            "source_url": self.source_url,
-            "script": {
-                "type": "audio",
-                "audio_url": audio_url
-            },
-            "config": {
-                "fluent": False,
-                "stitch": True
-            },
-            "webhook": current_app.config["DID_WEBHOOK_URL"]
-        }
+        payload = self.profile.audio_payload(audio_url)
+
+        # The audio file name is content-addressed, so the audio URL identifies the speech.
+        fingerprint = self.talk_cache.make_fingerprint(self.source_url, payload["script"])
+        return self.talk_cache.get_or_submit(
+            fingerprint, lambda: self._submit_talk(text, headers, payload, audio)
+        )
+
+    def upload_audio(self, audio: bytes, filename: str) -> str:
+        """Upload audio to D-ID and return the URL a talk script can refer to."""
+        # requests sets the multipart Content-Type itself.
+        headers = {k: v for k, v in self.profile.did_headers.items() if k != "Content-Type"}
+        with self.limiter.slot(), STAGE_SECONDS.time(stage="did_upload"):
+            response = self.http.post(self.audios_url, headers=headers,
+                                      files={"audio": (filename, audio, "audio/mpeg")})
+        raise_if_throttled(response, "did")
+        response.raise_for_status()
+        return response.json()["url"]
+
+    def _with_uploaded_audio(self, payload: Dict[str, Any], audio: Optional[bytes]) -> Dict[str, Any]:
+        """Point the payload at an upload of audio, or leave it on the served URL."""
+        if audio is None or not self.upload_audio_enabled:
+            return payload
+        filename = payload["script"]["audio_url"].rsplit("/", 1)[-1]
+        try:
+            uploaded_url = self.upload_audio(audio, filename)
+        except (requests.exceptions.RequestException, KeyError, ValueError) as e:
+            logger.warning(f"Audio upload to D-ID failed, using the served URL instead: {e}")
+            FALLBACKS.inc(kind="audio_url")
+            return payload
+        logger.info(f"Uploaded {len(audio)} bytes of audio to D-ID")
+        return dict(payload, script=dict(payload["script"], audio_url=uploaded_url))
 
+    def _submit_talk(self, text: str, headers: Dict[str, str], payload: Dict[str, Any],
+                     audio: Optional[bytes] = None) -> Dict[str, Any]:
+        payload = self._with_uploaded_audio(payload, audio)
         logger.info("Sending request to D-ID API with audio script...")
-        logger.info(f"Payload: {json.dumps(payload, indent=2)}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"Payload: {json.dumps(payload, indent=2)}")
 
         try:
-            response = requests.post(self.api_url, headers=headers, json=payload)
+            with self.limiter.slot(), STAGE_SECONDS.time(stage="did_submit"):
+                response = self.http.post(self.api_url, headers=headers, json=payload)
+            raise_if_throttled(response, "did")
             response.raise_for_status()
             result = response.json()
             return {
@@ -66,21 +99,15 @@ class AvatarService:
             # If error indicates audio validation failed, fallback to text script.
             if "cannot validate" in description and "audio" in description:
                 logger.info("Audio validation failed; falling back to text script.")
-                fallback_payload = {
-                    "source_url": self.source_url,
-                    "script": {
-                        "type": "text",
-                        "input": text
-                    },
-                    "config": {
-                        "stitch": True
-                    },
-                    "webhook": current_app.config["DID_WEBHOOK_URL"]
-                }
+                FALLBACKS.inc(kind="text_script")
+                fallback_payload = self.profile.text_payload(text)
                 logger.info("Sending request to D-ID API with text script fallback...")
-                logger.info(f"Fallback Payload: {json.dumps(fallback_payload, indent=2)}")
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug(f"Fallback Payload: {json.dumps(fallback_payload, indent=2)}")
                 try:
-                    response = requests.post(self.api_url, headers=headers, json=fallback_payload)
+                    with self.limiter.slot(), STAGE_SECONDS.time(stage="did_submit"):
+                        response = self.http.post(self.api_url, headers=headers, json=fallback_payload)
+                    raise_if_throttled(response, "did")
                     response.raise_for_status()
                     result = response.json()
                     return {
@@ -0,0 +1,145 @@
+import os
+import json
+import time
+import logging
+import threading
+from typing import Dict, Any, List, Optional
+
+from services.audio_cache import normalize_text
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILE = "index.json"
+
+
+class ClipLibrary:
+    """
+    Avatar clips rendered ahead of time for phrases that many sessions use.
+
+    Videos live in one directory next to an index.json that maps each phrase
+    (normalized like the audio cache keys) to its file and the fingerprint of
+    the payload that rendered it. Phrases of profiles other than the default
+    one are keyed under the profile's scope. lookup() only returns a clip whose
+    fingerprint still matches the current source image, script and voice,
+    so changing any of them makes the live path render again until the
+    library is refreshed. The index is re-read when its mtime changes, so a
+    refresh run from the command line is picked up by a running server.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.hits = 0
+        self.stale = 0
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        self._index_mtime = None
+        os.makedirs(directory, exist_ok=True)
+        self._reload()
+
+    @property
+    def index_path(self) -> str:
+        return os.path.join(self.directory, INDEX_FILE)
+
+    @staticmethod
+    def key_for(text: str, scope: Optional[str] = None) -> str:
+        key = normalize_text(text)
+        return f"{scope}:{key}" if scope else key
+
+    def path_for(self, filename: str) -> str:
+        return os.path.join(self.directory, filename)
+
+    def _reload(self) -> None:
+        """Re-read the index if it changed on disk. Caller holds the lock, or is __init__."""
+        try:
+            mtime = os.path.getmtime(self.index_path)
+        except FileNotFoundError:
+            self._entries, self._index_mtime = {}, None
+            return
+        if mtime == self._index_mtime:
+            return
+        try:
+            with open(self.index_path, encoding="utf-8") as f:
+                self._entries = json.load(f)
+            self._index_mtime = mtime
+            logger.info(f"Clip library loaded {len(self._entries)} clips")
+        except (OSError, ValueError) as e:
+            logger.error(f"Could not read clip library index: {e}")
+
+    def _save(self) -> None:
+        tmp_path = f"{self.index_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._entries, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, self.index_path)
+        self._index_mtime = os.path.getmtime(self.index_path)
+
+    def lookup(self, text: str, fingerprint: str, scope: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """Return the clip for text if one was rendered with the current fingerprint."""
+        with self._lock:
+            self._reload()
+            entry = self._entries.get(self.key_for(text, scope))
+            if entry is None:
+                return None
+            if entry["fingerprint"] != fingerprint:
+                self.stale += 1
+                return None
+            if not os.path.exists(self.path_for(entry["filename"])):
+                return None
+            self.hits += 1
+            return dict(entry)
+
+    def get(self, text: str, scope: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            self._reload()
+            entry = self._entries.get(self.key_for(text, scope))
+            return dict(entry) if entry else None
+
+    def add(self, text: str, fingerprint: str, filename: str, talk_id: Optional[str] = None,
+            scope: Optional[str] = None) -> Dict[str, Any]:
+        """Record a rendered clip whose video is already at path_for(filename)."""
+        entry = {
+            "text": text,
+            "scope": scope,
+            "fingerprint": fingerprint,
+            "filename": filename,
+            "talk_id": talk_id,
+            "size": os.path.getsize(self.path_for(filename)),
+            "rendered_at": time.time(),
+        }
+        with self._lock:
+            self._reload()
+            old = self._entries.get(self.key_for(text, scope))
+            self._entries[self.key_for(text, scope)] = entry
+            self._save()
+        if old and old["filename"] != filename:
+            self._remove_file(old["filename"])
+        return dict(entry)
+
+    def remove(self, text: str, scope: Optional[str] = None) -> bool:
+        with self._lock:
+            self._reload()
+            entry = self._entries.pop(self.key_for(text, scope), None)
+            if entry is None:
+                return False
+            self._save()
+        self._remove_file(entry["filename"])
+        return True
+
+    def _remove_file(self, filename: str) -> None:
+        try:
+            os.remove(self.path_for(filename))
+        except FileNotFoundError:
+            pass
+
+    def entries(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            self._reload()
+            return [dict(entry) for entry in self._entries.values()]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "clips": len(self._entries),
+                "bytes": sum(entry.get("size", 0) for entry in self._entries.values()),
+                "hits": self.hits,
+                "stale": self.stale,
+            }
@@ -0,0 +1,103 @@
+import time
+import logging
+import threading
+from typing import Dict, Any, Callable, Iterable, List, Optional, Tuple
+
+from flask import Flask
+from services.tts_service import TTSService
+from services.avatar_service import AvatarService
+from services.fast_gen import FastGenService
+
+logger = logging.getLogger(__name__)
+
+# Services built once per profile, by kind.
+SERVICES = {
+    "tts": TTSService,
+    "avatar": AvatarService,
+    "fast_gen": FastGenService,
+}
+
+
+class ServiceContainer(dict):
+    """
+    App-scoped home of the shared singletons, installed as app.extensions.
+
+    Extensions registered with a factory are built on first lookup
+    (app.extensions["audio_cache"]) and then kept, so a cold start does not
+    open databases, scan the audio directory or read the profiles before it
+    can answer a health check. Only built entries show up in iteration,
+    .get() and `in`.
+
+    service() returns one shared TTSService, AvatarService or
+    FastGenService per profile, built on first use, instead of one per
+    request. A profile edited in the profiles file gets a new service.
+    """
+
+    def __init__(self, initial: Optional[Dict[str, Any]] = None):
+        super().__init__(initial or {})
+        self._factories: Dict[str, Callable[[], Any]] = {}
+        self._services: Dict[Tuple[str, str], Any] = {}
+        # Reentrant: factories look up the extensions they depend on.
+        self._lock = threading.RLock()
+
+    def register(self, name: str, factory: Callable[[], Any]) -> None:
+        """Build name with factory() the first time it is looked up."""
+        self._factories[name] = factory
+
+    def __missing__(self, name: str) -> Any:
+        factory = self._factories.get(name)
+        if factory is None:
+            raise KeyError(name)
+        with self._lock:
+            if not dict.__contains__(self, name):
+                started = time.perf_counter()
+                dict.__setitem__(self, name, factory())
+                logger.info(f"Built {name} in {(time.perf_counter() - started) * 1000:.1f} ms")
+            return dict.__getitem__(self, name)
+
+    def build_all(self) -> List[str]:
+        """Build every registered extension that is not built yet; returns their names."""
+        pending = [name for name in self._factories if not dict.__contains__(self, name)]
+        for name in pending:
+            self[name]
+        return pending
+
+    def service(self, kind: str, profile=None):
+        """
+        The shared service of the given kind ("tts", "avatar" or "fast_gen")
+        for profile, or for the default profile if None. Must be called
+        inside an app context the first time.
+        """
+        if profile is None:
+            profile = self["profiles"].get()
+        key = (kind, profile.name)
+        service = self._services.get(key)
+        if service is None or service.profile is not profile:
+            with self._lock:
+                service = self._services.get(key)
+                if service is None or service.profile is not profile:
+                    service = SERVICES[kind](profile=profile)
+                    self._services[key] = service
+        return service
+
+
+def warm_up(app: Flask, upstream_urls: Iterable[str] = ()) -> Dict[str, Any]:
+    """
+    Build every extension and the default profile's services, then open a
+    pooled connection to each of upstream_urls, so the first real request
+    pays for none of it. Meant to run in the background right after the
+    server starts listening. Returns what was done and how long it took.
+    """
+    started = time.perf_counter()
+    with app.app_context():
+        built = app.extensions.build_all()
+        for kind in SERVICES:
+            try:
+                app.extensions.service(kind)
+            except ValueError as e:
+                logger.warning(f"Could not warm up the {kind} service: {e}")
+    connected = app.extensions["http_client"].preconnect(upstream_urls)
+    seconds = round(time.perf_counter() - started, 3)
+    logger.info(f"Warm-up built {len(built)} extensions and opened {connected} upstream connections "
+                f"in {seconds} s")
+    return {"built": built, "connections": connected, "seconds": seconds}
@@ -0,0 +1,184 @@
+import os
+import json
+import time
+import uuid
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional
+
+from services.http_client import HTTPClient
+
+logger = logging.getLogger(__name__)
+
+MIN_CHUNK_SIZE = 64 * 1024
+MAX_CHUNK_SIZE = 1024 * 1024
+
+
+class DownloadError(Exception):
+    """Raised when a download fails or the result does not match the server."""
+
+
+def unique_filename(prefix: str = "talk", extension: str = ".mp4") -> str:
+    """Millisecond timestamp plus a random suffix, so parallel downloads never collide."""
+    return f"{prefix}_{int(time.time() * 1000)}_{uuid.uuid4().hex[:8]}{extension}"
+
+
+class Downloader:
+    """
+    Downloads large files over several concurrent HTTP range requests.
+
+    Data goes to <name>.part, with progress for each range kept in
+    <name>.part.json, so an interrupted download resumes where each range
+    stopped as long as the server still reports the same size and ETag.
+    The finished file is checked against the expected size (and the ETag,
+    when it is a plain MD5), fsync'd and renamed into place.
+    """
+
+    def __init__(self, http_client: Optional[HTTPClient] = None, parts: int = 4,
+                 min_part_size: int = 4 * 1024 * 1024):
+        self.http = http_client or HTTPClient()
+        self.parts = parts
+        self.min_part_size = min_part_size
+
+    def _probe(self, url: str) -> Dict[str, Any]:
+        """
+        Fetch the first byte to learn the size, ETag and range support.
+        A one-byte GET works with presigned URLs, which often reject HEAD.
+        """
+        response = self.http.get(url, headers={"Range": "bytes=0-0"}, stream=True)
+        with response:
+            if response.status_code == 206:
+                total = int(response.headers["Content-Range"].rsplit("/", 1)[1])
+                return {"size": total, "etag": response.headers.get("ETag"), "ranges": True}
+            if response.status_code == 200:
+                length = response.headers.get("Content-Length")
+                return {"size": int(length) if length else None,
+                        "etag": response.headers.get("ETag"), "ranges": False}
+            raise DownloadError(f"Failed to download video. Status: {response.status_code}")
+
+    def _plan(self, size: int) -> List[Dict[str, int]]:
+        parts = max(1, min(self.parts, size // self.min_part_size))
+        part_size = -(-size // parts)
+        return [
+            {"start": start, "end": min(start + part_size, size), "done": 0}
+            for start in range(0, size, part_size)
+        ]
+
+    def _load_progress(self, meta_path: str, info: Dict[str, Any]) -> Optional[List[Dict[str, int]]]:
+        """Return saved range progress if it belongs to the same remote file."""
+        try:
+            with open(meta_path, encoding="utf-8") as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if saved.get("size") != info["size"] or saved.get("etag") != info["etag"]:
+            logger.info("Remote file changed since the partial download; starting over")
+            return None
+        return saved["ranges"]
+
+    def download(self, url: str, save_dir: str, filename: Optional[str] = None) -> str:
+        """Download url into save_dir and return the final path."""
+        os.makedirs(save_dir, exist_ok=True)
+        save_path = os.path.join(save_dir, filename or unique_filename())
+        part_path = f"{save_path}.part"
+        meta_path = f"{part_path}.json"
+
+        info = self._probe(url)
+        if not info["ranges"] or not info["size"]:
+            self._download_single(url, part_path)
+        else:
+            ranges = None
+            if os.path.exists(part_path):
+                ranges = self._load_progress(meta_path, info)
+            if ranges is None:
+                ranges = self._plan(info["size"])
+                with open(part_path, "wb") as f:
+                    f.truncate(info["size"])
+            else:
+                resumed = sum(r["done"] for r in ranges)
+                logger.info(f"Resuming download of {save_path} at {resumed}/{info['size']} bytes")
+            self._download_ranges(url, part_path, meta_path, info, ranges)
+
+        self._verify(part_path, info)
+        with open(part_path, "rb+") as f:
+            os.fsync(f.fileno())
+        os.replace(part_path, save_path)
+        if os.path.exists(meta_path):
+            os.remove(meta_path)
+        logger.info(f"Video saved to {save_path}")
+        return save_path
+
+    def _download_single(self, url: str, part_path: str) -> None:
+        """Fallback for servers without range support: one streamed GET."""
+        response = self.http.get(url, stream=True)
+        with response:
+            if response.status_code != 200:
+                raise DownloadError(f"Failed to download video. Status: {response.status_code}")
+            with open(part_path, "wb") as f:
+                for chunk in response.iter_content(chunk_size=MAX_CHUNK_SIZE):
+                    if chunk:
+                        f.write(chunk)
+
+    def _download_ranges(self, url: str, part_path: str, meta_path: str,
+                         info: Dict[str, Any], ranges: List[Dict[str, int]]) -> None:
+        lock = threading.Lock()
+
+        def save_progress() -> None:
+            with lock:
+                tmp_path = f"{meta_path}.tmp"
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump({"size": info["size"], "etag": info["etag"], "ranges": ranges}, f)
+                os.replace(tmp_path, meta_path)
+
+        def fetch(byte_range: Dict[str, int]) -> None:
+            start = byte_range["start"] + byte_range["done"]
+            end = byte_range["end"]
+            if start >= end:
+                return
+            headers = {"Range": f"bytes={start}-{end - 1}"}
+            if info["etag"] and not info["etag"].startswith("W/"):
+                # Makes the server send the whole (new) file if it changed.
+                headers["If-Range"] = info["etag"]
+            response = self.http.get(url, headers=headers, stream=True)
+            with response:
+                if response.status_code != 206:
+                    raise DownloadError(f"Range request failed with status {response.status_code}")
+                chunk_size = max(MIN_CHUNK_SIZE, min(MAX_CHUNK_SIZE, (end - start) // 16))
+                unsaved = 0
+                with open(part_path, "rb+") as f:
+                    f.seek(start)
+                    for chunk in response.iter_content(chunk_size=chunk_size):
+                        if not chunk:
+                            continue
+                        f.write(chunk)
+                        byte_range["done"] += len(chunk)
+                        unsaved += len(chunk)
+                        if unsaved >= 4 * chunk_size:
+                            f.flush()
+                            save_progress()
+                            unsaved = 0
+                    f.flush()
+            save_progress()
+            if byte_range["start"] + byte_range["done"] != end:
+                raise DownloadError(f"Range {start}-{end - 1} ended early")
+
+        save_progress()
+        with ThreadPoolExecutor(max_workers=len(ranges)) as pool:
+            for future in [pool.submit(fetch, r) for r in ranges]:
+                future.result()
+
+    def _verify(self, part_path: str, info: Dict[str, Any]) -> None:
+        size = os.path.getsize(part_path)
+        if info["size"] is not None and size != info["size"]:
+            raise DownloadError(f"Downloaded {size} bytes, expected {info['size']}")
+        etag = (info["etag"] or "").strip('"')
+        if len(etag) == 32 and all(c in "0123456789abcdef" for c in etag.lower()):
+            digest = hashlib.md5()
+            with open(part_path, "rb") as f:
+                for block in iter(lambda: f.read(MAX_CHUNK_SIZE), b""):
+                    digest.update(block)
+            if digest.hexdigest() != etag.lower():
+                os.remove(part_path)
+                raise DownloadError("Checksum mismatch: downloaded file does not match ETag")
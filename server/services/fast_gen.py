@@ -1,30 +1,39 @@
 import json
+import time
 import requests
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, Any
 from flask import current_app
+from services.text_chunker import chunk_text
+from services.metrics import STAGE_SECONDS
+from services.scheduler import raise_if_throttled
 
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 class FastGenService:
-    def __init__(self):
+    def __init__(self, http_client=None, profile=None):
+        self.http = http_client or current_app.extensions["http_client"]
+        self.profile = profile or current_app.extensions["profiles"].get()
         self.did_api_key = current_app.config["DID_API_KEY"]
         self.api_url = current_app.config["DID_API_URL"]
-        self.source_url = current_app.config["DID_SOURCE_URL"]
+        self.source_url = self.profile.source_url
         self.max_chars = current_app.config.get("ELEVENLABS_MAX_CHARS", 350)
+        self.talk_cache = current_app.extensions["talk_cache"]
+        self.max_workers = current_app.config["TTS_MAX_WORKERS"]
+        self.limiter = self.profile.limiter("did", current_app.extensions["upstream_limits"]["did"])
 
         if not self.did_api_key:
             logger.error("DID_API_KEY not set")
             raise ValueError("DID_API_KEY environment variable is not set")
 
-        logger.info(f"FastGenService initialized with source URL: {self.source_url}")
+        logger.info(f"FastGenService initialized with profile {self.profile.name} (source URL: {self.source_url})")
 
     def _validate_text(self, text: str) -> str:
-        """Truncate text if it exceeds the max character limit."""
-        if len(text) > self.max_chars:
-            logger.warning(f"Text length exceeds {self.max_chars} characters. Truncating...")
-            return text[:self.max_chars]
+        """Strip surrounding whitespace and reject empty text."""
+        text = text.strip()
+        if not text:
+            raise ValueError("Text is empty")
         return text
 
     def generate_avatar_video_text(self, text: str) -> Dict[str, Any]:
@@ -32,46 +41,61 @@ class FastGenService:
         Fast generation: sends text directly to D-ID using a text script payload.
         This payload includes provider details for ElevenLabs so that D-ID
         internally calls ElevenLabs TTS.
+        Text over the character limit is split at sentence boundaries and each
+        segment is submitted as its own D-ID job; the first segment's talk is
+        returned at the top level and all of them, in order, under "segments".
         """
         validated_text = self._validate_text(text)
-        auth_header = f"Basic {self.did_api_key}"
-        headers = {
-            "accept": "application/json",
-            "Content-Type": "application/json",
-            "Authorization": auth_header
-        }
+        segments = chunk_text(validated_text, self.max_chars)
+        if len(segments) == 1:
+            return self._generate_segment(segments[0])
 
-        # Construct the payload with a text script and ElevenLabs provider details.
-        payload = {
-            "source_url": self.source_url,
-            "script": {
-                "type": "text",
-                "input": validated_text,
-                "provider": {
-                    "type": "elevenlabs",
-                    "voice_id": current_app.config["ELEVENLABS_VOICE_ID"],
-                    "voice_config": {
-                        "model_id": "eleven_multilingual_v2",
-                        "stability": 0.8,
-                        "similarity_boost": 0.75,
-                        "style": 0.0,
-                        "use_speaker_boost": True,
-                        "speed": 0.8
-                    }
-                }
-            },
-            "config": {
-                "stitch": True,
-                "fluent": True
-            },
-            "webhook": current_app.config["DID_WEBHOOK_URL"]
+        logger.info(f"Text length exceeds {self.max_chars} characters. Submitting {len(segments)} segments...")
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            results = list(pool.map(self._generate_timed_segment, enumerate(segments)))
+        return {
+            "talk_id": results[0]["talk_id"],
+            "status": results[0]["status"],
+            "segments": results
         }
 
+    def _generate_timed_segment(self, indexed_segment) -> Dict[str, Any]:
+        index, segment = indexed_segment
+        started = time.perf_counter()
+        result = self._generate_segment(segment)
+        result.update({
+            "index": index,
+            "chars": len(segment),
+            "seconds": round(time.perf_counter() - started, 3)
+        })
+        return result
+
+    def build_payload(self, text: str) -> Dict[str, Any]:
+        """The /talks payload for one segment: a text script with ElevenLabs provider details."""
+        return self.profile.fast_payload(text)
+
+    def fingerprint_for(self, text: str) -> str:
+        """
+        Hash of everything that determines the rendered video for text: the
+        source image, the script and the voice. Changes whenever any of them do.
+        """
+        return self.talk_cache.make_fingerprint(self.source_url, self.build_payload(text)["script"])
+
+    def _generate_segment(self, text: str) -> Dict[str, Any]:
+        headers = self.profile.did_headers
+        payload = self.build_payload(text)
+        fingerprint = self.talk_cache.make_fingerprint(self.source_url, payload["script"])
+        return self.talk_cache.get_or_submit(fingerprint, lambda: self._submit_talk(headers, payload))
+
+    def _submit_talk(self, headers: Dict[str, str], payload: Dict[str, Any]) -> Dict[str, Any]:
         logger.info("Sending request to D-ID API with text script (fast generation)...")
-        logger.info(f"Payload: {json.dumps(payload, indent=2)}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"Payload: {json.dumps(payload, indent=2)}")
 
         try:
-            response = requests.post(self.api_url, headers=headers, json=payload)
+            with self.limiter.slot(), STAGE_SECONDS.time(stage="did_submit"):
+                response = self.http.post(self.api_url, headers=headers, json=payload)
+            raise_if_throttled(response, "did")
             response.raise_for_status()
             result = response.json()
             return {
@@ -0,0 +1,127 @@
+import logging
+import threading
+from typing import Dict, Any, Iterable, Optional, Tuple
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from services.metrics import UPSTREAM_RESPONSES
+
+logger = logging.getLogger(__name__)
+
+# Methods that are safe to replay after the upstream may have processed them.
+IDEMPOTENT_METHODS = frozenset(["GET", "HEAD", "OPTIONS", "PUT", "DELETE"])
+
+
+class UpstreamRetry(Retry):
+    """
+    Retry policy for upstream APIs. Idempotent requests are retried on any
+    configured status; POSTs only on 429, where the upstream rejected the
+    request outright, so a retry cannot start a duplicate D-ID render.
+    """
+
+    def is_retry(self, method, status_code, has_retry_after=False):
+        if method.upper() not in IDEMPOTENT_METHODS and status_code != 429:
+            return False
+        return super().is_retry(method, status_code, has_retry_after)
+
+
+class HTTPClient:
+    """
+    Registry of pooled keep-alive sessions, one per upstream host.
+
+    Built once per app so that every service instance reuses the same
+    connections to api.elevenlabs.io and api.d-id.com instead of paying
+    DNS, TCP and TLS setup on each call.
+    """
+
+    def __init__(self, pool_size: int = 10, timeout: Tuple[float, float] = (5, 60),
+                 retries: int = 3, backoff: float = 0.5,
+                 retry_statuses: Iterable[int] = (429, 500, 502, 503, 504)):
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.retry_statuses = tuple(retry_statuses)
+        self._sessions: Dict[str, requests.Session] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> "HTTPClient":
+        return cls(
+            pool_size=config["HTTP_POOL_SIZE"],
+            timeout=(config["HTTP_CONNECT_TIMEOUT"], config["HTTP_READ_TIMEOUT"]),
+            retries=config["HTTP_RETRIES"],
+            backoff=config["HTTP_RETRY_BACKOFF"],
+            retry_statuses=config["HTTP_RETRY_STATUSES"],
+        )
+
+    def _build_session(self) -> requests.Session:
+        retry = UpstreamRetry(
+            total=self.retries,
+            connect=self.retries,
+            read=0,
+            backoff_factor=self.backoff,
+            status_forcelist=self.retry_statuses,
+            allowed_methods=None,
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size, max_retries=retry)
+        session = requests.Session()
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+
+    def session_for(self, url: str) -> requests.Session:
+        """Return the pooled session for the host of url, creating it on first use."""
+        parts = urlsplit(url)
+        host = f"{parts.scheme}://{parts.netloc}"
+        session = self._sessions.get(host)
+        if session is None:
+            with self._lock:
+                session = self._sessions.get(host)
+                if session is None:
+                    session = self._build_session()
+                    self._sessions[host] = session
+                    logger.info(f"Opened HTTP connection pool for {host}")
+        return session
+
+    def request(self, method: str, url: str, timeout: Optional[Any] = None, **kwargs) -> requests.Response:
+        upstream = urlsplit(url).netloc
+        try:
+            response = self.session_for(url).request(method, url, timeout=timeout or self.timeout, **kwargs)
+        except requests.RequestException:
+            UPSTREAM_RESPONSES.inc(upstream=upstream, status="error")
+            raise
+        UPSTREAM_RESPONSES.inc(upstream=upstream, status=str(response.status_code))
+        return response
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request("POST", url, **kwargs)
+
+    def preconnect(self, urls: Iterable[str]) -> int:
+        """
+        Open a keep-alive connection to the host of each URL with a HEAD
+        request, so the first real call skips DNS, TCP and TLS setup. The
+        response status is ignored. Returns how many hosts answered.
+        """
+        connected = 0
+        for url in urls:
+            try:
+                self.session_for(url).head(url, timeout=self.timeout)
+                connected += 1
+            except requests.RequestException as e:
+                logger.warning(f"Could not pre-open a connection to {urlsplit(url).netloc}: {e}")
+        return connected
+
+    def close(self) -> None:
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions.clear()
@@ -0,0 +1,354 @@
+import os
+import json
+import time
+import uuid
+import logging
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Dict, Any, Callable, Iterator, List, Optional, Tuple
+
+from services.scheduler import Overloaded
+from services.metrics import ADMISSION_REJECTED
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+DEAD = "dead"
+
+
+class JobQueue:
+    """
+    Durable queue of generation jobs in SQLite, shared by the web process
+    that enqueues them and the worker processes (worker.py) that run them.
+
+    A worker claims a job for lease seconds. If the worker dies, the job is
+    claimed again once its lease runs out, so a restart or redeploy does not
+    lose it. A failed job is retried with exponential backoff up to
+    max_attempts times and then moved to the dead-letter list, where it
+    stays until it is requeued. Enqueueing with an idempotency key that is
+    already known returns the existing job instead of adding a second one.
+
+    Workers record progress as events, and the web process relays them to
+    Socket.IO clients (see start_relay). Each event is taken by exactly one
+    relay.
+    """
+
+    def __init__(self, db_path: str, max_attempts: int = 3, retry_backoff: float = 2,
+                 lease: float = 300, retention: float = 24 * 3600):
+        self.db_path = db_path
+        self.max_attempts = max_attempts
+        self.retry_backoff = retry_backoff
+        self.lease = lease
+        self.retention = retention
+        self._lock = threading.Lock()
+        self._relay_started = False
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS generation_jobs (
+                job_id TEXT PRIMARY KEY,
+                idempotency_key TEXT UNIQUE,
+                payload TEXT,
+                status TEXT,
+                attempts INTEGER,
+                available_at REAL,
+                lease_expires_at REAL,
+                worker TEXT,
+                result TEXT,
+                error TEXT,
+                created_at REAL,
+                updated_at REAL
+            )
+        """)
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS generation_jobs_status ON generation_jobs (status, available_at)"
+        )
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS generation_events (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                job_id TEXT,
+                status TEXT,
+                data TEXT,
+                created_at REAL
+            )
+        """)
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        """
+        Hold the write lock for the with block. BEGIN IMMEDIATE makes other
+        processes wait for it, so two workers cannot claim the same job.
+        """
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._conn
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    _COLUMNS = ("job_id, idempotency_key, payload, status, attempts, available_at, "
+                "lease_expires_at, worker, result, error, created_at, updated_at")
+
+    def _row(self, row: Optional[Tuple]) -> Optional[Dict[str, Any]]:
+        if row is None:
+            return None
+        return {
+            "job_id": row[0],
+            "idempotency_key": row[1],
+            "payload": json.loads(row[2]) if row[2] else {},
+            "status": row[3],
+            "attempts": row[4],
+            "available_at": row[5],
+            "lease_expires_at": row[6],
+            "worker": row[7],
+            "result": json.loads(row[8]) if row[8] else None,
+            "error": row[9],
+            "created_at": row[10],
+            "updated_at": row[11],
+        }
+
+    def _get(self, conn: sqlite3.Connection, job_id: str) -> Optional[Dict[str, Any]]:
+        return self._row(conn.execute(
+            f"SELECT {self._COLUMNS} FROM generation_jobs WHERE job_id = ?", (job_id,)
+        ).fetchone())
+
+    def _position(self, conn: sqlite3.Connection, job: Dict[str, Any]) -> int:
+        if job["status"] != QUEUED:
+            return 0
+        return conn.execute(
+            "SELECT COUNT(*) FROM generation_jobs WHERE status = ? AND created_at <= ?",
+            (QUEUED, job["created_at"])
+        ).fetchone()[0]
+
+    def enqueue(self, payload: Dict[str, Any], idempotency_key: Optional[str] = None,
+                max_queued: Optional[int] = None) -> Tuple[Dict[str, Any], bool]:
+        """
+        Add a job and return it with its 1-based "position" among the queued
+        jobs, plus True if it was added or False if idempotency_key matched
+        an existing job. Raises Overloaded if max_queued jobs are waiting.
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            if idempotency_key:
+                row = conn.execute(
+                    f"SELECT {self._COLUMNS} FROM generation_jobs WHERE idempotency_key = ?",
+                    (idempotency_key,)
+                ).fetchone()
+                if row is not None:
+                    job = self._row(row)
+                    job["position"] = self._position(conn, job)
+                    return job, False
+            queued = conn.execute(
+                "SELECT COUNT(*) FROM generation_jobs WHERE status = ?", (QUEUED,)
+            ).fetchone()[0]
+            if max_queued is not None and queued >= max_queued:
+                ADMISSION_REJECTED.inc(reason="queue_full")
+                raise Overloaded("Generation queue is full; try again shortly", self.retry_backoff * queued)
+            job_id = uuid.uuid4().hex
+            conn.execute(
+                "INSERT INTO generation_jobs "
+                "(job_id, idempotency_key, payload, status, attempts, available_at, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, 0, ?, ?, ?)",
+                (job_id, idempotency_key or None, json.dumps(payload), QUEUED, now, now, now)
+            )
+            job = self._get(conn, job_id)
+            job["position"] = queued + 1
+            return job, True
+
+    def claim(self, worker: str) -> Optional[Dict[str, Any]]:
+        """
+        Take the oldest job that is due, or whose previous worker's lease ran
+        out, for worker; None if there is nothing to do. A job whose lease
+        ran out on its last attempt (its worker was killed, e.g. out of
+        memory) is dead-lettered instead of being tried again.
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            self._bury_expired(conn, now)
+            row = conn.execute(
+                f"SELECT {self._COLUMNS} FROM generation_jobs "
+                "WHERE (status = ? AND available_at <= ?) OR (status = ? AND lease_expires_at < ?) "
+                "ORDER BY created_at LIMIT 1",
+                (QUEUED, now, RUNNING, now)
+            ).fetchone()
+            if row is None:
+                return None
+            job = self._row(row)
+            if job["status"] == RUNNING:
+                logger.warning(f"Lease of job {job['job_id']} held by {job['worker']} expired; reclaiming it")
+            conn.execute(
+                "UPDATE generation_jobs SET status = ?, attempts = attempts + 1, worker = ?, "
+                "lease_expires_at = ?, updated_at = ? WHERE job_id = ?",
+                (RUNNING, worker, now + self.lease, now, job["job_id"])
+            )
+            return self._get(conn, job["job_id"])
+
+    def _bury_expired(self, conn: sqlite3.Connection, now: float) -> None:
+        """Dead-letter running jobs out of attempts whose lease expired, with an error event for each."""
+        rows = conn.execute(
+            "SELECT job_id, worker, attempts FROM generation_jobs "
+            "WHERE status = ? AND lease_expires_at < ? AND attempts >= ?",
+            (RUNNING, now, self.max_attempts)
+        ).fetchall()
+        for job_id, worker, attempts in rows:
+            error = f"Worker {worker} stopped during attempt {attempts} of {self.max_attempts}"
+            logger.error(f"Lease of job {job_id} expired on its last attempt; dead-lettering it")
+            conn.execute(
+                "UPDATE generation_jobs SET status = ?, error = ?, lease_expires_at = NULL, updated_at = ? "
+                "WHERE job_id = ?",
+                (DEAD, error, now, job_id)
+            )
+            conn.execute(
+                "INSERT INTO generation_events (job_id, status, data, created_at) VALUES (?, ?, ?, ?)",
+                (job_id, "error", json.dumps({"error": error, "dead_letter": True}), now)
+            )
+
+    def complete(self, job_id: str, worker: str, result: Dict[str, Any]) -> bool:
+        """Mark a claimed job done; False if worker no longer holds it."""
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE generation_jobs SET status = ?, result = ?, error = NULL, lease_expires_at = NULL, "
+                "updated_at = ? WHERE job_id = ? AND status = ? AND worker = ?",
+                (DONE, json.dumps(result), time.time(), job_id, RUNNING, worker)
+            )
+            return cursor.rowcount > 0
+
+    def fail(self, job_id: str, worker: str, error: str, retry_after: Optional[float] = None,
+             permanent: bool = False) -> Optional[str]:
+        """
+        Record a failed attempt. The job is queued again after retry_after
+        seconds (default: exponential backoff), or moved to the dead-letter
+        list if it is out of attempts or the failure is permanent. Returns
+        the new status, or None if worker no longer holds the job.
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            job = self._get(conn, job_id)
+            if job is None or job["status"] != RUNNING or job["worker"] != worker:
+                return None
+            if permanent or job["attempts"] >= self.max_attempts:
+                status, available_at = DEAD, job["available_at"]
+            else:
+                status = QUEUED
+                delay = retry_after if retry_after is not None else self.retry_backoff * 2 ** (job["attempts"] - 1)
+                available_at = now + delay
+            conn.execute(
+                "UPDATE generation_jobs SET status = ?, error = ?, available_at = ?, lease_expires_at = NULL, "
+                "updated_at = ? WHERE job_id = ?",
+                (status, error, available_at, now, job_id)
+            )
+            return status
+
+    def requeue(self, job_id: Optional[str] = None) -> int:
+        """Give dead-lettered jobs (one, or all if job_id is None) a fresh set of attempts."""
+        now = time.time()
+        query = ("UPDATE generation_jobs SET status = ?, attempts = 0, available_at = ?, updated_at = ? "
+                 "WHERE status = ?")
+        params: Tuple = (QUEUED, now, now, DEAD)
+        if job_id:
+            query += " AND job_id = ?"
+            params += (job_id,)
+        with self._transaction() as conn:
+            return conn.execute(query, params).rowcount
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            job = self._get(self._conn, job_id)
+            if job is not None:
+                job["position"] = self._position(self._conn, job)
+            return job
+
+    def waiting(self) -> List[str]:
+        """IDs of the queued jobs, oldest first."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT job_id FROM generation_jobs WHERE status = ? ORDER BY created_at", (QUEUED,)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def dead_letters(self, limit: int = 50) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {self._COLUMNS} FROM generation_jobs WHERE status = ? "
+                "ORDER BY updated_at DESC LIMIT ?", (DEAD, limit)
+            ).fetchall()
+        return [self._row(row) for row in rows]
+
+    def prune(self) -> int:
+        """Drop finished jobs older than retention; their idempotency keys can then be reused."""
+        with self._transaction() as conn:
+            return conn.execute(
+                "DELETE FROM generation_jobs WHERE status = ? AND updated_at < ?",
+                (DONE, time.time() - self.retention)
+            ).rowcount
+
+    def record_event(self, job_id: str, status: str, **data: Any) -> None:
+        """Record a job_status event for the web process to relay."""
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT INTO generation_events (job_id, status, data, created_at) VALUES (?, ?, ?, ?)",
+                (job_id, status, json.dumps(data), time.time())
+            )
+
+    def take_events(self, limit: int = 100) -> List[Dict[str, Any]]:
+        """Remove and return the oldest events."""
+        with self._transaction() as conn:
+            rows = conn.execute(
+                "SELECT seq, job_id, status, data FROM generation_events ORDER BY seq LIMIT ?", (limit,)
+            ).fetchall()
+            if rows:
+                conn.execute("DELETE FROM generation_events WHERE seq <= ?", (rows[-1][0],))
+        return [{"job_id": row[1], "status": row[2], **json.loads(row[3])} for row in rows]
+
+    def start_relay(self, spawn: Callable[..., Any], on_event: Callable[[Dict[str, Any]], None],
+                    interval: float = 0.1) -> None:
+        """
+        Start a background task (via spawn) that passes each recorded event
+        to on_event; later calls do nothing.
+        """
+        with self._lock:
+            if self._relay_started:
+                return
+            self._relay_started = True
+        spawn(self._relay, on_event, interval)
+
+    def _relay(self, on_event: Callable[[Dict[str, Any]], None], interval: float) -> None:
+        while True:
+            try:
+                events = self.take_events()
+            except sqlite3.Error as e:
+                logger.error(f"Could not read job events: {e}")
+                events = []
+            for event in events:
+                try:
+                    on_event(event)
+                except Exception as e:
+                    logger.warning(f"Could not relay {event['status']} event of job {event['job_id']}: {e}")
+            if len(events) < 100:
+                time.sleep(interval)
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.time()
+        with self._lock:
+            counts = dict(self._conn.execute(
+                "SELECT status, COUNT(*) FROM generation_jobs GROUP BY status"
+            ).fetchall())
+            oldest = self._conn.execute(
+                "SELECT MIN(created_at) FROM generation_jobs WHERE status = ?", (QUEUED,)
+            ).fetchone()[0]
+            events = self._conn.execute("SELECT COUNT(*) FROM generation_events").fetchone()[0]
+        return {
+            "queued": counts.get(QUEUED, 0),
+            "running": counts.get(RUNNING, 0),
+            "done": counts.get(DONE, 0),
+            "dead": counts.get(DEAD, 0),
+            "oldest_queued_seconds": round(now - oldest, 1) if oldest else 0.0,
+            "pending_events": events,
+            "max_attempts": self.max_attempts,
+        }
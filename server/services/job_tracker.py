@@ -0,0 +1,205 @@
+import os
+import json
+import time
+import random
+import logging
+import sqlite3
+import threading
+from typing import Dict, Any, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+TERMINAL_STATUSES = ("done", "error", "rejected")
+
+
+class JobPollError(Exception):
+    """Raised when the D-ID talk status cannot be fetched."""
+
+
+def make_did_poller(http_client, api_url: str, api_key: str, limiter=None) -> Callable[[str], Dict[str, Any]]:
+    """
+    Return a function that fetches the current D-ID record for a talk.
+    Polls count against the D-ID rate limit, so they go through limiter if given.
+    """
+    headers = {
+        "accept": "application/json",
+        "Authorization": f"Basic {api_key}"
+    }
+
+    def poll(talk_id: str) -> Dict[str, Any]:
+        if limiter is not None:
+            with limiter.slot():
+                response = http_client.get(f"{api_url}/{talk_id}", headers=headers)
+        else:
+            response = http_client.get(f"{api_url}/{talk_id}", headers=headers)
+        if response.status_code != 200:
+            raise JobPollError(f"Error polling talk {talk_id}: {response.status_code} {response.text}")
+        return response.json()
+
+    return poll
+
+
+class JobTracker:
+    """
+    Record of D-ID talks keyed by talk_id, kept in memory and in SQLite.
+
+    The webhook is the primary source of updates. wait_for_result() gives
+    the webhook a grace period and only then falls back to polling D-ID,
+    backing off exponentially with jitter between polls. The SQLite file
+    can be shared by the server and the batch scripts.
+
+    Only unfinished talks are kept in memory; finished ones are read back
+    from SQLite. Rows not updated for retention seconds are deleted, at
+    most every prune_interval seconds as new talks are recorded.
+    """
+
+    def __init__(self, db_path: str, retention: float = 7 * 24 * 3600, prune_interval: float = 600):
+        self.db_path = db_path
+        self.retention = retention
+        self.prune_interval = prune_interval
+        self._pruned_at = 0.0
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        self._cond = threading.Condition()
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                talk_id TEXT PRIMARY KEY,
+                status TEXT,
+                result_url TEXT,
+                data TEXT,
+                source TEXT,
+                created_at REAL,
+                updated_at REAL
+            )
+        """)
+        self._conn.commit()
+
+    def _save(self, job: Dict[str, Any]) -> None:
+        self._conn.execute(
+            "INSERT OR REPLACE INTO jobs "
+            "(talk_id, status, result_url, data, source, created_at, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (job["talk_id"], job["status"], job.get("result_url"), json.dumps(job.get("data") or {}),
+             job["source"], job["created_at"], job["updated_at"])
+        )
+        self._conn.commit()
+
+    def _load(self, talk_id: str) -> Optional[Dict[str, Any]]:
+        row = self._conn.execute(
+            "SELECT status, result_url, data, source, created_at, updated_at FROM jobs WHERE talk_id = ?",
+            (talk_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        return {
+            "talk_id": talk_id,
+            "status": row[0],
+            "result_url": row[1],
+            "data": json.loads(row[2]) if row[2] else {},
+            "source": row[3],
+            "created_at": row[4],
+            "updated_at": row[5],
+        }
+
+    def _remember(self, job: Dict[str, Any]) -> None:
+        """Keep an unfinished job in memory; forget it once it is finished."""
+        if job["status"] in TERMINAL_STATUSES:
+            self._jobs.pop(job["talk_id"], None)
+        else:
+            self._jobs[job["talk_id"]] = job
+
+    def record_submitted(self, talk_id: str, status: Optional[str] = None) -> Dict[str, Any]:
+        """Record a talk that was just created on D-ID."""
+        now = time.time()
+        if now - self._pruned_at > self.prune_interval:
+            self.prune()
+        with self._cond:
+            job = self._jobs.get(talk_id) or self._load(talk_id)
+            if job is None:
+                job = {
+                    "talk_id": talk_id,
+                    "status": status or "created",
+                    "result_url": None,
+                    "data": {},
+                    "source": "submit",
+                    "created_at": now,
+                    "updated_at": now,
+                }
+                self._save(job)
+            self._remember(job)
+            return dict(job)
+
+    def update(self, talk_id: str, data: Dict[str, Any], source: str = "webhook") -> Dict[str, Any]:
+        """Apply a D-ID talk record (from the webhook or a poll) and wake any waiters."""
+        now = time.time()
+        with self._cond:
+            job = self._jobs.get(talk_id) or self._load(talk_id) or {
+                "talk_id": talk_id, "created_at": now
+            }
+            job.update({
+                "status": data.get("status") or job.get("status"),
+                "result_url": data.get("result_url") or job.get("result_url"),
+                "data": data,
+                "source": source,
+                "updated_at": now,
+            })
+            self._remember(job)
+            self._save(job)
+            self._cond.notify_all()
+            return dict(job)
+
+    def get(self, talk_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Return the job for talk_id, read from SQLite, since another process
+        may have received its webhook.
+        """
+        with self._cond:
+            job = self._load(talk_id) or self._jobs.get(talk_id)
+            if job is not None:
+                self._remember(job)
+            return dict(job) if job else None
+
+    def prune(self) -> int:
+        """Delete talks not updated for retention seconds; returns how many."""
+        with self._cond:
+            self._pruned_at = time.time()
+            cursor = self._conn.execute("DELETE FROM jobs WHERE updated_at < ?", (self._pruned_at - self.retention,))
+            self._conn.commit()
+        if cursor.rowcount:
+            logger.info(f"Pruned {cursor.rowcount} old talks from the job table")
+        return cursor.rowcount
+
+    def wait_for_result(self, talk_id: str, poll: Callable[[str], Dict[str, Any]],
+                        timeout: float = 300, grace: float = 0,
+                        initial_interval: float = 2, max_interval: float = 30) -> Dict[str, Any]:
+        """
+        Block until the talk reaches a terminal status and return its job.
+        Waits up to grace seconds for a webhook, then polls D-ID with
+        exponential backoff and jitter. A webhook arriving between polls ends
+        the wait immediately. Raises TimeoutError if timeout is exceeded.
+        """
+        deadline = time.time() + timeout
+
+        def finished() -> bool:
+            job = self.get(talk_id)
+            return job is not None and job["status"] in TERMINAL_STATUSES
+
+        with self._cond:
+            self._cond.wait_for(finished, min(grace, timeout))
+        interval = initial_interval
+        while not finished():
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                raise TimeoutError(f"Talk {talk_id} did not finish within {timeout} seconds")
+            self.update(talk_id, poll(talk_id), source="poll")
+            status = self.get(talk_id)["status"]
+            logger.info(f"Talk {talk_id} status: {status}")
+            if status in TERMINAL_STATUSES:
+                break
+            delay = interval / 2 + random.uniform(0, interval / 2)
+            with self._cond:
+                self._cond.wait_for(finished, min(delay, max(remaining, 0)))
+            interval = min(interval * 2, max_interval)
+        return self.get(talk_id)
@@ -0,0 +1,235 @@
+import re
+import sys
+import json
+import time
+import atexit
+import random
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, Iterator, Mapping, Optional
+
+from services.metrics import LOG_RECORDS_DROPPED
+
+# Fields of the current job or talk, added to every record logged in it.
+_context = threading.local()
+
+# Record attributes that are not extra fields passed by the caller.
+_STANDARD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+_SECRET_PATTERNS = [
+    # Authorization headers and API keys in headers, JSON, reprs and query strings
+    re.compile(r"""(?i)(["']?(?:authorization|xi-api-key|x-api-key|api[_-]?key)["']?\s*[:=]\s*["']?)"""
+               r"""(?:(?:basic|bearer)\s+)?[^\s"',;&}]+"""),
+]
+REDACTED = "[REDACTED]"
+
+_STOP = object()
+
+
+def _native_modules():
+    """
+    The unpatched threading and queue modules. Under eventlet the writer
+    must be an OS thread: a green thread blocked writing to a slow stderr
+    pipe would stall every request on the hub.
+    """
+    try:
+        from eventlet import patcher
+    except ImportError:
+        import queue
+        return threading, queue
+    return patcher.original("threading"), patcher.original("queue")
+
+
+@contextmanager
+def log_context(**fields: Any) -> Iterator[None]:
+    """Add fields (e.g. job_id, talk_id) to every record logged by this thread in the with block."""
+    previous = getattr(_context, "fields", {})
+    _context.fields = {**previous, **{name: value for name, value in fields.items() if value is not None}}
+    try:
+        yield
+    finally:
+        _context.fields = previous
+
+
+class Redactor:
+    """Masks API keys and Authorization headers, and the configured secrets wherever they appear."""
+
+    def __init__(self, secrets: Iterable[Optional[str]] = ()):
+        # Short values would mask ordinary words; real keys are long.
+        self.secrets = sorted({secret for secret in secrets if secret and len(secret) >= 8}, key=len, reverse=True)
+
+    def __call__(self, text: str) -> str:
+        for secret in self.secrets:
+            if secret in text:
+                text = text.replace(secret, REDACTED)
+        for pattern in _SECRET_PATTERNS:
+            text = pattern.sub(lambda match: match.group(1) + REDACTED, text)
+        return text
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    One JSON object per record: time, level, logger, message, the log
+    context and any extra fields, with secrets redacted.
+    """
+
+    def __init__(self, redact: Redactor):
+        super().__init__()
+        self.redact = redact
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for name, value in vars(record).items():
+            if name not in _STANDARD_ATTRIBUTES and not name.startswith("_"):
+                entry[name] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return self.redact(json.dumps(entry, default=str, ensure_ascii=False))
+
+
+class TextFormatter(logging.Formatter):
+    """The classic one-line format, with the log context appended and secrets redacted."""
+
+    def __init__(self, redact: Redactor):
+        super().__init__('%(asctime)s - %(levelname)s - %(message)s')
+        self.redact = redact
+
+    def format(self, record: logging.LogRecord) -> str:
+        text = super().format(record)
+        fields = {name: value for name, value in vars(record).items()
+                  if name not in _STANDARD_ATTRIBUTES and not name.startswith("_")}
+        if fields:
+            text += " " + " ".join(f"{name}={value}" for name, value in fields.items())
+        return self.redact(text)
+
+
+class QueueLogHandler(logging.Handler):
+    """
+    Hands records to a background writer instead of writing them in the
+    calling thread. Records are sampled per logger before they are queued,
+    and dropped (and counted) rather than waited on when the queue is full.
+    Formatting, redaction and I/O all happen in the writer, so messages
+    are rendered from their arguments there, a moment later.
+    """
+
+    def __init__(self, queue, sampling: Optional[Mapping[str, float]] = None):
+        super().__init__()
+        self.queue = queue
+        self.sampling = dict(sampling or {})
+        self._rates: Dict[str, float] = {}
+
+    def sample_rate(self, name: str) -> float:
+        """The rate for logger name: that of the closest configured ancestor, else 1."""
+        rate = self._rates.get(name)
+        if rate is None:
+            rate, prefix = 1.0, name
+            while prefix:
+                if prefix in self.sampling:
+                    rate = self.sampling[prefix]
+                    break
+                prefix = prefix.rpartition(".")[0]
+            self._rates[name] = rate
+        return rate
+
+    def emit(self, record: logging.LogRecord) -> None:
+        if record.levelno < logging.WARNING:
+            rate = self.sample_rate(record.name)
+            if rate < 1.0 and random.random() >= rate:
+                LOG_RECORDS_DROPPED.inc(reason="sampled")
+                return
+        fields = getattr(_context, "fields", None)
+        if fields:
+            for name, value in fields.items():
+                record.__dict__.setdefault(name, value)
+        if record.exc_info:
+            # Tracebacks hold frames that change once the caller moves on.
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        try:
+            self.queue.put_nowait(record)
+        except Exception:
+            LOG_RECORDS_DROPPED.inc(reason="queue_full")
+
+
+class LogWriter:
+    """Background OS thread that writes queued records to the real handlers."""
+
+    def __init__(self, queue, handlers: Iterable[logging.Handler], native_threading=threading):
+        self.queue = queue
+        self.handlers = list(handlers)
+        self._thread = native_threading.Thread(target=self._run, name="log-writer", daemon=True)
+
+    def start(self) -> "LogWriter":
+        self._thread.start()
+        return self
+
+    def _run(self) -> None:
+        while True:
+            record = self.queue.get()
+            if record is _STOP:
+                break
+            for handler in self.handlers:
+                if record.levelno >= handler.level:
+                    try:
+                        handler.handle(record)
+                    except Exception:
+                        handler.handleError(record)
+
+    def stop(self, timeout: float = 2.0) -> None:
+        """Write what is queued, then stop."""
+        try:
+            self.queue.put(_STOP, timeout=timeout)
+        except Exception:
+            return
+        self._thread.join(timeout)
+
+
+_writer: Optional[LogWriter] = None
+
+
+def configure_logging(config: Mapping[str, Any]) -> None:
+    """
+    Route the root logger through a QueueLogHandler to a LogWriter on
+    stderr, per LOG_LEVEL, LOG_FORMAT ("json" or "text"), LOG_SAMPLING and
+    LOG_QUEUE_SIZE. Replaces any handlers already on the root logger; later
+    calls do nothing.
+    """
+    global _writer
+    if _writer is not None:
+        return
+    native_threading, native_queue = _native_modules()
+    redact = Redactor(config.get(name) for name in ("ELEVENLABS_API_KEY", "DID_API_KEY", "SECRET_KEY",
+                                                 "MEDIA_STORE_SECRET_KEY"))
+    stream = logging.StreamHandler(sys.stderr)
+    stream.setFormatter(JsonFormatter(redact) if config.get("LOG_FORMAT", "json") == "json" else TextFormatter(redact))
+
+    queue = native_queue.Queue(maxsize=config.get("LOG_QUEUE_SIZE", 10000))
+    _writer = LogWriter(queue, [stream], native_threading).start()
+    atexit.register(_writer.stop)
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    sampling = config.get("LOG_SAMPLING")
+    if isinstance(sampling, str):
+        sampling = parse_sampling(sampling)
+    root.addHandler(QueueLogHandler(queue, sampling))
+    root.setLevel(config.get("LOG_LEVEL", "INFO"))
+
+
+def parse_sampling(value: Optional[str]) -> Dict[str, float]:
+    """Parse "logger=rate,logger=rate" (e.g. "routes.api.webhook=0.1") into a dict."""
+    sampling = {}
+    for item in (value or "").split(","):
+        if item.strip():
+            name, _, rate = item.partition("=")
+            sampling[name.strip()] = float(rate)
+    return sampling
@@ -0,0 +1,201 @@
+import os
+import re
+import mmap
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Dict, Any, Iterator, Optional, Tuple
+
+from flask import Response, request
+
+logger = logging.getLogger(__name__)
+
+# Audio and clip files are named after the hash of what produced them, so
+# their bytes never change and clients may cache them forever.
+CONTENT_ADDRESSED = re.compile(r"^[0-9a-f]{32,64}\.[a-z0-9]+$")
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+MMAP_CHUNK_SIZE = 1024 * 1024
+
+
+def resolve_media_path(directory: str, filename: str) -> Optional[str]:
+    """
+    Return the path of filename inside directory, or None if the name could
+    point anywhere else (separators, "..", hidden files, symlinks out).
+    """
+    if not filename or filename.startswith(".") or filename != os.path.basename(filename) \
+            or "\\" in filename or "\x00" in filename:
+        return None
+    root = os.path.realpath(directory)
+    path = os.path.realpath(os.path.join(root, filename))
+    if os.path.dirname(path) != root:
+        return None
+    return path
+
+
+class HotFileCache:
+    """
+    LRU of small media files held in memory, keyed by path and validated
+    against the file's inode and size. Media files are only ever replaced by
+    renaming a new file into place, so a replaced file is never served stale,
+    while the mtime bumps the audio cache uses for LRU order do not count as
+    changes. Newly generated audio is put here as it is written, since D-ID
+    and the browser fetch it right away, often more than once.
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, max_file_bytes: int = 8 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.max_file_bytes = max_file_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._files = OrderedDict()  # path -> (inode, size, data), oldest first
+        self._total_bytes = 0
+
+    def get(self, path: str, stat: os.stat_result) -> Optional[bytes]:
+        with self._lock:
+            entry = self._files.get(path)
+            if entry and entry[0] == stat.st_ino and entry[1] == stat.st_size:
+                self._files.move_to_end(path)
+                self.hits += 1
+                return entry[2]
+            self.misses += 1
+            return None
+
+    def put(self, path: str, data: bytes, stat: Optional[os.stat_result] = None) -> None:
+        if len(data) > self.max_file_bytes:
+            return
+        stat = stat or os.stat(path)
+        with self._lock:
+            old = self._files.pop(path, None)
+            if old:
+                self._total_bytes -= len(old[2])
+            self._files[path] = (stat.st_ino, stat.st_size, data)
+            self._total_bytes += len(data)
+            while self._total_bytes > self.max_bytes and self._files:
+                _, (_, _, evicted) = self._files.popitem(last=False)
+                self._total_bytes -= len(evicted)
+
+    def discard(self, path: str) -> None:
+        """Forget path, e.g. once its file has been deleted."""
+        with self._lock:
+            old = self._files.pop(path, None)
+            if old:
+                self._total_bytes -= len(old[2])
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "files": len(self._files),
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+
+def _iter_mmap(path: str, start: int, end: int) -> Iterator[memoryview]:
+    """
+    Yield bytes [start, end) of a file as views into an mmap of it, so the
+    data goes from the page cache to the socket without a copy in Python.
+    The map is released once the last view is dropped.
+    """
+    with open(path, "rb") as f:
+        view = memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+    for offset in range(start, end, MMAP_CHUNK_SIZE):
+        yield view[offset:min(offset + MMAP_CHUNK_SIZE, end)]
+
+
+def _validators(filename: str, stat: os.stat_result) -> Tuple[str, bool]:
+    """Strong ETag for the file and whether its name marks it immutable."""
+    if CONTENT_ADDRESSED.match(filename):
+        return filename.rsplit(".", 1)[0], True
+    return f"{stat.st_size:x}-{stat.st_mtime_ns:x}", False
+
+
+def _not_modified(etag: str, last_modified: datetime) -> bool:
+    if request.if_none_match:
+        # If-None-Match uses weak comparison (RFC 7232 3.2): W/"x" matches "x".
+        return request.if_none_match.contains_weak(etag)
+    since = request.if_modified_since
+    return since is not None and last_modified.replace(microsecond=0) <= since
+
+
+def _requested_range(etag: str, last_modified: datetime, size: int) -> Tuple[Optional[Tuple[int, int]], bool]:
+    """
+    The single byte range to send, if any, and whether the request asked
+    for a range that cannot be satisfied. Multi-range and stale If-Range
+    requests get the whole file; so do invalid ranges, which Werkzeug
+    drops. A suffix range longer than the file covers all of it.
+    """
+    byte_range = request.range
+    if byte_range is None or byte_range.units != "bytes" or len(byte_range.ranges) != 1:
+        return None, False
+    if_range = request.if_range
+    # If-Range uses strong comparison (RFC 7233 3.2), so a weak ETag never matches.
+    weak = request.headers.get("If-Range", "").lstrip().startswith("W/")
+    if if_range.etag is not None and (weak or if_range.etag != etag):
+        return None, False
+    if if_range.date is not None and if_range.date < last_modified.replace(microsecond=0):
+        return None, False
+    start, end = byte_range.ranges[0]
+    if start < 0 and size:
+        return (max(0, size + start), size), False
+    bounds = byte_range.range_for_length(size)
+    if bounds is None:
+        return None, True
+    return bounds, False
+
+
+def send_media(path: str, mimetype: str, hot_cache: Optional[HotFileCache] = None) -> Optional[Response]:
+    """
+    Serve a finished media file with Range, ETag/If-None-Match and
+    Last-Modified/If-Modified-Since support. Content-addressed names get
+    immutable cache headers. The body comes from hot_cache when possible,
+    else from an mmap of the file; either way a small response goes out in
+    a single write, which keeps ranged requests clear of the Nagle/delayed
+    ACK stall that chunked writes hit. Returns None if the file is missing.
+    """
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    filename = os.path.basename(path)
+    etag, immutable = _validators(filename, stat)
+    last_modified = datetime.fromtimestamp(int(stat.st_mtime), tz=timezone.utc)
+
+    response = Response(mimetype=mimetype, direct_passthrough=True)
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    response.headers["Accept-Ranges"] = "bytes"
+    response.headers["Cache-Control"] = IMMUTABLE_CACHE_CONTROL if immutable else "no-cache"
+    response.headers["Access-Control-Allow-Origin"] = "*"
+
+    if _not_modified(etag, last_modified):
+        response.status_code = 304
+        return response
+
+    size = stat.st_size
+    bounds, unsatisfiable = _requested_range(etag, last_modified, size)
+    if unsatisfiable:
+        response.status_code = 416
+        response.headers["Content-Range"] = f"bytes */{size}"
+        return response
+    start, end = bounds or (0, size)
+    if bounds:
+        response.status_code = 206
+        response.headers["Content-Range"] = f"bytes {start}-{end - 1}/{size}"
+
+    data = hot_cache.get(path, stat) if hot_cache else None
+    if data is None and hot_cache and size <= hot_cache.max_file_bytes:
+        with open(path, "rb") as f:
+            data = f.read()
+        hot_cache.put(path, data, stat)
+    if data is not None:
+        response.response = [data if bounds is None else data[start:end]]
+    elif size:
+        response.response = _iter_mmap(path, start, end)
+    else:
+        response.response = [b""]
+    response.content_length = end - start
+    return response
@@ -0,0 +1,271 @@
+import shutil
+import struct
+import logging
+import subprocess
+from collections import namedtuple
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# MPEG audio Layer III tables, indexed by the header fields.
+MPEG1, MPEG2, MPEG25 = 3, 2, 0
+BITRATES = {
+    MPEG1: (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    MPEG2: (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+BITRATES[MPEG25] = BITRATES[MPEG2]
+SAMPLE_RATES = {
+    MPEG1: (44100, 48000, 32000),
+    MPEG2: (22050, 24000, 16000),
+    MPEG25: (11025, 12000, 8000),
+}
+MONO = 3
+
+# Loudness the ReplayGain-style gain brings a track to, in dB of weighted RMS.
+REFERENCE_LOUDNESS = -18.0
+
+FrameHeader = namedtuple("FrameHeader", "version bitrate sample_rate padding protected mode length samples")
+
+
+class AudioDecodeError(RuntimeError):
+    """Raised when MP3 audio cannot be decoded to samples (e.g. ffmpeg is not installed)."""
+
+
+def parse_header(data: bytes, offset: int = 0) -> Optional[FrameHeader]:
+    """The Layer III frame header at offset, or None if there is no valid one."""
+    if offset + 4 > len(data) or data[offset] != 0xFF or data[offset + 1] & 0xE0 != 0xE0:
+        return None
+    b1, b2, b3 = data[offset + 1], data[offset + 2], data[offset + 3]
+    version = (b1 >> 3) & 3
+    layer = (b1 >> 1) & 3
+    bitrate_index = b2 >> 4
+    rate_index = (b2 >> 2) & 3
+    if version == 1 or layer != 1 or bitrate_index in (0, 15) or rate_index == 3:
+        return None
+    bitrate = BITRATES[version][bitrate_index] * 1000
+    sample_rate = SAMPLE_RATES[version][rate_index]
+    padding = (b2 >> 1) & 1
+    if version == MPEG1:
+        length, samples = 144 * bitrate // sample_rate + padding, 1152
+    else:
+        length, samples = 72 * bitrate // sample_rate + padding, 576
+    return FrameHeader(version, bitrate, sample_rate, padding, not (b1 & 1), b3 >> 6, length, samples)
+
+
+def id3v2_size(data: bytes) -> int:
+    """Length of the ID3v2 tag at the start of data, 0 if there is none."""
+    if len(data) < 10 or data[:3] != b"ID3":
+        return 0
+    size = 0
+    for byte in data[6:10]:
+        size = (size << 7) | (byte & 0x7F)
+    footer = 10 if data[5] & 0x10 else 0
+    return 10 + size + footer
+
+
+def _is_info_frame(data: bytes, offset: int, header: FrameHeader) -> bool:
+    """Whether the frame carries a Xing/Info/VBRI header instead of audio."""
+    if header.version == MPEG1:
+        side_info = 17 if header.mode == MONO else 32
+    else:
+        side_info = 9 if header.mode == MONO else 17
+    position = offset + 4 + (2 if header.protected else 0) + side_info
+    if data[position:position + 4] in (b"Xing", b"Info"):
+        return True
+    return data[offset + 36:offset + 40] == b"VBRI"
+
+
+def iter_frames(data: bytes) -> Iterator[Tuple[int, FrameHeader]]:
+    """
+    (offset, header) of each audio frame in data. ID3v2/ID3v1 tags and the
+    Xing/Info frame are skipped, as is junk between frames: a header only
+    counts if the next frame also starts where it says it ends.
+    """
+    end = len(data)
+    if end >= 128 and data[end - 128:end - 125] == b"TAG":
+        end -= 128
+    offset = id3v2_size(data)
+    first = True
+    header = parse_header(data, offset)
+    while offset + 4 <= end:
+        if header is not None:
+            following = offset + header.length
+            next_header = parse_header(data, following) if following + 4 <= end else None
+            if following <= end and (following + 4 > end or next_header is not None):
+                if not (first and _is_info_frame(data, offset, header)):
+                    yield offset, header
+                first = False
+                offset, header = following, next_header
+                continue
+        offset = data.find(b"\xff", offset + 1, end)
+        if offset < 0:
+            return
+        header = parse_header(data, offset)
+
+
+def frames(data: bytes) -> List[Tuple[int, FrameHeader]]:
+    return list(iter_frames(data))
+
+
+def duration(data: bytes) -> float:
+    """Playing time of data in seconds, from the frame headers."""
+    return sum(header.samples / header.sample_rate for _, header in iter_frames(data))
+
+
+def silence_frame(template: FrameHeader, header_bytes: bytes) -> bytes:
+    """
+    A frame of digital silence in the same format as template: the same
+    header without CRC or padding, and all-zero side info, which decoders
+    play as silence without any main data.
+    """
+    b1 = header_bytes[1] | 0x01
+    b2 = header_bytes[2] & ~0x02
+    header = bytes((0xFF, b1, b2, header_bytes[3]))
+    length = parse_header(header).length
+    return header + b"\x00" * (length - 4)
+
+
+def stitch(segments: Sequence[bytes], gap_ms: float = 0) -> bytes:
+    """
+    Join MP3 segments at frame boundaries, without decoding: each segment's
+    ID3 tags and Xing/Info frame are dropped (they describe that segment
+    only), and gap_ms of silence frames is put between segments. Raises
+    ValueError if a segment has no frames or its sample rate or MPEG version
+    differs from the first one's, since that cannot be fixed without
+    re-encoding.
+    """
+    parts = []
+    expected = None
+    for index, data in enumerate(segments):
+        segment_frames = frames(data)
+        if not segment_frames:
+            raise ValueError(f"Segment {index} contains no MP3 frames")
+        first_offset, first = segment_frames[0]
+        if expected is None:
+            expected = first
+        elif (first.version, first.sample_rate) != (expected.version, expected.sample_rate):
+            raise ValueError(
+                f"Segment {index} is {first.sample_rate} Hz MPEG-{first.version}, "
+                f"not {expected.sample_rate} Hz MPEG-{expected.version}"
+            )
+        if index and gap_ms > 0:
+            silence = silence_frame(first, data[first_offset:first_offset + 4])
+            count = round(gap_ms / 1000 * first.sample_rate / first.samples)
+            parts.append(silence * count)
+        view = memoryview(data)
+        # Frames are usually back to back; copy runs of them in one slice.
+        run_start = run_end = None
+        for offset, header in segment_frames:
+            if offset != run_end:
+                if run_start is not None:
+                    parts.append(view[run_start:run_end])
+                run_start = offset
+            run_end = offset + header.length
+        parts.append(view[run_start:run_end])
+    return b"".join(parts)
+
+
+def decode(data: bytes, ffmpeg: str = "ffmpeg") -> Tuple["numpy.ndarray", int]:
+    """
+    Decode MP3 data to float samples in [-1, 1], shaped (samples, channels),
+    with ffmpeg. Returns the samples and the sample rate. Raises
+    AudioDecodeError if ffmpeg is missing or fails.
+    """
+    import numpy as np
+
+    first = next(iter_frames(data), None)
+    if first is None:
+        raise AudioDecodeError("No MP3 frames to decode")
+    header = first[1]
+    channels = 1 if header.mode == MONO else 2
+    executable = shutil.which(ffmpeg)
+    if executable is None:
+        raise AudioDecodeError(f"{ffmpeg} not found; it is needed to decode MP3 for loudness analysis")
+    result = subprocess.run(
+        [executable, "-v", "error", "-i", "pipe:0", "-f", "f32le", "-acodec", "pcm_f32le",
+         "-ac", str(channels), "-ar", str(header.sample_rate), "pipe:1"],
+        input=data, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+    )
+    if result.returncode != 0:
+        raise AudioDecodeError(f"ffmpeg failed: {result.stderr.decode('utf-8', 'replace').strip()}")
+    samples = np.frombuffer(result.stdout, dtype="<f4")
+    return samples[:len(samples) - len(samples) % channels].reshape(-1, channels), header.sample_rate
+
+
+def _loudness_weights(freqs: "numpy.ndarray") -> "numpy.ndarray":
+    """
+    Amplitude response of the loudness weighting: a second-order high-pass
+    at 150 Hz, as in ReplayGain, and a +4 dB high shelf from 1.5 kHz, as in
+    the K-weighting of ITU-R BS.1770.
+    """
+    import numpy as np
+
+    ratio = np.maximum(freqs, 1e-9) / 150.0
+    high_pass = ratio ** 2 / np.sqrt((1 - ratio ** 2) ** 2 + 2 * ratio ** 2)
+    shelf_ratio = (freqs / 1500.0) ** 2
+    shelf = np.sqrt((1 + 10 ** 0.4 * shelf_ratio) / (1 + shelf_ratio))
+    return high_pass * shelf
+
+
+def loudness(samples: "numpy.ndarray", sample_rate: int) -> Tuple[float, float]:
+    """
+    ReplayGain-style gain and peak of samples (float, shaped (samples,
+    channels) or (samples,)). The mono mix is weighted in 50 ms blocks, and
+    the 95th percentile of the blocks' RMS, in dB, is the loudness; the gain
+    brings it to REFERENCE_LOUDNESS. Not bit-exact with ReplayGain scanners,
+    but consistent across this app's own audio.
+    """
+    import numpy as np
+
+    samples = np.asarray(samples, dtype=np.float64)
+    if samples.size == 0:
+        return 0.0, 0.0
+    peak = float(np.max(np.abs(samples)))
+    mono = samples.mean(axis=1) if samples.ndim == 2 else samples
+    block = max(1, sample_rate // 20)
+    count = max(1, len(mono) // block)
+    mono = np.pad(mono, (0, max(0, count * block - len(mono))))
+    blocks = mono[:count * block].reshape(count, block)
+    spectrum = np.fft.rfft(blocks, axis=1)
+    # Parseval: interior bins stand for two (positive and negative) frequencies.
+    bin_weights = np.full(spectrum.shape[1], 2.0)
+    bin_weights[0] = 1.0
+    if block % 2 == 0:
+        bin_weights[-1] = 1.0
+    weights = _loudness_weights(np.fft.rfftfreq(block, 1.0 / sample_rate)) ** 2 * bin_weights
+    mean_square = (np.abs(spectrum) ** 2 * weights).sum(axis=1) / block ** 2
+    levels = 10 * np.log10(mean_square + 1e-10)
+    gain = REFERENCE_LOUDNESS - float(np.percentile(levels, 95))
+    return round(gain, 2), round(peak, 6)
+
+
+def _id3_text_frame(description: str, value: str) -> bytes:
+    body = b"\x03" + description.encode("utf-8") + b"\x00" + value.encode("utf-8")
+    return b"TXXX" + _syncsafe(len(body)) + b"\x00\x00" + body
+
+
+def _syncsafe(size: int) -> bytes:
+    return struct.pack(">I", ((size & 0xFE00000) << 3) | ((size & 0x1FC000) << 2)
+                       | ((size & 0x3F80) << 1) | (size & 0x7F))
+
+
+def with_tags(data: bytes, tags: Dict[str, str]) -> bytes:
+    """Replace any ID3v2 tag of data with an ID3v2.4 tag of TXXX frames (description -> value)."""
+    body = b"".join(_id3_text_frame(name, value) for name, value in tags.items())
+    header = b"ID3\x04\x00\x00" + _syncsafe(len(body))
+    return header + body + data[id3v2_size(data):]
+
+
+def tag_replaygain(data: bytes, ffmpeg: str = "ffmpeg") -> Tuple[bytes, float, float]:
+    """
+    Decode data, measure it and return it with REPLAYGAIN_TRACK_GAIN/PEAK
+    tags, plus the gain and peak. Raises AudioDecodeError if it cannot be
+    decoded.
+    """
+    samples, sample_rate = decode(data, ffmpeg)
+    gain, peak = loudness(samples, sample_rate)
+    tagged = with_tags(data, {
+        "REPLAYGAIN_TRACK_GAIN": f"{gain:+.2f} dB",
+        "REPLAYGAIN_TRACK_PEAK": f"{peak:.6f}",
+    })
+    return tagged, gain, peak
@@ -0,0 +1,320 @@
+import os
+import time
+import uuid
+import logging
+from typing import Dict, Any, Callable, Optional
+from flask import Flask
+from services.job_tracker import TERMINAL_STATUSES, make_did_poller
+from services.metrics import STAGE_SECONDS, FALLBACKS
+from services.scheduler import Overloaded
+from services.logs import log_context
+
+logger = logging.getLogger(__name__)
+
+
+def talk_room(talk_id: str) -> str:
+    return f"talk:{talk_id}"
+
+
+def job_room(job_id: str) -> str:
+    return f"job:{job_id}"
+
+
+def bind_sid(sid: Optional[str], room: str) -> None:
+    """
+    Add the socket with the given session ID to room, so the events for a
+    job reach only the client that started it. Clients connected to another
+    process can still join by sending a subscribe event.
+    """
+    if not sid:
+        return
+    from app import socketio
+    if not socketio.server.manager.is_connected(sid, "/"):
+        logger.debug(f"Socket {sid} is connected to another instance; it has to subscribe to {room}")
+        return
+    try:
+        socketio.server.enter_room(sid, room, namespace="/")
+    except Exception as e:
+        logger.warning(f"Could not add socket {sid} to room {room}: {e}")
+
+
+def _emit_status(job_id: str, status: str, **extra: Any) -> None:
+    # Import socketio locally to avoid circular dependency
+    from app import socketio
+    socketio.emit("job_status", {"job_id": job_id, "status": status, **extra}, to=job_room(job_id))
+
+
+def _emit_video_ready(data: Dict[str, Any]) -> None:
+    from app import socketio
+    socketio.emit("video_ready", data, to=talk_room(data["id"]))
+
+
+def handle_talk_result(app: Flask, talk_result: Dict[str, Any], sid: Optional[str] = None) -> None:
+    """
+    Follow up on the talks returned by a D-ID submission.
+    The caller's socket (sid) joins the room of every talk it started.
+    Talks served from the talk cache get a synthetic video_ready event, since
+    D-ID will not call the webhook for them. New talks are recorded in the
+    job tracker and watched in case their webhook never arrives.
+    """
+    from app import socketio
+    tracker = app.extensions["job_tracker"]
+    for talk in talk_result.get("segments", [talk_result]):
+        if talk.get("talk_id"):
+            bind_sid(sid, talk_room(talk["talk_id"]))
+        if talk.get("cached"):
+            _emit_video_ready({
+                "id": talk["talk_id"],
+                "status": "done",
+                "result_url": talk["result_url"],
+                "cached": True
+            })
+            continue
+        if not talk.get("talk_id"):
+            continue
+        tracker.record_submitted(talk["talk_id"], talk.get("status"))
+        if not talk.get("joined"):
+            socketio.start_background_task(watch_talk, app, talk["talk_id"])
+
+
+def handle_talk_update(app: Flask, data: Dict[str, Any], source: str = "webhook") -> Dict[str, Any]:
+    """Apply a D-ID talk record to the caches and notify clients when it is finished."""
+    with log_context(talk_id=data["id"]):
+        app.extensions["talk_cache"].complete(data)
+        job = app.extensions["job_tracker"].update(data["id"], data, source=source)
+        if job["status"] in TERMINAL_STATUSES:
+            if source == "webhook":
+                STAGE_SECONDS.observe(time.time() - job["created_at"], stage="webhook_delay")
+            _emit_video_ready(data)
+        return job
+
+
+def watch_talk(app: Flask, talk_id: str) -> None:
+    """
+    Fallback for late webhooks: after JOB_WEBHOOK_GRACE seconds without one,
+    poll D-ID with backoff until the talk finishes, then handle the result as
+    if the webhook had delivered it.
+    """
+    with log_context(talk_id=talk_id):
+        poll = make_did_poller(app.extensions["http_client"], app.config["DID_API_URL"], app.config["DID_API_KEY"],
+                               limiter=app.extensions["upstream_limits"]["did"])
+        try:
+            job = app.extensions["job_tracker"].wait_for_result(
+                talk_id, poll,
+                timeout=app.config["JOB_POLL_TIMEOUT"],
+                grace=app.config["JOB_WEBHOOK_GRACE"],
+                max_interval=app.config["JOB_POLL_MAX_INTERVAL"]
+            )
+        except Exception as e:
+            logger.error(f"Gave up watching talk {talk_id}: {e}")
+            return
+        if job["source"] == "poll":
+            logger.warning(f"Webhook for talk {talk_id} did not arrive; result found by polling")
+            FALLBACKS.inc(kind="did_poll")
+            app.extensions["talk_cache"].complete(job["data"])
+            _emit_video_ready(job["data"])
+
+
+def find_library_clip(app: Flask, text: str, profile=None) -> Optional[Dict[str, Any]]:
+    """
+    Return a talk result for text from the pre-rendered clip library, or None.
+    A clip only matches if it was rendered for the profile with its current
+    source image and voice, i.e. the FastGen payload fingerprint is unchanged.
+    """
+    library = app.extensions["clip_library"]
+    service = app.extensions.service("fast_gen", profile)
+    fingerprint = service.fingerprint_for(text.strip())
+    clip = library.lookup(text, fingerprint, scope=service.profile.library_scope)
+    if clip is None:
+        return None
+    logger.info(f"Serving '{clip['text']}' from the clip library")
+    return {
+        "talk_id": f"clip_{fingerprint[:16]}",
+        "status": "done",
+        "result_url": f"{app.config['SERVER_URL']}/api/clips/{clip['filename']}",
+        "cached": True,
+        "library": True,
+    }
+
+
+def _audio_ready(path: str) -> bool:
+    """
+    The audio cache fsyncs each file and renames it into place, so a
+    non-empty file at its final path is complete and safe to hand to D-ID.
+    """
+    try:
+        return os.path.getsize(path) > 0
+    except OSError:
+        return False
+
+
+def _emit_queue_position(job_id: str, position: int) -> None:
+    _emit_status(job_id, "queued", position=position)
+
+
+def prefetch_draft(app: Flask, sid: str, text: str, profile: Optional[str] = None) -> None:
+    """
+    Take the latest draft text of a Socket.IO session and, once the user
+    pauses, synthesize its finished sentences in the background so that a
+    following /generate only has to wait for D-ID.
+    """
+    from app import socketio
+
+    def run(draft: str, profile_name: Optional[str]) -> None:
+        with app.app_context():
+            service = app.extensions.service("tts", app.extensions["profiles"].get(profile_name))
+            synthesized = service.prefetch_draft(draft)
+            if synthesized:
+                logger.info(f"Synthesized {synthesized} draft sentences for session {sid}")
+
+    app.extensions["speculative_audio"].draft(sid, text, profile, socketio.start_background_task, run)
+
+
+def start_generation_job(app: Flask, text: str, sid: Optional[str] = None,
+                         profile: Optional[str] = None,
+                         idempotency_key: Optional[str] = None,
+                         incremental: bool = False) -> Dict[str, Any]:
+    """
+    Queue a TTS -> audio publish -> D-ID submission job for the named profile
+    (the default one if None) and return its ID and place in line. Progress,
+    including queue position changes, is pushed to the job's room as
+    job_status Socket.IO events. Raises Overloaded if the queue is full.
+    With DURABLE_JOBS the job goes to the SQLite queue run by worker.py, and
+    a repeated idempotency_key returns the job it first created.
+    With incremental, only changed sentences are synthesized (see
+    TTSService.generate_speech).
+    """
+    from app import socketio
+    if app.config["DURABLE_JOBS"]:
+        start_event_relay(app)
+        job, created = app.extensions["job_queue"].enqueue(
+            {"text": text, "sid": sid, "profile": profile, "incremental": incremental}, idempotency_key,
+            max_queued=app.config["GENERATION_QUEUE_SIZE"]
+        )
+        bind_sid(sid, job_room(job["job_id"]))
+        result = {"job_id": job["job_id"], "status": job["status"], "position": job["position"]}
+        if not created:
+            result["duplicate"] = True
+        return result
+
+    scheduler = app.extensions["job_scheduler"]
+    scheduler.start(socketio.start_background_task, on_position=_emit_queue_position)
+    job_id = uuid.uuid4().hex
+    bind_sid(sid, job_room(job_id))
+    position = scheduler.submit(job_id, run_generation_job, app, job_id, text, sid, profile, incremental)
+    return {"job_id": job_id, "status": "queued", "position": position}
+
+
+def generate_talk(app: Flask, text: str, profile: Optional[str],
+                  emit: Callable[..., None], incremental: bool = False) -> Dict[str, Any]:
+    """
+    Synthesize text, publish the audio and submit the D-ID talk; return the
+    talk result. Progress is reported through emit(status, **extra). Must be
+    called inside an app context. With incremental, the talk result and the
+    audio_ready event carry the 'delta' report of reused sentences.
+    """
+    selected = app.extensions["profiles"].get(profile)
+    tts_result = app.extensions.service("tts", selected).generate_speech(
+        text,
+        on_stream_start=lambda filename: emit(
+            "audio_streaming", audio_url=f"{app.config['SERVER_URL']}/api/audio/{filename}"
+        ),
+        incremental=incremental
+    )
+    audio = tts_result.pop("audio", None)
+    delta = tts_result.pop("delta", None)
+    if audio is None:
+        audio_path = os.path.join(app.config["AUDIO_DIR"], tts_result["filename"])
+        if not _audio_ready(audio_path):
+            raise Exception("Generated audio file not found")
+        if app.config["DID_AUDIO_UPLOAD"]:
+            audio = app.extensions["audio_cache"].read(tts_result["filename"])
+    audio_url = f"{app.config['SERVER_URL']}/api/audio/{tts_result['filename']}"
+    if delta is None:
+        emit("audio_ready", audio_url=audio_url)
+        return app.extensions.service("avatar", selected).generate_avatar_video(text, audio_url, audio)
+    logger.info(f"Incremental render reused {delta['reused']} of {delta['sentences']} sentences")
+    emit("audio_ready", audio_url=audio_url, delta=delta)
+    talk_result = app.extensions.service("avatar", selected).generate_avatar_video(text, audio_url, audio)
+    return {**talk_result, "delta": delta}
+
+
+def run_generation_job(app: Flask, job_id: str, text: str, sid: Optional[str] = None,
+                       profile: Optional[str] = None, incremental: bool = False) -> Dict[str, Any]:
+    """Run one generation job to completion inside its own app context."""
+    with app.app_context(), log_context(job_id=job_id, profile=profile):
+        try:
+            _emit_status(job_id, "tts")
+            talk_result = generate_talk(
+                app, text, profile, lambda status, **extra: _emit_status(job_id, status, **extra), incremental
+            )
+            handle_talk_result(app, talk_result, sid)
+            _emit_status(job_id, "submitted", talk=talk_result)
+            return talk_result
+        except Overloaded as e:
+            logger.warning(f"Generation job {job_id} turned away: {e}")
+            _emit_status(job_id, "error", error=str(e), retry_after=e.retry_after)
+            return {"error": str(e)}
+        except Exception as e:
+            logger.error(f"Generation job {job_id} failed: {e}")
+            _emit_status(job_id, "error", error=str(e))
+            return {"error": str(e)}
+
+
+def run_queued_job(app: Flask, job: Dict[str, Any], worker: str) -> None:
+    """
+    Run a job claimed from the durable queue (in a worker process). Events
+    are recorded in the queue for the web process to relay. A failure is
+    retried later unless it is permanent (e.g. empty text or an unknown
+    profile) or the job is out of attempts, in which case it is
+    dead-lettered. Retried steps are cheap: audio already synthesized is
+    served from the audio cache and a talk already submitted is joined
+    through the talk cache.
+    """
+    queue = app.extensions["job_queue"]
+    job_id, payload = job["job_id"], job["payload"]
+
+    def emit(status: str, **extra: Any) -> None:
+        queue.record_event(job_id, status, **extra)
+
+    with app.app_context(), log_context(job_id=job_id, profile=payload.get("profile"), worker=worker):
+        emit("tts", attempt=job["attempts"])
+        try:
+            talk_result = generate_talk(app, payload["text"], payload.get("profile"), emit,
+                                        payload.get("incremental", False))
+        except Exception as e:
+            retry_after = e.retry_after if isinstance(e, Overloaded) else None
+            status = queue.fail(job_id, worker, str(e), retry_after=retry_after,
+                                permanent=isinstance(e, ValueError))
+            if status == "queued":
+                logger.warning(f"Generation job {job_id} failed (attempt {job['attempts']}), will retry: {e}")
+                emit("retrying", error=str(e), attempt=job["attempts"])
+            elif status == "dead":
+                logger.error(f"Generation job {job_id} failed for good after {job['attempts']} attempts: {e}")
+                emit("error", error=str(e), dead_letter=True)
+            return
+        if queue.complete(job_id, worker, talk_result):
+            emit("submitted", talk=talk_result)
+        else:
+            logger.warning(f"Generation job {job_id} finished after its lease expired; result dropped")
+
+
+def _relay_job_event(app: Flask, event: Dict[str, Any]) -> None:
+    """Deliver an event recorded by a worker process to the job's Socket.IO room."""
+    job_id, status = event.pop("job_id"), event.pop("status")
+    if status == "tts":
+        for position, waiting_id in enumerate(app.extensions["job_queue"].waiting(), 1):
+            _emit_queue_position(waiting_id, position)
+    elif status == "submitted":
+        job = app.extensions["job_queue"].get(job_id)
+        handle_talk_result(app, event["talk"], (job or {}).get("payload", {}).get("sid"))
+    _emit_status(job_id, status, **event)
+
+
+def start_event_relay(app: Flask) -> None:
+    """Relay durable job events to Socket.IO clients from this (web) process; later calls do nothing."""
+    from app import socketio
+    app.extensions["job_queue"].start_relay(
+        socketio.start_background_task, lambda event: _relay_job_event(app, event),
+        interval=app.config["JOB_EVENT_POLL_INTERVAL"]
+    )
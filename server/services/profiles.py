@@ -0,0 +1,250 @@
+import os
+import json
+import logging
+import threading
+from typing import Dict, Any, List, Optional, Tuple
+
+from services.scheduler import LimiterChain, UpstreamLimiter
+
+logger = logging.getLogger(__name__)
+
+PROFILE_FIELDS = ("source_url", "voice_id", "model_id", "voice_settings")
+UPSTREAMS = ("elevenlabs", "did")
+
+
+class UnknownProfile(ValueError):
+    """Raised when a request names a profile that is not in the registry."""
+
+
+class Profile:
+    """
+    One avatar and voice: the D-ID source image plus the ElevenLabs voice,
+    model and voice settings.
+
+    Headers and payloads are built once, when the profile is loaded; the
+    *_payload and tts_request methods only copy the template and fill in the
+    text or audio URL. Treat the returned dicts as read-only below the top
+    level, since nested parts are shared with the template.
+    """
+
+    def __init__(self, name: str, source_url: str, voice_id: str, model_id: str,
+                 voice_settings: Dict[str, Any], output_format: str, webhook_url: str,
+                 elevenlabs_api_key: Optional[str], did_api_key: Optional[str],
+                 limiters: Optional[Dict[str, UpstreamLimiter]] = None, is_default: bool = False):
+        self.name = name
+        self.source_url = source_url
+        self.voice_id = voice_id
+        self.model_id = model_id
+        self.voice_settings = voice_settings
+        self.is_default = is_default
+        self.limiters = limiters or {}
+
+        self.elevenlabs_headers = {
+            "Accept": "application/json",
+            "Content-Type": "application/json",
+            "xi-api-key": elevenlabs_api_key
+        }
+        self.did_headers = {
+            "accept": "application/json",
+            "Content-Type": "application/json",
+            "Authorization": f"Basic {did_api_key}"
+        }
+        self._tts_body = {
+            "model_id": model_id,
+            "voice_settings": voice_settings,
+            "output_format": output_format,
+            "apply_text_normalization": "on"
+        }
+        # D-ID's ElevenLabs provider takes the model next to the voice settings.
+        self.voice_config = dict(voice_settings, model_id=model_id)
+        self._fast_script = {
+            "type": "text",
+            "provider": {
+                "type": "elevenlabs",
+                "voice_id": voice_id,
+                "voice_config": self.voice_config
+            }
+        }
+        self._fast_payload = {
+            "source_url": source_url,
+            "config": {"stitch": True, "fluent": True},
+            "webhook": webhook_url
+        }
+        self._audio_payload = {
+            "source_url": source_url,
+            "config": {"fluent": False, "stitch": True},
+            "webhook": webhook_url
+        }
+        self._text_payload = {
+            "source_url": source_url,
+            "config": {"stitch": True},
+            "webhook": webhook_url
+        }
+
+    def limiter(self, upstream: str, shared: UpstreamLimiter) -> LimiterChain:
+        """This profile's own limit for upstream (if any) chained with the shared one."""
+        return LimiterChain(self.limiters.get(upstream), shared)
+
+    @property
+    def library_scope(self) -> Optional[str]:
+        """Clip library namespace; the default profile keeps the unprefixed keys."""
+        return None if self.is_default else self.name
+
+    def tts_request(self, text: str,
+                    context: Optional[Dict[str, Optional[str]]] = None) -> Tuple[Dict[str, str], Dict[str, Any]]:
+        """Headers and body for an ElevenLabs text-to-speech request."""
+        data = dict(self._tts_body, text=text)
+        if context:
+            data.update({k: v for k, v in context.items() if v})
+        return dict(self.elevenlabs_headers), data
+
+    def fast_payload(self, text: str) -> Dict[str, Any]:
+        """/talks payload with a text script that D-ID voices through ElevenLabs."""
+        return dict(self._fast_payload, script=dict(self._fast_script, input=text))
+
+    def audio_payload(self, audio_url: str) -> Dict[str, Any]:
+        """/talks payload that lip-syncs to already generated audio."""
+        return dict(self._audio_payload, script={"type": "audio", "audio_url": audio_url})
+
+    def text_payload(self, text: str) -> Dict[str, Any]:
+        """/talks payload with a plain text script, used when D-ID rejects the audio."""
+        return dict(self._text_payload, script={"type": "text", "input": text})
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "source_url": self.source_url,
+            "voice_id": self.voice_id,
+            "model_id": self.model_id,
+            "default": self.is_default,
+        }
+
+
+class ProfileRegistry:
+    """
+    Avatar/voice profiles loaded from a JSON file:
+
+        {"default": "magen",
+         "profiles": {"magen": {"source_url": "...", "voice_id": "..."},
+                      "joaquin": {..., "limits": {"did": {"max_concurrent": 2, "rate": 1}}}}}
+
+    Fields a profile leaves out (source_url, voice_id, model_id,
+    voice_settings) are taken from the configured defaults. A profile's
+    optional "limits" cap its own use of each upstream, on top of the
+    account-wide limits. The file is re-read when its mtime changes, so
+    profiles can be added or edited without a restart. Without a file there
+    is a single profile, "default", built from the config.
+    """
+
+    def __init__(self, path: str, defaults: Dict[str, Any], output_format: str, webhook_url: str,
+                 elevenlabs_api_key: Optional[str] = None, did_api_key: Optional[str] = None,
+                 wait_timeout: Optional[float] = 30):
+        self.path = path
+        self.defaults = defaults
+        self.output_format = output_format
+        self.webhook_url = webhook_url
+        self.elevenlabs_api_key = elevenlabs_api_key
+        self.did_api_key = did_api_key
+        self.wait_timeout = wait_timeout
+        self._lock = threading.Lock()
+        self._profiles: Dict[str, Profile] = {}
+        self._default_name = "default"
+        self._mtime = object()  # never equal to a real mtime, so the first call loads
+        self._limiters: Dict[Tuple[str, str], Tuple[Dict[str, Any], UpstreamLimiter]] = {}
+        with self._lock:
+            self._reload()
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> "ProfileRegistry":
+        return cls(
+            config["PROFILES_PATH"],
+            defaults={
+                "source_url": config["DID_SOURCE_URL"],
+                "voice_id": config["ELEVENLABS_VOICE_ID"],
+                "model_id": config["ELEVENLABS_MODEL_ID"],
+                "voice_settings": config["ELEVENLABS_VOICE_SETTINGS"],
+            },
+            output_format=config["ELEVENLABS_OUTPUT_FORMAT"],
+            webhook_url=config["DID_WEBHOOK_URL"],
+            elevenlabs_api_key=config["ELEVENLABS_API_KEY"],
+            did_api_key=config["DID_API_KEY"],
+            wait_timeout=config["UPSTREAM_WAIT_TIMEOUT"],
+        )
+
+    def _limiter(self, name: str, upstream: str, spec: Dict[str, Any]) -> UpstreamLimiter:
+        """Reuse a profile's limiter across reloads unless its limits changed."""
+        existing = self._limiters.get((name, upstream))
+        if existing and existing[0] == spec:
+            return existing[1]
+        limiter = UpstreamLimiter(f"{upstream}:{name}", max_concurrent=int(spec["max_concurrent"]),
+                                  rate=float(spec["rate"]), wait_timeout=self.wait_timeout)
+        self._limiters[(name, upstream)] = (spec, limiter)
+        return limiter
+
+    def _build(self, name: str, spec: Dict[str, Any], is_default: bool) -> Profile:
+        unknown = set(spec) - set(PROFILE_FIELDS) - {"limits"}
+        if unknown:
+            raise ValueError(f"Profile {name} has unknown fields: {', '.join(sorted(unknown))}")
+        fields = {field: spec.get(field, self.defaults[field]) for field in PROFILE_FIELDS}
+        limits = spec.get("limits") or {}
+        limiters = {
+            upstream: self._limiter(name, upstream, limits[upstream])
+            for upstream in UPSTREAMS if upstream in limits
+        }
+        return Profile(name, output_format=self.output_format, webhook_url=self.webhook_url,
+                       elevenlabs_api_key=self.elevenlabs_api_key, did_api_key=self.did_api_key,
+                       limiters=limiters, is_default=is_default, **fields)
+
+    def _reload(self) -> None:
+        """Re-read the profiles file if it changed on disk. Caller holds the lock."""
+        try:
+            mtime = os.path.getmtime(self.path)
+        except FileNotFoundError:
+            mtime = None
+        if mtime == self._mtime:
+            return
+        self._mtime = mtime
+        if mtime is None:
+            document = {"default": "default", "profiles": {"default": {}}}
+        else:
+            try:
+                with open(self.path, encoding="utf-8") as f:
+                    document = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.error(f"Could not read profiles from {self.path}, keeping the previous ones: {e}")
+                return
+        try:
+            specs = document["profiles"]
+            default_name = document.get("default") or next(iter(specs))
+            if default_name not in specs:
+                raise ValueError(f"default profile {default_name} is not defined")
+            profiles = {name: self._build(name, spec, name == default_name) for name, spec in specs.items()}
+        except (KeyError, StopIteration, TypeError, ValueError) as e:
+            logger.error(f"Invalid profiles in {self.path}, keeping the previous ones: {e}")
+            return
+        self._profiles, self._default_name = profiles, default_name
+        logger.info(f"Loaded {len(profiles)} profiles (default: {default_name})")
+
+    def get(self, name: Optional[str] = None) -> Profile:
+        """Return the named profile, or the default one; raises UnknownProfile."""
+        if name is not None and not isinstance(name, str):
+            # e.g. a JSON list or object from a request body
+            raise UnknownProfile(f"Profile name must be a string, not {type(name).__name__}")
+        with self._lock:
+            self._reload()
+            profile = self._profiles.get(name or self._default_name)
+        if profile is None:
+            raise UnknownProfile(f"Unknown profile: {name}")
+        return profile
+
+    def profiles(self) -> List[Profile]:
+        with self._lock:
+            self._reload()
+            return list(self._profiles.values())
+
+    def stats(self) -> Dict[str, Any]:
+        """Per-profile limiter usage, for the profiles that set their own limits."""
+        return {
+            profile.name: {upstream: limiter.stats() for upstream, limiter in profile.limiters.items()}
+            for profile in self.profiles() if profile.limiters
+        }
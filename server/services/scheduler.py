@@ -0,0 +1,203 @@
+import math
+import time
+import logging
+import threading
+from collections import deque
+from contextlib import contextmanager, ExitStack
+from typing import Dict, Any, Callable, Iterator, List, Optional
+
+from services.rate_limit import TokenBucket
+from services.metrics import ADMISSION_REJECTED
+
+logger = logging.getLogger(__name__)
+
+
+class Overloaded(Exception):
+    """
+    Raised when work cannot be admitted right now: the generation queue is
+    full, an upstream stayed at its limit for too long, or the upstream itself
+    answered 429. retry_after is a hint in seconds for the client.
+    """
+
+    def __init__(self, message: str, retry_after: float = 1):
+        super().__init__(message)
+        self.retry_after = max(1, int(math.ceil(retry_after)))
+
+
+def raise_if_throttled(response, upstream: str) -> None:
+    """Turn an upstream 429 (left over after retries) into Overloaded."""
+    if response is None or response.status_code != 429:
+        return
+    try:
+        retry_after = float(response.headers.get("Retry-After", 1))
+    except ValueError:
+        retry_after = 1
+    ADMISSION_REJECTED.inc(reason=f"{upstream}_throttled")
+    raise Overloaded(f"{upstream} is rate limiting requests", retry_after)
+
+
+class UpstreamLimiter:
+    """
+    Caps one upstream API at max_concurrent requests in flight and `rate`
+    request starts per second (bursts up to `burst`), so a spike of jobs is
+    smoothed into a steady stream just under the account's quota instead of
+    a wave of 429s. Callers wait up to wait_timeout seconds for their turn.
+    """
+
+    def __init__(self, name: str, max_concurrent: int, rate: float,
+                 burst: Optional[float] = None, wait_timeout: Optional[float] = 30):
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.wait_timeout = wait_timeout
+        self.bucket = TokenBucket(rate, burst)
+        self.in_flight = 0
+        self.waiting = 0
+        self.rejected = 0
+        self._slots = threading.BoundedSemaphore(max_concurrent)
+        self._lock = threading.Lock()
+
+    def _reject(self, reason: str) -> Overloaded:
+        with self._lock:
+            self.rejected += 1
+            backlog = self.waiting  # Callers in line, this one included
+        ADMISSION_REJECTED.inc(reason=f"{self.name}_busy")
+        return Overloaded(f"{self.name} is {reason}; try again shortly", backlog / self.bucket.rate)
+
+    @contextmanager
+    def slot(self) -> Iterator[None]:
+        """Hold one of the upstream's request slots for the duration of the with block."""
+        deadline = None if self.wait_timeout is None else time.monotonic() + self.wait_timeout
+        with self._lock:
+            self.waiting += 1
+        try:
+            if not self._slots.acquire(timeout=self.wait_timeout):
+                raise self._reject("at its concurrency limit")
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            if not self.bucket.acquire(timeout=remaining):
+                self._slots.release()
+                raise self._reject("at its request rate limit")
+        finally:
+            with self._lock:
+                self.waiting -= 1
+        with self._lock:
+            self.in_flight += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+            self._slots.release()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "in_flight": self.in_flight,
+                "waiting": self.waiting,
+                "rejected": self.rejected,
+                "max_concurrent": self.max_concurrent,
+                "rate": self.bucket.rate,
+            }
+
+
+class LimiterChain:
+    """
+    Holds a slot on several limiters at once, e.g. a profile's own limit
+    and the account-wide one. Limiters that are None are skipped.
+    """
+
+    def __init__(self, *limiters: Optional[UpstreamLimiter]):
+        self.limiters = [limiter for limiter in limiters if limiter is not None]
+
+    @contextmanager
+    def slot(self) -> Iterator[None]:
+        with ExitStack() as stack:
+            for limiter in self.limiters:
+                stack.enter_context(limiter.slot())
+            yield
+
+
+class JobScheduler:
+    """
+    Bounded FIFO of generation jobs in front of the upstream limiters.
+
+    A fixed number of workers run the jobs. When the queue is full, submit()
+    raises Overloaded right away with a Retry-After estimate taken from the
+    recent job duration, instead of letting the backlog grow without limit.
+    Whenever a job starts, on_position is called for each job still waiting
+    with its new place in line.
+    """
+
+    def __init__(self, workers: int = 8, max_queued: int = 100):
+        self.workers = workers
+        self.max_queued = max_queued
+        self.rejected = 0
+        self._queue = deque()  # (job_id, fn, args), oldest first
+        self._running = 0
+        self._avg_seconds = 5.0
+        self._started = False
+        self._on_position: Optional[Callable[[str, int], None]] = None
+        self._cond = threading.Condition()
+
+    def start(self, spawn: Callable[..., Any],
+              on_position: Optional[Callable[[str, int], None]] = None) -> None:
+        """Start the workers with spawn (e.g. socketio.start_background_task); later calls do nothing."""
+        with self._cond:
+            if self._started:
+                return
+            self._started = True
+            self._on_position = on_position
+        for _ in range(self.workers):
+            spawn(self._work)
+
+    def _retry_after(self) -> float:
+        return self._avg_seconds * (len(self._queue) + self._running) / self.workers
+
+    def submit(self, job_id: str, fn: Callable[..., Any], *args: Any) -> int:
+        """Queue fn(*args) and return its 1-based position among the waiting jobs."""
+        with self._cond:
+            if len(self._queue) >= self.max_queued:
+                self.rejected += 1
+                ADMISSION_REJECTED.inc(reason="queue_full")
+                raise Overloaded("Generation queue is full; try again shortly", self._retry_after())
+            self._queue.append((job_id, fn, args))
+            self._cond.notify()
+            return len(self._queue)
+
+    def _work(self) -> None:
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._queue)
+                job_id, fn, args = self._queue.popleft()
+                self._running += 1
+                waiting = [queued[0] for queued in self._queue]
+            self._announce(waiting)
+            started = time.monotonic()
+            try:
+                fn(*args)
+            except Exception as e:
+                logger.error(f"Job {job_id} failed: {e}")
+            finally:
+                elapsed = time.monotonic() - started
+                with self._cond:
+                    self._running -= 1
+                    self._avg_seconds = 0.8 * self._avg_seconds + 0.2 * elapsed
+
+    def _announce(self, waiting: List[str]) -> None:
+        if not self._on_position:
+            return
+        for position, job_id in enumerate(waiting, 1):
+            try:
+                self._on_position(job_id, position)
+            except Exception as e:
+                logger.warning(f"Could not report queue position for job {job_id}: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "queued": len(self._queue),
+                "running": self._running,
+                "workers": self.workers,
+                "max_queued": self.max_queued,
+                "rejected": self.rejected,
+                "avg_job_seconds": round(self._avg_seconds, 2),
+            }
@@ -0,0 +1,84 @@
+import os
+import time
+import pickle
+import logging
+import sqlite3
+import threading
+
+import socketio
+
+logger = logging.getLogger(__name__)
+
+SQLITE_PREFIX = "sqlite:///"
+
+
+class SQLiteManager(socketio.PubSubManager):
+    """
+    Socket.IO client manager that passes events between server instances
+    through a table in a SQLite file they share, for deployments without
+    Redis (SOCKETIO_MESSAGE_QUEUE=sqlite:///path/to/socketio.db).
+
+    An emit from any instance, e.g. video_ready from the one D-ID's webhook
+    happened to reach, is written to the table; every instance polls the
+    table and delivers the events to its own clients in the target room.
+    Messages older than retention seconds are deleted.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, url: str, channel: str = "flask-socketio", write_only: bool = False,
+                 logger=None, poll_interval: float = 0.05, retention: float = 60):
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+        self.db_path = url[len(SQLITE_PREFIX):] if url.startswith(SQLITE_PREFIX) else url
+        self.poll_interval = poll_interval
+        self.retention = retention
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS socketio_messages (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                channel TEXT,
+                message BLOB,
+                created_at REAL
+            )
+        """)
+
+    def _publish(self, data) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO socketio_messages (channel, message, created_at) VALUES (?, ?, ?)",
+                (self.channel, pickle.dumps(data), time.time())
+            )
+
+    def _listen(self):
+        with self._lock:
+            last = self._conn.execute("SELECT COALESCE(MAX(seq), 0) FROM socketio_messages").fetchone()[0]
+        pruned_at = time.time()
+        while True:
+            try:
+                with self._lock:
+                    rows = self._conn.execute(
+                        "SELECT seq, message FROM socketio_messages WHERE seq > ? AND channel = ? ORDER BY seq",
+                        (last, self.channel)
+                    ).fetchall()
+                    if time.time() - pruned_at > self.retention:
+                        pruned_at = time.time()
+                        self._conn.execute("DELETE FROM socketio_messages WHERE created_at < ?",
+                                           (pruned_at - self.retention,))
+            except sqlite3.Error as e:
+                logger.error(f"Could not read Socket.IO messages: {e}")
+                rows = []
+            for seq, message in rows:
+                last = seq
+                yield message
+            if not rows:
+                time.sleep(self.poll_interval)
+
+
+def socketio_options(url: str) -> dict:
+    """SocketIO() arguments for SOCKETIO_MESSAGE_QUEUE: a sqlite:/// URL gets a SQLiteManager."""
+    if url and url.startswith(SQLITE_PREFIX):
+        return {"client_manager": SQLiteManager(url)}
+    return {"message_queue": url}
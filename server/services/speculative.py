@@ -0,0 +1,136 @@
+import time
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Callable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class SpeculativeAudio:
+    """
+    Short-lived store for TTS segments synthesized from draft text, before
+    the user asks for a video.
+
+    Segments are keyed like the audio cache (text, voice and the previous
+    segment as context) and kept in memory for ttl seconds, oldest first
+    out once max_bytes is reached. A segment being synthesized is
+    marked pending, so a /generate request that needs it waits for that call
+    instead of paying for a second one.
+
+    Draft text is debounced per Socket.IO session: only the latest draft of
+    a session is acted on, once no newer one has arrived for `debounce`
+    seconds.
+    """
+
+    def __init__(self, ttl: float = 300, max_bytes: int = 32 * 1024 * 1024, debounce: float = 0.6):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.debounce = debounce
+        self.hits = 0
+        self.synthesized = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (expires_at, audio), oldest first
+        self._pending: Dict[str, threading.Event] = {}
+        self._total_bytes = 0
+        self._drafts: Dict[str, Tuple[int, str, Optional[str]]] = {}  # sid -> (version, text, profile)
+
+    def _expire(self) -> None:
+        """Drop expired entries, then the oldest until within max_bytes. Caller holds the lock."""
+        now = time.monotonic()
+        for key in list(self._entries):
+            expires_at, audio = self._entries[key]
+            if expires_at > now and self._total_bytes <= self.max_bytes:
+                break
+            del self._entries[key]
+            self._total_bytes -= len(audio)
+
+    def claim(self, key: str) -> bool:
+        """Mark key as being synthesized; False if it is already stored or in progress."""
+        with self._lock:
+            self._expire()
+            if key in self._entries or key in self._pending:
+                return False
+            self._pending[key] = threading.Event()
+            return True
+
+    def put(self, key: str, audio: bytes) -> None:
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old:
+                self._total_bytes -= len(old[1])
+            self._entries[key] = (time.monotonic() + self.ttl, audio)
+            self._total_bytes += len(audio)
+            self.synthesized += 1
+            self._expire()
+            event = self._pending.pop(key, None)
+        if event:
+            event.set()
+
+    def release(self, key: str) -> None:
+        """Give up a claim without storing anything (the synthesis failed)."""
+        with self._lock:
+            event = self._pending.pop(key, None)
+        if event:
+            event.set()
+
+    def has(self, key: str) -> bool:
+        """Whether key is stored or being synthesized."""
+        with self._lock:
+            self._expire()
+            return key in self._entries or key in self._pending
+
+    def take(self, key: str, timeout: Optional[float] = None) -> Optional[bytes]:
+        """Return the audio for key, waiting up to timeout if it is still being synthesized."""
+        with self._lock:
+            event = self._pending.get(key)
+        if event is not None:
+            event.wait(timeout)
+        with self._lock:
+            self._expire()
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self.hits += 1
+            return entry[1]
+
+    def draft(self, sid: str, text: str, profile: Optional[str], spawn: Callable[..., Any],
+              run: Callable[[str, Optional[str]], None]) -> None:
+        """
+        Record the latest draft of session sid and, after the debounce delay,
+        call run(text, profile) in a background task unless a newer draft
+        arrived in the meantime.
+        """
+        with self._lock:
+            version = self._drafts.get(sid, (0, "", None))[0] + 1
+            self._drafts[sid] = (version, text, profile)
+        spawn(self._run_latest, sid, version, run)
+
+    def _run_latest(self, sid: str, version: int, run: Callable[[str, Optional[str]], None]) -> None:
+        time.sleep(self.debounce)
+        with self._lock:
+            current = self._drafts.get(sid)
+            if current is None or current[0] != version:
+                return
+            _, text, profile = current
+        try:
+            run(text, profile)
+        except Exception as e:
+            logger.warning(f"Speculative TTS for session {sid} failed: {e}")
+
+    def forget(self, sid: str) -> None:
+        """Drop the draft state of a session that disconnected."""
+        with self._lock:
+            self._drafts.pop(sid, None)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            self._expire()
+            return {
+                "segments": len(self._entries),
+                "pending": len(self._pending),
+                "bytes": self._total_bytes,
+                "hits": self.hits,
+                "synthesized": self.synthesized,
+                "sessions": len(self._drafts),
+            }
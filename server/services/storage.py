@@ -0,0 +1,170 @@
+import os
+import hmac
+import hashlib
+import logging
+import threading
+from datetime import datetime, timezone
+from typing import Dict, Any, Optional
+from urllib.parse import quote, urlsplit
+
+logger = logging.getLogger(__name__)
+
+
+class MediaStore:
+    """
+    Shared home of generated media, so every server instance can serve a
+    file that another one generated. Keys are content-addressed filenames
+    (e.g. "<sha256>.mp3"), so an object never changes once written.
+    """
+
+    def put(self, key: str, data: bytes) -> None:
+        raise NotImplementedError
+
+    def get(self, key: str) -> Optional[bytes]:
+        """The object's bytes, or None if there is no such object."""
+        raise NotImplementedError
+
+    def delete(self, key: str) -> None:
+        raise NotImplementedError
+
+    def describe(self) -> str:
+        raise NotImplementedError
+
+
+class LocalStore(MediaStore):
+    """A directory shared by the instances, e.g. on the same host or a network mount."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        if not key or key != os.path.basename(key) or key.startswith("."):
+            raise ValueError(f"Invalid media key: {key!r}")
+        return os.path.join(self.directory, key)
+
+    def put(self, key: str, data: bytes) -> None:
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    def get(self, key: str) -> Optional[bytes]:
+        try:
+            with open(self._path(key), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def delete(self, key: str) -> None:
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def describe(self) -> str:
+        return f"file://{self.directory}"
+
+
+class S3Store(MediaStore):
+    """
+    Bucket of an S3-compatible object store (AWS S3, MinIO, ...), addressed
+    path-style (endpoint/bucket/key) and signed with AWS Signature V4.
+    Requests go through the shared HTTPClient, so they reuse its keep-alive
+    pools and retries.
+    """
+
+    def __init__(self, http_client, endpoint: str, bucket: str, access_key: str, secret_key: str,
+                 region: str = "us-east-1", prefix: str = ""):
+        self.http = http_client
+        self.endpoint = endpoint.rstrip("/")
+        self.host = urlsplit(self.endpoint).netloc
+        self.bucket = bucket
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self.region = region
+        self.prefix = prefix.strip("/") + "/" if prefix.strip("/") else ""
+
+    def _path(self, key: str) -> str:
+        return "/" + quote(f"{self.bucket}/{self.prefix}{key}", safe="/-_.~")
+
+    def _signed_headers(self, method: str, path: str, payload_hash: str) -> Dict[str, str]:
+        """Headers carrying an AWS Signature V4 for a request without a query string."""
+        now = datetime.now(timezone.utc)
+        amz_date = now.strftime("%Y%m%dT%H%M%SZ")
+        scope = f"{amz_date[:8]}/{self.region}/s3/aws4_request"
+        headers = {"host": self.host, "x-amz-content-sha256": payload_hash, "x-amz-date": amz_date}
+        signed = ";".join(sorted(headers))
+        canonical_request = "\n".join([
+            method, path, "",
+            "".join(f"{name}:{headers[name]}\n" for name in sorted(headers)),
+            signed, payload_hash,
+        ])
+        string_to_sign = "\n".join([
+            "AWS4-HMAC-SHA256", amz_date, scope,
+            hashlib.sha256(canonical_request.encode("utf-8")).hexdigest(),
+        ])
+        key = ("AWS4" + self.secret_key).encode("utf-8")
+        for part in (amz_date[:8], self.region, "s3", "aws4_request"):
+            key = hmac.new(key, part.encode("utf-8"), hashlib.sha256).digest()
+        signature = hmac.new(key, string_to_sign.encode("utf-8"), hashlib.sha256).hexdigest()
+        return {
+            "x-amz-content-sha256": payload_hash,
+            "x-amz-date": amz_date,
+            "Authorization": f"AWS4-HMAC-SHA256 Credential={self.access_key}/{scope}, "
+                             f"SignedHeaders={signed}, Signature={signature}",
+        }
+
+    def _request(self, method: str, key: str, data: bytes = b"", **headers: str):
+        path = self._path(key)
+        signed = self._signed_headers(method, path, hashlib.sha256(data).hexdigest())
+        return self.http.request(method, self.endpoint + path, data=data or None, headers={**headers, **signed})
+
+    def put(self, key: str, data: bytes) -> None:
+        response = self._request("PUT", key, data, **{"Content-Type": "audio/mpeg"})
+        response.raise_for_status()
+
+    def get(self, key: str) -> Optional[bytes]:
+        response = self._request("GET", key)
+        if response.status_code == 404:
+            return None
+        response.raise_for_status()
+        return response.content
+
+    def delete(self, key: str) -> None:
+        response = self._request("DELETE", key)
+        if response.status_code != 404:
+            response.raise_for_status()
+
+    def describe(self) -> str:
+        return f"s3://{self.bucket}/{self.prefix} at {self.endpoint}"
+
+
+def store_from_config(config: Dict[str, Any], http_client_factory) -> Optional[MediaStore]:
+    """
+    The MediaStore named by MEDIA_STORE: "file:///shared/dir",
+    "s3://bucket[/prefix]" (with MEDIA_STORE_ENDPOINT, _REGION, _ACCESS_KEY
+    and _SECRET_KEY), or None when it is empty and media stays on this
+    instance's disk. http_client_factory is only called for S3.
+    """
+    url = config.get("MEDIA_STORE")
+    if not url:
+        return None
+    parts = urlsplit(url)
+    if parts.scheme == "file":
+        return LocalStore(parts.path)
+    if parts.scheme == "s3":
+        region = config.get("MEDIA_STORE_REGION") or "us-east-1"
+        return S3Store(
+            http_client_factory(),
+            endpoint=config.get("MEDIA_STORE_ENDPOINT") or f"https://s3.{region}.amazonaws.com",
+            bucket=parts.netloc,
+            access_key=config.get("MEDIA_STORE_ACCESS_KEY") or "",
+            secret_key=config.get("MEDIA_STORE_SECRET_KEY") or "",
+            region=region,
+            prefix=parts.path,
+        )
+    raise ValueError(f"Unsupported MEDIA_STORE {url!r}; use file:///path or s3://bucket/prefix")
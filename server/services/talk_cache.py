@@ -0,0 +1,189 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import sqlite3
+import threading
+from typing import Dict, Any, Callable, Optional
+from services.audio_cache import normalize_text
+
+logger = logging.getLogger(__name__)
+
+
+class TalkCache:
+    """
+    Persistent map from a D-ID request fingerprint to the rendered talk.
+
+    A row is written as "pending" once the /talks POST returns and is filled
+    in with the result_url when the webhook arrives. Identical requests then
+    either reuse the finished video or join the pending talk instead of
+    starting a new render. Threads submitting the same fingerprint at the
+    same moment wait for the first submission rather than racing it. Rows
+    older than ttl can no longer be used and are deleted, at most every
+    prune_interval seconds as new talks are recorded.
+    """
+
+    def __init__(self, db_path: str, ttl: float = 12 * 3600,
+                 pending_ttl: float = 600, submit_timeout: float = 60, prune_interval: float = 600):
+        self.db_path = db_path
+        self.ttl = ttl
+        self.pending_ttl = pending_ttl
+        self.submit_timeout = submit_timeout
+        self.prune_interval = prune_interval
+        self._pruned_at = 0.0
+        self.hits = 0
+        self.joins = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._inflight = {}  # fingerprint -> threading.Event
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        # Shared by every instance and worker on DATA_DIR: WAL lets readers
+        # run alongside a writer, and the timeout waits out the other writers.
+        self._conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS talks (
+                fingerprint TEXT PRIMARY KEY,
+                talk_id TEXT,
+                status TEXT,
+                result_url TEXT,
+                metadata TEXT,
+                created_at REAL,
+                updated_at REAL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS talks_talk_id ON talks (talk_id)")
+        self._conn.commit()
+
+    @staticmethod
+    def make_fingerprint(source_url: str, script: Dict[str, Any]) -> str:
+        """Hash the parts of a /talks payload that determine the rendered video."""
+        if "input" in script:
+            script = dict(script, input=normalize_text(script["input"]))
+        material = json.dumps({"source_url": source_url, "script": script}, sort_keys=True)
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    def _get(self, fingerprint: str) -> Optional[Dict[str, Any]]:
+        row = self._conn.execute(
+            "SELECT talk_id, status, result_url, metadata, created_at, updated_at "
+            "FROM talks WHERE fingerprint = ?", (fingerprint,)
+        ).fetchone()
+        if row is None:
+            return None
+        return {
+            "talk_id": row[0],
+            "status": row[1],
+            "result_url": row[2],
+            "metadata": json.loads(row[3]) if row[3] else {},
+            "created_at": row[4],
+            "updated_at": row[5],
+        }
+
+    def _is_fresh(self, row: Dict[str, Any]) -> bool:
+        age = time.time() - row["updated_at"]
+        if row["status"] == "done":
+            return age < self.ttl
+        return age < self.pending_ttl
+
+    def get_or_submit(self, fingerprint: str, submit: Callable[[], Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Return the cached or in-flight talk for fingerprint, or call submit()
+        to start a new one. submit must return a dict with talk_id and status.
+        Cached results carry "cached": True, joined ones "joined": True.
+        """
+        while True:
+            with self._lock:
+                row = self._get(fingerprint)
+                if row and self._is_fresh(row):
+                    if row["status"] == "done" and row["result_url"]:
+                        self.hits += 1
+                        logger.info(f"Talk cache hit for talk {row['talk_id']}")
+                        return {
+                            "talk_id": row["talk_id"],
+                            "status": "done",
+                            "result_url": row["result_url"],
+                            "cached": True,
+                        }
+                    self.joins += 1
+                    logger.info(f"Joining in-flight talk {row['talk_id']}")
+                    return {"talk_id": row["talk_id"], "status": row["status"], "joined": True}
+                event = self._inflight.get(fingerprint)
+                if event is None:
+                    event = threading.Event()
+                    self._inflight[fingerprint] = event
+                    self.misses += 1
+                    break
+            # Another thread is submitting this exact request; wait and re-check.
+            event.wait(self.submit_timeout)
+
+        try:
+            result = submit()
+            if result.get("talk_id"):
+                self._record_submitted(fingerprint, result["talk_id"], result.get("status"))
+            return result
+        finally:
+            with self._lock:
+                self._inflight.pop(fingerprint, None)
+            event.set()
+
+    def _record_submitted(self, fingerprint: str, talk_id: str, status: Optional[str]) -> None:
+        now = time.time()
+        if now - self._pruned_at > self.prune_interval:
+            self.prune()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO talks "
+                "(fingerprint, talk_id, status, result_url, metadata, created_at, updated_at) "
+                "VALUES (?, ?, ?, NULL, NULL, ?, ?)",
+                (fingerprint, talk_id, status or "created", now, now)
+            )
+            self._conn.commit()
+
+    def complete(self, data: Dict[str, Any]) -> bool:
+        """
+        Record a D-ID webhook payload. Finished talks store their result_url;
+        failed ones are dropped so the next identical request renders again.
+        Returns True if the talk was known to the cache.
+        """
+        talk_id = data.get("id")
+        if not talk_id:
+            return False
+        with self._lock:
+            if data.get("status") == "done" and data.get("result_url"):
+                cursor = self._conn.execute(
+                    "UPDATE talks SET status = 'done', result_url = ?, metadata = ?, updated_at = ? "
+                    "WHERE talk_id = ?",
+                    (data["result_url"], json.dumps(data), time.time(), talk_id)
+                )
+            elif data.get("status") in ("error", "rejected"):
+                cursor = self._conn.execute("DELETE FROM talks WHERE talk_id = ?", (talk_id,))
+            else:
+                cursor = self._conn.execute(
+                    "UPDATE talks SET status = ?, updated_at = ? WHERE talk_id = ?",
+                    (data.get("status"), time.time(), talk_id)
+                )
+            self._conn.commit()
+            return cursor.rowcount > 0
+
+    def prune(self) -> int:
+        """Delete talks not updated for ttl seconds, finished or not; returns how many."""
+        with self._lock:
+            self._pruned_at = time.time()
+            cursor = self._conn.execute("DELETE FROM talks WHERE updated_at < ?", (self._pruned_at - self.ttl,))
+            self._conn.commit()
+        if cursor.rowcount:
+            logger.info(f"Pruned {cursor.rowcount} expired talks from the talk cache")
+        return cursor.rowcount
+
+    def get_by_talk_id(self, talk_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT fingerprint FROM talks WHERE talk_id = ?", (talk_id,)
+            ).fetchone()
+            return self._get(row[0]) if row else None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            count = self._conn.execute("SELECT COUNT(*) FROM talks").fetchone()[0]
+            return {"hits": self.hits, "joins": self.joins, "misses": self.misses, "entries": count}
@@ -0,0 +1,79 @@
+import re
+from typing import List
+
+SENTENCE_END = re.compile(r'(?:(?<=[.!?…])|(?<=[.!?…]["\')\]]))\s+|\n\s*\n')
+CLAUSE_END = re.compile(r'(?<=[,;:—–])\s+')
+
+
+def split_sentences(text: str) -> List[str]:
+    """Split text into sentences on terminal punctuation and paragraph breaks."""
+    return [s.strip() for s in SENTENCE_END.split(text) if s and s.strip()]
+
+
+def _split_long(sentence: str, max_chars: int) -> List[str]:
+    """Split a sentence that is over the limit at clause, then word, boundaries."""
+    parts = []
+    for clause in CLAUSE_END.split(sentence):
+        if len(clause) <= max_chars:
+            parts.append(clause)
+            continue
+        words = clause.split()
+        current = ""
+        for word in words:
+            while len(word) > max_chars:
+                # A single "word" over the limit (e.g. a URL); cut it hard.
+                if current:
+                    parts.append(current)
+                    current = ""
+                parts.append(word[:max_chars])
+                word = word[max_chars:]
+            candidate = f"{current} {word}" if current else word
+            if len(candidate) > max_chars:
+                parts.append(current)
+                current = word
+            else:
+                current = candidate
+        if current:
+            parts.append(current)
+    return _pack(parts, max_chars)
+
+
+def _pack(pieces: List[str], max_chars: int) -> List[str]:
+    """Greedily join consecutive pieces while they fit under max_chars."""
+    chunks = []
+    current = ""
+    for piece in pieces:
+        candidate = f"{current} {piece}" if current else piece
+        if len(candidate) <= max_chars:
+            current = candidate
+        else:
+            if current:
+                chunks.append(current)
+            current = piece
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def split_segments(text: str, max_chars: int) -> List[str]:
+    """
+    Split text into sentences, breaking only sentences over max_chars further.
+    Unlike chunk_text, short sentences are not packed together, so a segment
+    stays the same while text is appended after it.
+    """
+    segments = []
+    for sentence in split_sentences(text):
+        if len(sentence) <= max_chars:
+            segments.append(sentence)
+        else:
+            segments.extend(_split_long(sentence, max_chars))
+    return segments
+
+
+def chunk_text(text: str, max_chars: int) -> List[str]:
+    """
+    Split text into chunks of at most max_chars characters, breaking at
+    sentence boundaries where possible and at clause or word boundaries
+    only for sentences that are too long on their own.
+    """
+    return _pack(split_segments(text, max_chars), max_chars)
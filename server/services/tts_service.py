@@ -1,101 +1,292 @@
-import os
+import re
 import time
 import logging
 import requests
+from concurrent.futures import ThreadPoolExecutor
 from flask import current_app
-from typing import Dict, Any
+from typing import Dict, Any, Callable, List, Optional, Tuple
+from services import mp3
+from services.text_chunker import chunk_text, split_segments
+from services.metrics import STAGE_SECONDS, SPECULATIVE_SEGMENTS, INCREMENTAL_SEGMENTS
+from services.scheduler import Overloaded, raise_if_throttled
 
-# Minimal logging configuration
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-def cleanup_folder(folder_path: str, max_files: int = 3) -> None:
-    """
-    Keeps only the most recent max_files in the folder,
-    deleting older ones.
-    """
-    files = [
-        os.path.join(folder_path, f)
-        for f in os.listdir(folder_path)
-        if os.path.isfile(os.path.join(folder_path, f))
-    ]
-    if len(files) > max_files:
-        # Sort files by modification time (oldest first)
-        files.sort(key=lambda x: os.path.getmtime(x))
-        # Delete the oldest files
-        files_to_delete = files[:len(files) - max_files]
-        for file in files_to_delete:
-            os.remove(file)
-            logger.info(f"Deleted old audio file: {file}")
+# A draft's last sentence is only synthesized once it has its closing punctuation.
+SENTENCE_DONE = re.compile(r'[.!?…]["\')\]]?$')
 
 class TTSService:
-    def __init__(self):
+    def __init__(self, http_client=None, profile=None):
+        self.http = http_client or current_app.extensions['http_client']
+        self.profile = profile or current_app.extensions['profiles'].get()
         self.api_key = current_app.config['ELEVENLABS_API_KEY']
-        self.voice_id = current_app.config['ELEVENLABS_VOICE_ID']
+        self.voice_id = self.profile.voice_id
         self.max_chars = current_app.config['ELEVENLABS_MAX_CHARS']
+        self.model_id = self.profile.model_id
+        self.voice_settings = self.profile.voice_settings
+        self.cache = current_app.extensions['audio_cache']
+        self.api_url = current_app.config['ELEVENLABS_API_URL']
+        self.streaming = current_app.config['ELEVENLABS_STREAMING']
+        self.max_workers = current_app.config['TTS_MAX_WORKERS']
+        self.limiter = self.profile.limiter('elevenlabs', current_app.extensions['upstream_limits']['elevenlabs'])
+        self.speculative = current_app.extensions['speculative_audio'] if current_app.config['SPECULATIVE_TTS'] else None
+        self.speculative_wait = current_app.config['SPECULATIVE_TTS_WAIT']
+        self.segment_gap_ms = current_app.config['AUDIO_SEGMENT_GAP_MS']
+        self.replaygain = current_app.config['AUDIO_REPLAYGAIN']
+        self.ffmpeg_path = current_app.config['FFMPEG_PATH']
         if not self.api_key:
             logger.error("ElevenLabs API key is missing")
             raise ValueError("ELEVENLABS_API_KEY is required when using ElevenLabs provider")
-        logger.info(f"TTSService initialized using ElevenLabs with voice ID: {self.voice_id}")
+        logger.info(f"TTSService initialized using ElevenLabs with profile {self.profile.name} (voice ID: {self.voice_id})")
 
     def _validate_text(self, text: str) -> str:
-        """Truncate text if it exceeds the max character limit."""
-        if len(text) > self.max_chars:
-            logger.warning(f"Text length exceeds {self.max_chars} characters. Truncating...")
-            return text[:self.max_chars]
+        """Strip surrounding whitespace and reject empty text."""
+        text = text.strip()
+        if not text:
+            raise ValueError("Text is empty")
         return text
 
-    def generate_speech(self, text: str) -> Dict[str, Any]:
+    def generate_speech(self, text: str,
+                        on_stream_start: Optional[Callable[[str], None]] = None,
+                        incremental: bool = False) -> Dict[str, Any]:
         """
         Generate TTS audio from text using ElevenLabs.
-        The audio file is saved in AUDIO_DIR and only the latest three
-        files are kept.
+        The audio file is stored in the content-addressed cache in AUDIO_DIR,
+        so repeated requests for the same text and voice skip ElevenLabs.
+        In streaming mode, on_stream_start is called with the filename as soon
+        as the first bytes are on disk; the call still returns only once the
+        file is complete. Audio synthesized in memory is also returned under
+        'audio', so callers can hand it on without reading the file back.
+        If sentences of the text were already synthesized from the user's
+        drafts (see prefetch_draft), the audio is built from them instead.
+        With incremental, the text is synthesized sentence by sentence and
+        each sentence is cached on its own, so after an edit only the changed
+        sentences (and the ones right after them, whose context changed) go
+        to ElevenLabs; the result's 'delta' reports what was reused.
         """
-        # Generate a filename; using a timestamp here ensures uniqueness.
-        filename = f'output_{int(time.time())}.mp3'
-        audio_path = os.path.join(current_app.config['AUDIO_DIR'], filename)
         try:
             validated_text = self._validate_text(text)
-            result = self._generate_with_elevenlabs(validated_text, audio_path)
-            # Clean up older files, keeping only the latest 3
-            cleanup_folder(current_app.config['AUDIO_DIR'], max_files=3)
-            return result
+            key = self.cache.make_key(validated_text, self.voice_id, self.model_id, self.voice_settings)
+            filename = self.cache.get(key)
+            if filename:
+                logger.info(f"ElevenLabs: cache hit for {filename}")
+                result = {'filename': filename, 'cached': True}
+                if incremental:
+                    chars = [len(segment) for segment, _, _ in self._segment_plan(validated_text)]
+                    result['delta'] = self._delta_report(chars, [])
+                return result
+            if incremental:
+                return self._generate_from_segments(key, self._segment_plan(validated_text), persist=True)
+            if self.speculative is not None:
+                plan = self._segment_plan(validated_text)
+                if any(self.speculative.has(segment_key) for _, _, segment_key in plan):
+                    return self._generate_from_segments(key, plan)
+            if len(validated_text) > self.max_chars:
+                return self._generate_long_speech(validated_text, key)
+            if self.streaming:
+                filename = self._stream_with_elevenlabs(validated_text, key, on_stream_start)
+            else:
+                audio_data = self._generate_with_elevenlabs(validated_text)
+                filename = self.cache.put(key, audio_data)
+                logger.info(f"ElevenLabs: Audio saved to {filename}")
+                return {'filename': filename, 'cached': False, 'audio': audio_data}
+            logger.info(f"ElevenLabs: Audio saved to {filename}")
+            return {'filename': filename, 'cached': False}
         except Exception as e:
             logger.error(f"TTS generation failed: {e}")
             raise
 
-    def _generate_with_elevenlabs(self, text: str, output_path: str) -> Dict[str, Any]:
-        # Use the basic text-to-speech endpoint (without /with-timestamps)
-        url = f"https://api.elevenlabs.io/v1/text-to-speech/{self.voice_id}"
-        headers = {
-            "Accept": "application/json",
-            "Content-Type": "application/json",
-            "xi-api-key": self.api_key
+    def _generate_long_speech(self, text: str, key: str) -> Dict[str, Any]:
+        """
+        Split text over the ElevenLabs limit at sentence boundaries, synthesize
+        the chunks concurrently on a bounded pool and join them in order into
+        one file. Each chunk is cached on its own, so an edit to a long script
+        only re-synthesizes the changed chunk and its immediate neighbours.
+        """
+        chunks = chunk_text(text, self.max_chars)
+        logger.info(f"Text length exceeds {self.max_chars} characters. Synthesizing {len(chunks)} chunks...")
+        jobs = [
+            (index, chunk,
+             chunks[index - 1] if index > 0 else None,
+             chunks[index + 1] if index + 1 < len(chunks) else None)
+            for index, chunk in enumerate(chunks)
+        ]
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            results = list(pool.map(lambda job: self._synthesize_chunk(*job), jobs))
+
+        audio_data = self._stitch([result.pop("audio") for result in results])
+        filename = self.cache.put(key, audio_data)
+        logger.info(f"ElevenLabs: Stitched {len(chunks)} chunks into {filename}")
+        return {'filename': filename, 'cached': False, 'chunks': results, 'audio': audio_data}
+
+    def _stitch(self, parts: List[bytes]) -> bytes:
+        """
+        Join synthesized MP3 parts into one file at frame boundaries, with
+        AUDIO_SEGMENT_GAP_MS of silence between them, and tag the result with
+        its ReplayGain if AUDIO_REPLAYGAIN is on. Never re-encodes.
+        """
+        try:
+            audio_data = mp3.stitch(parts, gap_ms=self.segment_gap_ms)
+        except ValueError as e:
+            logger.warning(f"Could not stitch audio at frame boundaries ({e}); concatenating it as is")
+            audio_data = b"".join(parts)
+        if self.replaygain:
+            try:
+                audio_data, gain, peak = mp3.tag_replaygain(audio_data, self.ffmpeg_path)
+                logger.info(f"ReplayGain {gain:+.2f} dB, peak {peak:.3f}")
+            except mp3.AudioDecodeError as e:
+                logger.warning(f"Skipping ReplayGain tag: {e}")
+        return audio_data
+
+    def _segment_plan(self, text: str) -> List[Tuple[str, Dict[str, Optional[str]], str]]:
+        """
+        (segment, context, cache key) for each sentence of text. Only the
+        previous sentence is used as context, so a sentence's key does not
+        change while the user keeps typing after it.
+        """
+        segments = split_segments(text, self.max_chars)
+        plan = []
+        for index, segment in enumerate(segments):
+            context = {"previous_text": segments[index - 1] if index > 0 else None}
+            key = self.cache.make_key(segment, self.voice_id, self.model_id, self.voice_settings, context)
+            plan.append((segment, context, key))
+        return plan
+
+    def prefetch_draft(self, text: str) -> int:
+        """
+        Synthesize the finished sentences of draft text into the speculative
+        store, skipping ones already there, and return how many were
+        synthesized. Stops early rather than compete with real requests
+        waiting for ElevenLabs.
+        """
+        text = text.strip()
+        if self.speculative is None or not text:
+            return 0
+        plan = self._segment_plan(text)
+        if not SENTENCE_DONE.search(text):
+            plan = plan[:-1]
+        shared_limiter = current_app.extensions['upstream_limits']['elevenlabs']
+        synthesized = 0
+        for segment, context, key in plan:
+            if shared_limiter.waiting:
+                break
+            if not self.speculative.claim(key):
+                continue
+            try:
+                audio_data = self._generate_with_elevenlabs(segment, context)
+            except Exception:
+                self.speculative.release(key)
+                raise
+            self.speculative.put(key, audio_data)
+            SPECULATIVE_SEGMENTS.inc(outcome="synthesized")
+            synthesized += 1
+        return synthesized
+
+    def _generate_from_segments(self, key: str, plan: List[Tuple[str, Dict[str, Optional[str]], str]],
+                                persist: bool = False) -> Dict[str, Any]:
+        """
+        Join the speculatively synthesized sentences, waiting for ones still
+        in progress and synthesizing only those that were never drafted or
+        have changed since. With persist, sentences are also looked up in and
+        added to the audio cache, and a 'delta' report is returned.
+        """
+        def segment_audio(job) -> Dict[str, Any]:
+            index, (segment, context, segment_key) = job
+            started = time.perf_counter()
+            audio_data, source = None, "synthesized"
+            if persist:
+                filename = self.cache.get(segment_key)
+                if filename:
+                    audio_data, source = self.cache.read(filename), "cache"
+            if audio_data is None and self.speculative is not None:
+                audio_data = self.speculative.take(segment_key, timeout=self.speculative_wait)
+                SPECULATIVE_SEGMENTS.inc(outcome="missed" if audio_data is None else "reused")
+                if audio_data is not None:
+                    source = "draft"
+            if audio_data is None:
+                audio_data = self._generate_with_elevenlabs(segment, context)
+            if persist:
+                INCREMENTAL_SEGMENTS.inc(outcome="synthesized" if source == "synthesized" else "reused")
+                if source != "cache":
+                    self.cache.put(segment_key, audio_data)
+            return {
+                "index": index,
+                "chars": len(segment),
+                "reused": source != "synthesized",
+                "source": source,
+                "seconds": round(time.perf_counter() - started, 3),
+                "audio": audio_data,
+            }
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            results = list(pool.map(segment_audio, enumerate(plan)))
+        audio_data = self._stitch([result.pop("audio") for result in results])
+        filename = self.cache.put(key, audio_data)
+        reused = sum(result["reused"] for result in results)
+        logger.info(f"ElevenLabs: Built {filename} reusing {reused} of {len(results)} segments")
+        result = {'filename': filename, 'cached': False, 'segments': results, 'audio': audio_data}
+        if persist:
+            result['delta'] = self._delta_report(
+                [segment["chars"] for segment in results],
+                [segment["index"] for segment in results if not segment["reused"]]
+            )
+        return result
+
+    @staticmethod
+    def _delta_report(chars: List[int], changed: List[int]) -> Dict[str, Any]:
+        """How much of an incremental render was reused, given each sentence's length and the synthesized ones."""
+        synthesized_chars = sum(chars[index] for index in changed)
+        return {
+            "sentences": len(chars),
+            "reused": len(chars) - len(changed),
+            "synthesized": len(changed),
+            "changed": changed,
+            "chars_reused": sum(chars) - synthesized_chars,
+            "chars_synthesized": synthesized_chars,
         }
-        data = {
-            "text": text,
-            "model_id": "eleven_multilingual_v2",
-            "voice_settings": {
-                "stability": 0.8,
-                "similarity_boost": 0.75,
-                "style": 0.0,
-                "use_speaker_boost": True,
-                "speed": 0.8
-            },
-            "output_format": "mp3_44100_128",
-            "apply_text_normalization": "on"
+
+    def _synthesize_chunk(self, index: int, text: str, previous_text: Optional[str],
+                          next_text: Optional[str]) -> Dict[str, Any]:
+        """Synthesize one chunk, passing its neighbours as prosody context."""
+        started = time.perf_counter()
+        context = {"previous_text": previous_text, "next_text": next_text}
+        key = self.cache.make_key(text, self.voice_id, self.model_id, self.voice_settings, context)
+        filename = self.cache.get(key)
+        if filename:
+            audio_data = self.cache.read(filename)
+            cached = True
+        else:
+            audio_data = self._generate_with_elevenlabs(text, context)
+            self.cache.put(key, audio_data)
+            cached = False
+        return {
+            "index": index,
+            "chars": len(text),
+            "cached": cached,
+            "seconds": round(time.perf_counter() - started, 3),
+            "audio": audio_data,
         }
+
+    def _build_request(self, text: str,
+                       context: Optional[Dict[str, Optional[str]]] = None) -> Tuple[Dict[str, str], Dict[str, Any]]:
+        return self.profile.tts_request(text, context)
+
+    def _generate_with_elevenlabs(self, text: str,
+                                  context: Optional[Dict[str, Optional[str]]] = None) -> bytes:
+        # Use the basic text-to-speech endpoint (without /with-timestamps)
+        url = f"{self.api_url}/{self.voice_id}"
+        headers, data = self._build_request(text, context)
         try:
-            response = requests.post(url, json=data, headers=headers)
+            with self.limiter.slot(), STAGE_SECONDS.time(stage="tts"):
+                response = self.http.post(url, json=data, headers=headers)
+            raise_if_throttled(response, "elevenlabs")
             if response.status_code != 200:
                 err_msg = f"ElevenLabs error {response.status_code}: {response.text}"
                 logger.error(err_msg)
                 raise Exception(err_msg)
-            audio_data = response.content
-            with open(output_path, 'wb') as f:
-                f.write(audio_data)
-            logger.info(f"ElevenLabs: Audio saved to {output_path}")
-            return {'filename': os.path.basename(output_path)}
+            return response.content
+        except Overloaded:
+            raise
         except requests.exceptions.RequestException as e:
             err_msg = f"Network error: {e}"
             logger.error(err_msg)
@@ -104,3 +295,46 @@ class TTSService:
             err_msg = f"Error generating ElevenLabs audio: {e}"
             logger.error(err_msg)
             raise Exception(err_msg)
+
+    def _stream_with_elevenlabs(self, text: str, key: str,
+                                on_stream_start: Optional[Callable[[str], None]] = None) -> str:
+        """
+        Use the streaming endpoint and write chunks to disk as they arrive,
+        so memory use stays flat and serve_audio can start sending the file
+        before ElevenLabs has finished.
+        """
+        url = f"{self.api_url}/{self.voice_id}/stream"
+        headers, data = self._build_request(text)
+        headers["Accept"] = "audio/mpeg"
+
+        stream, owner = self.cache.open_stream(key)
+        if not owner:
+            # Same audio is already being streamed by another request.
+            if on_stream_start:
+                on_stream_start(stream.filename)
+            if not stream.wait():
+                raise Exception(f"Error generating ElevenLabs audio: {stream.error}")
+            return stream.filename
+
+        try:
+            with self.limiter.slot(), STAGE_SECONDS.time(stage="tts"), \
+                    self.http.post(url, json=data, headers=headers, stream=True) as response:
+                raise_if_throttled(response, "elevenlabs")
+                if response.status_code != 200:
+                    raise Exception(f"ElevenLabs error {response.status_code}: {response.text}")
+                for chunk in response.iter_content(chunk_size=16 * 1024):
+                    if not chunk:
+                        continue
+                    first_chunk = stream.size == 0
+                    stream.write(chunk)
+                    if first_chunk and on_stream_start:
+                        on_stream_start(stream.filename)
+            return stream.commit()
+        except Overloaded as e:
+            stream.abort(e)
+            raise
+        except Exception as e:
+            stream.abort(e)
+            err_msg = f"Error streaming ElevenLabs audio: {e}"
+            logger.error(err_msg)
+            raise Exception(err_msg)
@@ -0,0 +1,57 @@
+import pytest
+
+import routes.api
+from app import app as flask_app
+from services.scheduler import JobScheduler, Overloaded
+
+
+@pytest.fixture
+def app(monkeypatch):
+    monkeypatch.setitem(flask_app.config, "DURABLE_JOBS", False)
+    monkeypatch.setattr(routes.api, "find_library_clip", lambda app, text, profile: None)
+    return flask_app
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+def test_generate_answers_429_with_retry_after_when_the_queue_is_full(app, client, monkeypatch):
+    scheduler = JobScheduler(workers=1, max_queued=0)
+    scheduler.start(lambda work: None)  # No worker threads; nothing gets in anyway
+    monkeypatch.setitem(app.extensions, "job_scheduler", scheduler)
+
+    response = client.post("/api/generate", json={"text": "Hello"})
+
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "1"
+    assert response.get_json() == {"error": "Generation queue is full; try again shortly", "retry_after": 1}
+    assert scheduler.stats()["rejected"] == 1
+
+
+def test_fast_generate_answers_429_when_an_upstream_is_busy(client, monkeypatch):
+    def busy(app, text, profile):
+        raise Overloaded("did is at its concurrency limit; try again shortly", 2.5)
+
+    monkeypatch.setattr(routes.api, "find_library_clip", busy)
+
+    response = client.post("/api/fast-generate", json={"text": "Hello"})
+
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "3"
+    assert response.get_json()["retry_after"] == 3
+
+
+@pytest.mark.parametrize("route", ["/api/generate", "/api/fast-generate"])
+@pytest.mark.parametrize("profile, error", [
+    ("nobody", "Unknown profile: nobody"),
+    (["magen"], "Profile name must be a string, not list"),
+    ({"x": 1}, "Profile name must be a string, not dict"),
+    (7, "Profile name must be a string, not int"),
+])
+def test_bad_profiles_are_400(client, route, profile, error):
+    response = client.post(route, json={"text": "Hello", "profile": profile})
+
+    assert response.status_code == 400
+    assert response.get_json() == {"error": error}
@@ -0,0 +1,93 @@
+import os
+import time
+
+from services.audio_cache import AudioCache
+from services.media import HotFileCache
+
+
+def age(cache: AudioCache, key: str, seconds: float) -> None:
+    path = os.path.join(cache.directory, cache.filename_for(key))
+    then = time.time() - seconds
+    os.utime(path, (then, then))
+
+
+def cached_keys(cache: AudioCache):
+    return sorted(name[:-len(".mp3")] for name in os.listdir(cache.directory) if name.endswith(".mp3"))
+
+
+def test_evicts_least_recently_used_past_the_file_limit(tmp_path):
+    cache = AudioCache(str(tmp_path), max_files=2, min_age=0)
+    cache.put("a", b"1")
+    cache.put("b", b"2")
+    assert cache.get("a") == "a.mp3"
+
+    cache.put("c", b"3")
+
+    assert cached_keys(cache) == ["a", "c"]
+    assert cache.stats()["files"] == 2
+    assert cache.stats()["evictions"] == 1
+
+
+def test_evicts_past_the_byte_limit(tmp_path):
+    cache = AudioCache(str(tmp_path), max_bytes=250, min_age=0)
+    for key in ("a", "b", "c"):
+        cache.put(key, b"x" * 100)
+
+    assert cached_keys(cache) == ["b", "c"]
+    assert cache.stats()["bytes"] == 200
+
+
+def test_young_files_are_not_evicted(tmp_path):
+    cache = AudioCache(str(tmp_path), max_files=2, min_age=300)
+    for key in ("a", "b", "c"):
+        cache.put(key, b"x")
+    assert cached_keys(cache) == ["a", "b", "c"]
+
+    age(cache, "a", 600)
+    age(cache, "c", 600)
+    cache.put("d", b"x")
+
+    # "b" is older in LRU order than "c", but still young.
+    assert cached_keys(cache) == ["b", "d"]
+
+
+def test_files_written_by_another_process_are_indexed(tmp_path):
+    cache = AudioCache(str(tmp_path), max_files=2, max_bytes=10_000, min_age=0)
+    other = AudioCache(str(tmp_path), max_files=2, max_bytes=10_000, min_age=0)
+    other.put("a", b"x" * 100)
+    other.put("b", b"x" * 100)
+
+    assert cache.get("a") == "a.mp3"
+    assert cache.fetch("b.mp3")
+    assert cache.stats()["files"] == 2
+    assert cache.stats()["bytes"] == 200
+    assert cache.stats()["hits"] == 1
+
+    cache.put("c", b"x" * 100)
+
+    assert cached_keys(cache) == ["b", "c"]
+
+
+def test_loading_indexes_existing_files_and_removes_stale_partials(tmp_path):
+    for name in ("a.mp3", "b.mp3.part", "c.mp3.123.tmp", "d.mp3.part"):
+        (tmp_path / name).write_bytes(b"x" * 10)
+    old = time.time() - 600
+    for name in ("a.mp3", "b.mp3.part", "c.mp3.123.tmp"):
+        os.utime(tmp_path / name, (old, old))
+
+    cache = AudioCache(str(tmp_path), min_age=300)
+
+    assert sorted(os.listdir(tmp_path)) == ["a.mp3", "d.mp3.part"]
+    assert cache.stats()["files"] == 1
+    assert cache.stats()["bytes"] == 10
+
+
+def test_evicted_files_leave_the_hot_cache(tmp_path):
+    hot = HotFileCache()
+    cache = AudioCache(str(tmp_path), max_files=1, min_age=0, hot_cache=hot)
+    cache.put("a", b"first")
+    cache.put("b", b"second")
+
+    assert cached_keys(cache) == ["b"]
+    assert hot.stats()["files"] == 1
+    assert cache.read("b.mp3") == b"second"
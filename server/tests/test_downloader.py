@@ -0,0 +1,160 @@
+import os
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from services.downloader import Downloader, DownloadError
+from services.http_client import HTTPClient
+
+CONTENT = os.urandom(10_000)
+
+
+class FileServer(ThreadingHTTPServer):
+    """
+    Serves one file at any path. The i-th request gets contents[i] (the
+    last one from then on), so a test can change the file between the
+    probe and the download. Range requests are honoured unless ranges is
+    False, and the Range header of every request is recorded.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, contents, etag='"v1"', ranges=True):
+        super().__init__(("127.0.0.1", 0), FileHandler)
+        self.contents = list(contents)
+        self.etag = etag
+        self.ranges = ranges
+        self.requested = []
+        self._lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}/talk.mp4"
+
+    def next_content(self, range_header):
+        with self._lock:
+            content = self.contents[min(len(self.requested), len(self.contents) - 1)]
+            self.requested.append(range_header)
+            return content
+
+
+class FileHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        range_header = self.headers.get("Range")
+        content = self.server.next_content(range_header)
+        if_range = self.headers.get("If-Range")
+        if range_header and self.server.ranges and (if_range is None or if_range == self.server.etag):
+            first, _, last = range_header[len("bytes="):].partition("-")
+            start, end = int(first), min(int(last), len(content) - 1)
+            body = content[start:end + 1]
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end}/{len(content)}")
+        else:
+            body = content
+            self.send_response(200)
+        self.send_header("ETag", self.server.etag)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def serve():
+    servers = []
+
+    def start(contents=(CONTENT,), **options) -> FileServer:
+        server = FileServer(contents, **options)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture
+def downloader():
+    return Downloader(HTTPClient(retries=0), parts=4, min_part_size=1024)
+
+
+def read(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def write_partial(path: str, ranges, etag='"v1"', size=len(CONTENT), data=CONTENT) -> None:
+    """A .part/.part.json pair as left by an interrupted download."""
+    with open(f"{path}.part", "wb") as f:
+        f.write(bytes(size))
+        for byte_range in ranges:
+            f.seek(byte_range["start"])
+            f.write(data[byte_range["start"]:byte_range["start"] + byte_range["done"]])
+    with open(f"{path}.part.json", "w", encoding="utf-8") as f:
+        json.dump({"size": size, "etag": etag, "ranges": ranges}, f)
+
+
+def test_split_ranges_are_reassembled(serve, downloader, tmp_path):
+    server = serve()
+    path = downloader.download(server.url, str(tmp_path), "talk.mp4")
+
+    assert read(path) == CONTENT
+    assert server.requested[0] == "bytes=0-0"
+    assert sorted(server.requested[1:]) == ["bytes=0-2499", "bytes=2500-4999", "bytes=5000-7499", "bytes=7500-9999"]
+    assert os.listdir(tmp_path) == ["talk.mp4"]
+
+
+def test_resumes_from_partial_download(serve, downloader, tmp_path):
+    server = serve()
+    ranges = [
+        {"start": 0, "end": 2500, "done": 2500},
+        {"start": 2500, "end": 5000, "done": 1000},
+        {"start": 5000, "end": 7500, "done": 0},
+        {"start": 7500, "end": 10000, "done": 2499},
+    ]
+    write_partial(str(tmp_path / "talk.mp4"), ranges)
+
+    path = downloader.download(server.url, str(tmp_path), "talk.mp4")
+
+    assert read(path) == CONTENT
+    assert sorted(server.requested[1:]) == ["bytes=3500-4999", "bytes=5000-7499", "bytes=9999-9999"]
+    assert os.listdir(tmp_path) == ["talk.mp4"]
+
+
+@pytest.mark.parametrize("etag, size", [('"v0"', len(CONTENT)), ('"v1"', len(CONTENT) + 1)])
+def test_restarts_when_remote_file_changed(serve, downloader, tmp_path, etag, size):
+    server = serve()
+    stale = os.urandom(size)
+    ranges = [{"start": 0, "end": size, "done": size // 2}]
+    write_partial(str(tmp_path / "talk.mp4"), ranges, etag=etag, size=size, data=stale)
+
+    path = downloader.download(server.url, str(tmp_path), "talk.mp4")
+
+    assert read(path) == CONTENT
+    assert len(server.requested) == 5
+    assert "bytes=0-2499" in server.requested
+
+
+def test_falls_back_to_single_get_without_range_support(serve, downloader, tmp_path):
+    server = serve(ranges=False)
+    path = downloader.download(server.url, str(tmp_path), "talk.mp4")
+
+    assert read(path) == CONTENT
+    assert server.requested == ["bytes=0-0", None]
+
+
+def test_rejects_length_mismatch(serve, downloader, tmp_path):
+    # The probe reports one size, then the server sends a shorter file.
+    server = serve(contents=(CONTENT, CONTENT[:-100]), ranges=False)
+
+    with pytest.raises(DownloadError, match="expected 10000"):
+        downloader.download(server.url, str(tmp_path), "talk.mp4")
+    assert not os.path.exists(tmp_path / "talk.mp4")
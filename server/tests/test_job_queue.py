@@ -0,0 +1,196 @@
+import types
+
+import pytest
+
+from services import job_queue
+from services.job_queue import JobQueue, QUEUED, RUNNING, DEAD
+from services.scheduler import Overloaded
+
+
+class Clock:
+    """Stands in for time.time() in the job queue, moved forward by the tests."""
+
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float) -> None:
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(job_queue, "time", types.SimpleNamespace(time=clock))
+    return clock
+
+
+@pytest.fixture
+def queue(tmp_path, clock):
+    return JobQueue(str(tmp_path / "queue.db"), max_attempts=3, retry_backoff=2, lease=60, retention=3600)
+
+
+def enqueue(queue: JobQueue, clock: Clock, text: str, **options):
+    # Jobs are ordered by created_at, so give each its own timestamp.
+    clock.advance(0.001)
+    return queue.enqueue({"text": text}, **options)
+
+
+def test_enqueue_reports_positions(queue, clock):
+    first, created = enqueue(queue, clock, "one")
+    second, _ = enqueue(queue, clock, "two")
+
+    assert created
+    assert (first["status"], first["position"], first["attempts"]) == (QUEUED, 1, 0)
+    assert second["position"] == 2
+    assert queue.waiting() == [first["job_id"], second["job_id"]]
+
+    queue.claim("w1")
+    assert queue.get(first["job_id"])["position"] == 0
+    assert queue.get(second["job_id"])["position"] == 1
+
+
+def test_idempotency_key_returns_the_existing_job(queue, clock):
+    job, created = enqueue(queue, clock, "one", idempotency_key="key-1")
+    again, created_again = enqueue(queue, clock, "one, retried", idempotency_key="key-1")
+
+    assert created and not created_again
+    assert again["job_id"] == job["job_id"]
+    assert again["payload"] == {"text": "one"}
+    assert queue.stats()["queued"] == 1
+
+
+def test_enqueue_rejects_when_full(queue, clock):
+    enqueue(queue, clock, "one", max_queued=2)
+    enqueue(queue, clock, "two", max_queued=2)
+
+    with pytest.raises(Overloaded) as error:
+        enqueue(queue, clock, "three", max_queued=2)
+    assert error.value.retry_after == 4
+    assert queue.stats()["queued"] == 2
+
+
+def test_claim_takes_the_oldest_due_job_once(queue, clock):
+    first, _ = enqueue(queue, clock, "one")
+    second, _ = enqueue(queue, clock, "two")
+
+    claimed = queue.claim("w1")
+    assert claimed["job_id"] == first["job_id"]
+    assert (claimed["status"], claimed["worker"], claimed["attempts"]) == (RUNNING, "w1", 1)
+    assert claimed["lease_expires_at"] == clock.now + 60
+    assert queue.claim("w2")["job_id"] == second["job_id"]
+    assert queue.claim("w3") is None
+
+
+def test_expired_lease_is_reclaimed_by_another_worker(queue, clock):
+    job, _ = enqueue(queue, clock, "one")
+    queue.claim("w1")
+
+    clock.advance(59)
+    assert queue.claim("w2") is None
+    clock.advance(2)
+    reclaimed = queue.claim("w2")
+
+    assert reclaimed["job_id"] == job["job_id"]
+    assert (reclaimed["worker"], reclaimed["attempts"]) == ("w2", 2)
+    assert not queue.complete(job["job_id"], "w1", {"talk_id": "late"})
+    assert queue.complete(job["job_id"], "w2", {"talk_id": "t1"})
+    assert queue.get(job["job_id"])["result"] == {"talk_id": "t1"}
+
+
+def test_expired_lease_on_last_attempt_is_dead_lettered(queue, clock):
+    job, _ = enqueue(queue, clock, "kills its worker")
+    for attempt in range(3):
+        assert queue.claim(f"w{attempt}")["attempts"] == attempt + 1
+        clock.advance(61)
+
+    assert queue.claim("w3") is None
+    dead = queue.get(job["job_id"])
+    assert dead["status"] == DEAD
+    assert dead["error"] == "Worker w2 stopped during attempt 3 of 3"
+    assert queue.take_events() == [{
+        "job_id": job["job_id"], "status": "error", "error": dead["error"], "dead_letter": True
+    }]
+
+
+def test_failure_is_retried_with_exponential_backoff(queue, clock):
+    job, _ = enqueue(queue, clock, "flaky")
+
+    queue.claim("w1")
+    assert queue.fail(job["job_id"], "w1", "upstream 503") == QUEUED
+    assert queue.get(job["job_id"])["available_at"] == clock.now + 2
+    assert queue.claim("w1") is None
+
+    clock.advance(2)
+    queue.claim("w1")
+    assert queue.fail(job["job_id"], "w1", "upstream 503") == QUEUED
+    assert queue.get(job["job_id"])["available_at"] == clock.now + 4
+
+    clock.advance(4)
+    queue.claim("w1")
+    assert queue.fail(job["job_id"], "w1", "upstream 503") == DEAD
+    assert [dead["job_id"] for dead in queue.dead_letters()] == [job["job_id"]]
+
+
+def test_failure_honours_retry_after(queue, clock):
+    job, _ = enqueue(queue, clock, "rate limited")
+    queue.claim("w1")
+
+    assert queue.fail(job["job_id"], "w1", "429", retry_after=30) == QUEUED
+    assert queue.get(job["job_id"])["available_at"] == clock.now + 30
+
+
+def test_permanent_failure_is_dead_lettered_at_once(queue, clock):
+    job, _ = enqueue(queue, clock, "")
+    queue.claim("w1")
+
+    assert queue.fail(job["job_id"], "w2", "not mine") is None
+    assert queue.fail(job["job_id"], "w1", "No text", permanent=True) == DEAD
+    assert queue.get(job["job_id"])["attempts"] == 1
+
+
+def test_requeue_gives_dead_jobs_fresh_attempts(queue, clock):
+    first, _ = enqueue(queue, clock, "one")
+    second, _ = enqueue(queue, clock, "two")
+    for job in (first, second):
+        queue.claim("w1")
+        queue.fail(job["job_id"], "w1", "bad", permanent=True)
+
+    assert queue.requeue(first["job_id"]) == 1
+    assert queue.get(first["job_id"])["status"] == QUEUED
+    assert queue.get(first["job_id"])["attempts"] == 0
+    assert queue.get(second["job_id"])["status"] == DEAD
+    assert queue.requeue() == 1
+    assert queue.stats()["queued"] == 2
+
+
+def test_prune_drops_old_finished_jobs_and_frees_their_keys(queue, clock):
+    done, _ = enqueue(queue, clock, "done", idempotency_key="key-1")
+    queue.claim("w1")
+    queue.complete(done["job_id"], "w1", {})
+    dead, _ = enqueue(queue, clock, "dead")
+    queue.claim("w1")
+    queue.fail(dead["job_id"], "w1", "bad", permanent=True)
+
+    clock.advance(3599)
+    assert queue.prune() == 0
+    clock.advance(2)
+    assert queue.prune() == 1
+    assert queue.get(done["job_id"]) is None
+    assert queue.get(dead["job_id"])["status"] == DEAD
+    _, created = enqueue(queue, clock, "done again", idempotency_key="key-1")
+    assert created
+
+
+def test_events_are_taken_once_in_order(queue, clock):
+    queue.record_event("job-1", "tts", attempt=1)
+    queue.record_event("job-1", "audio_ready", audio_url="http://x/a.mp3")
+
+    assert queue.take_events() == [
+        {"job_id": "job-1", "status": "tts", "attempt": 1},
+        {"job_id": "job-1", "status": "audio_ready", "audio_url": "http://x/a.mp3"},
+    ]
+    assert queue.take_events() == []
+    assert queue.stats()["pending_events"] == 0
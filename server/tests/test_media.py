@@ -0,0 +1,137 @@
+import os
+from email.utils import formatdate
+
+import pytest
+from flask import Flask
+
+from services.media import HotFileCache, resolve_media_path, send_media
+
+CONTENT = bytes(range(256)) * 4
+NAME = "ab" * 32 + ".mp3"
+ETAG = "ab" * 32
+
+
+@pytest.fixture
+def app():
+    return Flask(__name__)
+
+
+@pytest.fixture
+def media(tmp_path):
+    path = tmp_path / NAME
+    path.write_bytes(CONTENT)
+    return str(path)
+
+
+def serve(app, path, hot_cache=None, **headers):
+    with app.test_request_context(headers=headers):
+        response = send_media(path, "audio/mpeg", hot_cache)
+        body = b"".join(bytes(chunk) for chunk in response.response or [])
+        return response, body
+
+
+def test_serves_whole_file_with_validators(app, media):
+    response, body = serve(app, media)
+    assert response.status_code == 200
+    assert body == CONTENT
+    assert response.headers["ETag"] == f'"{ETAG}"'
+    assert response.headers["Accept-Ranges"] == "bytes"
+    assert response.headers["Cache-Control"] == "public, max-age=31536000, immutable"
+    assert response.content_length == len(CONTENT)
+
+
+def test_missing_file_returns_none(app, tmp_path):
+    with app.test_request_context():
+        assert send_media(str(tmp_path / NAME), "audio/mpeg") is None
+
+
+@pytest.mark.parametrize("hot", [False, True])
+@pytest.mark.parametrize("header, start, end", [
+    ("bytes=0-99", 0, 100),
+    ("bytes=1000-", 1000, 1024),
+    ("bytes=-24", 1000, 1024),
+    ("bytes=-5000", 0, 1024),  # A suffix longer than the file covers all of it
+    ("bytes=1000-5000", 1000, 1024),
+])
+def test_serves_single_ranges(app, media, hot, header, start, end):
+    response, body = serve(app, media, HotFileCache() if hot else None, Range=header)
+    assert response.status_code == 206
+    assert response.headers["Content-Range"] == f"bytes {start}-{end - 1}/1024"
+    assert body == CONTENT[start:end]
+    assert response.content_length == end - start
+
+
+def test_unsatisfiable_range_is_416(app, media):
+    response, _ = serve(app, media, Range="bytes=2000-")
+    assert response.status_code == 416
+    assert response.headers["Content-Range"] == "bytes */1024"
+
+
+@pytest.mark.parametrize("header", ["bytes=99-10", "bytes=0-9,20-29", "items=0-9", "bytes=abc"])
+def test_invalid_inverted_and_multi_ranges_get_the_whole_file(app, media, header):
+    response, body = serve(app, media, Range=header)
+    assert response.status_code == 200
+    assert body == CONTENT
+
+
+@pytest.mark.parametrize("if_none_match", [f'"{ETAG}"', f'W/"{ETAG}"', f'"other", "{ETAG}"', "*"])
+def test_if_none_match_uses_weak_comparison(app, media, if_none_match):
+    response, body = serve(app, media, **{"If-None-Match": if_none_match})
+    assert response.status_code == 304
+    assert body == b""
+
+
+def test_if_none_match_with_another_etag_sends_the_file(app, media):
+    response, body = serve(app, media, **{"If-None-Match": '"other"'})
+    assert response.status_code == 200
+    assert body == CONTENT
+
+
+def test_if_modified_since(app, media):
+    mtime = os.stat(media).st_mtime
+    response, _ = serve(app, media, **{"If-Modified-Since": formatdate(mtime + 10, usegmt=True)})
+    assert response.status_code == 304
+    response, _ = serve(app, media, **{"If-Modified-Since": formatdate(mtime - 3600, usegmt=True)})
+    assert response.status_code == 200
+
+
+def test_if_range_with_current_validator_sends_the_range(app, media):
+    response, body = serve(app, media, Range="bytes=0-9", **{"If-Range": f'"{ETAG}"'})
+    assert response.status_code == 206
+    assert body == CONTENT[:10]
+
+
+@pytest.mark.parametrize("if_range", ['"stale"', f'W/"{ETAG}"', formatdate(0, usegmt=True)])
+def test_if_range_with_stale_validator_sends_the_whole_file(app, media, if_range):
+    response, body = serve(app, media, Range="bytes=0-9", **{"If-Range": if_range})
+    assert response.status_code == 200
+    assert body == CONTENT
+
+
+def test_other_names_get_a_size_and_mtime_etag(app, tmp_path):
+    path = tmp_path / "clip.mp3"
+    path.write_bytes(CONTENT)
+    response, _ = serve(app, str(path))
+    stat = os.stat(path)
+    assert response.headers["ETag"] == f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+    assert response.headers["Cache-Control"] == "no-cache"
+
+
+def test_resolve_media_path_accepts_plain_names(tmp_path):
+    assert resolve_media_path(str(tmp_path), NAME) == os.path.join(os.path.realpath(tmp_path), NAME)
+
+
+@pytest.mark.parametrize("filename", [
+    "", ".hidden.mp3", "..", "../secret.mp3", "sub/file.mp3", "..\\secret.mp3", "file\x00.mp3", "/etc/passwd",
+])
+def test_resolve_media_path_rejects_paths_outside_the_directory(tmp_path, filename):
+    assert resolve_media_path(str(tmp_path), filename) is None
+
+
+def test_resolve_media_path_rejects_symlinks_out(tmp_path):
+    outside = tmp_path / "outside.mp3"
+    outside.write_bytes(b"secret")
+    media_dir = tmp_path / "media"
+    media_dir.mkdir()
+    (media_dir / "link.mp3").symlink_to(outside)
+    assert resolve_media_path(str(media_dir), "link.mp3") is None
@@ -0,0 +1,154 @@
+import pytest
+
+from services import mp3
+
+MPEG1_HEADER = b"\xff\xfb\x90\x64"  # MPEG-1 Layer III, 128 kbps, 44.1 kHz, joint stereo: 417 bytes
+MPEG1_PADDED = b"\xff\xfb\x92\x64"  # The same with the padding bit: 418 bytes
+MPEG1_48K = b"\xff\xfb\x94\x64"  # 128 kbps, 48 kHz: 384 bytes
+MPEG2_HEADER = b"\xff\xf3\x80\xc4"  # MPEG-2 Layer III, 64 kbps, 22.05 kHz, mono: 208 bytes
+
+
+def frame(header: bytes, fill: int = 0x11) -> bytes:
+    return header + bytes([fill]) * (mp3.parse_header(header).length - 4)
+
+
+def info_frame() -> bytes:
+    """A first frame carrying an Info (CBR Xing) header after the stereo side info."""
+    data = bytearray(frame(MPEG1_HEADER, 0))
+    data[36:40] = b"Info"
+    return bytes(data)
+
+
+def id3v2(body: bytes = b"\x00" * 20) -> bytes:
+    return b"ID3\x03\x00\x00" + mp3._syncsafe(len(body)) + body
+
+
+def id3v1() -> bytes:
+    return b"TAG" + b"\x00" * 125
+
+
+def test_parses_mpeg1_header():
+    header = mp3.parse_header(MPEG1_HEADER)
+    assert (header.version, header.bitrate, header.sample_rate) == (mp3.MPEG1, 128000, 44100)
+    assert (header.length, header.samples, header.padding, header.protected) == (417, 1152, 0, False)
+    assert mp3.parse_header(MPEG1_PADDED).length == 418
+    assert mp3.parse_header(MPEG1_48K).length == 384
+
+
+def test_parses_mpeg2_header():
+    header = mp3.parse_header(MPEG2_HEADER)
+    assert (header.version, header.bitrate, header.sample_rate) == (mp3.MPEG2, 64000, 22050)
+    assert (header.length, header.samples, header.mode) == (208, 576, mp3.MONO)
+
+
+@pytest.mark.parametrize("data", [
+    b"\xff\xfd\x90\x64",  # Layer I
+    b"\xff\xfb\xf0\x64",  # Bitrate index 15
+    b"\xff\xfb\x9c\x64",  # Reserved sample rate
+    b"\xff\xeb\x90\x64",  # Reserved MPEG version
+    b"\xff\xfb\x90",  # Truncated
+])
+def test_rejects_invalid_headers(data):
+    assert mp3.parse_header(data) is None
+
+
+def test_iter_frames_skips_tags_and_info_frame():
+    audio = frame(MPEG1_HEADER) + frame(MPEG1_PADDED) + frame(MPEG1_HEADER)
+    data = id3v2() + info_frame() + audio + id3v1()
+
+    found = mp3.frames(data)
+
+    start = len(id3v2()) + 417
+    assert [offset for offset, _ in found] == [start, start + 417, start + 835]
+    assert [header.length for _, header in found] == [417, 418, 417]
+    assert mp3.duration(data) == pytest.approx(3 * 1152 / 44100)
+
+
+def test_iter_frames_handles_mpeg2():
+    data = frame(MPEG2_HEADER) * 4
+    assert [offset for offset, _ in mp3.frames(data)] == [0, 208, 416, 624]
+    assert mp3.duration(data) == pytest.approx(4 * 576 / 22050)
+
+
+def test_iter_frames_resyncs_over_junk():
+    # The 0xFF in the junk starts a valid-looking header, but no frame follows where it would end.
+    junk = b"\x00\x12" + MPEG1_HEADER + b"garbage\xff"
+    data = junk + frame(MPEG1_HEADER) + frame(MPEG1_HEADER) + frame(MPEG1_HEADER)
+
+    offsets = [offset for offset, _ in mp3.frames(data)]
+
+    assert offsets == [len(junk), len(junk) + 417, len(junk) + 834]
+
+
+def test_iter_frames_resyncs_after_a_tag_with_trailing_junk():
+    data = id3v2() + b"\x00" * 7 + frame(MPEG2_HEADER) * 2
+    assert [offset for offset, _ in mp3.frames(data)] == [len(id3v2()) + 7, len(id3v2()) + 215]
+
+
+def test_stitch_drops_tags_and_info_frames():
+    segment = id3v2() + info_frame() + frame(MPEG1_HEADER, 0x21) + frame(MPEG1_HEADER, 0x22) + id3v1()
+
+    stitched = mp3.stitch([segment, segment])
+
+    body = frame(MPEG1_HEADER, 0x21) + frame(MPEG1_HEADER, 0x22)
+    assert stitched == body + body
+
+
+@pytest.mark.parametrize("gap_ms, count", [(0, 0), (26, 1), (260, 10), (1000, 38)])
+def test_stitch_inserts_silence_frames_for_the_gap(gap_ms, count):
+    segment = frame(MPEG1_PADDED, 0x33) * 2
+
+    stitched = mp3.stitch([segment, segment, segment], gap_ms=gap_ms)
+
+    found = mp3.frames(stitched)
+    assert len(found) == 6 + 2 * count
+    silence = [stitched[offset:offset + header.length] for offset, header in found[2:2 + count]]
+    for silent in silence:
+        header = mp3.parse_header(silent)
+        assert (header.padding, header.protected, header.length) == (0, False, 417)
+        assert silent[4:] == b"\x00" * 413
+    assert mp3.duration(stitched) == pytest.approx((6 + 2 * count) * 1152 / 44100)
+
+
+def test_silence_frame_matches_the_template_format():
+    protected = b"\xff\xfa\x92\x64"  # CRC and padding set
+    silence = mp3.silence_frame(mp3.parse_header(protected), protected)
+    header = mp3.parse_header(silence)
+    assert silence[:4] == MPEG1_HEADER
+    assert (header.protected, header.padding, len(silence)) == (False, 0, 417)
+
+
+def test_stitch_rejects_sample_rate_mismatch():
+    with pytest.raises(ValueError, match="Segment 1 is 48000 Hz"):
+        mp3.stitch([frame(MPEG1_HEADER) * 2, frame(MPEG1_48K) * 2])
+
+
+def test_stitch_rejects_mpeg_version_mismatch():
+    with pytest.raises(ValueError, match="Segment 1"):
+        mp3.stitch([frame(MPEG1_HEADER) * 2, frame(MPEG2_HEADER) * 2])
+
+
+def test_stitch_rejects_segment_without_frames():
+    with pytest.raises(ValueError, match="Segment 1 contains no MP3 frames"):
+        mp3.stitch([frame(MPEG1_HEADER), id3v2() + b"not audio"])
+
+
+def test_with_tags_round_trips_through_id3v2_size():
+    audio = frame(MPEG1_HEADER) * 3
+    tags = {"REPLAYGAIN_TRACK_GAIN": "-3.25 dB", "COMMENT": "x" * 300}
+
+    tagged = mp3.with_tags(id3v2() + audio, tags)
+
+    size = mp3.id3v2_size(tagged)
+    assert tagged[:5] == b"ID3\x04\x00"
+    assert size > 300
+    assert tagged[size:] == audio
+    assert b"REPLAYGAIN_TRACK_GAIN\x00-3.25 dB" in tagged[:size]
+    assert [header for _, header in mp3.frames(tagged)] == [header for _, header in mp3.frames(audio)]
+    assert mp3.with_tags(tagged, tags) == tagged
+
+
+def test_id3v2_size_counts_the_footer():
+    tag = b"ID3\x04\x00\x10" + mp3._syncsafe(20) + b"\x00" * 30
+    assert mp3.id3v2_size(tag) == 40
+    assert mp3.id3v2_size(b"no tag here") == 0
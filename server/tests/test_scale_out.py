@@ -0,0 +1,152 @@
+"""
+Two server instances behind a local load balancer, sharing DATA_DIR, a
+file:// media store and a sqlite:/// Socket.IO message queue, each with
+its own AUDIO_DIR as on separate machines. Generation jobs are durable
+and run by a worker process started with instance A's settings.
+"""
+import socket
+import threading
+import uuid
+from typing import Any, Dict, List
+
+import pytest
+import requests
+import socketio
+
+from bench.harness import start_server, start_worker, stop_server
+from bench.mock_upstreams import MockUpstreams
+from bench.scale_out import LoadBalancer
+
+TIMEOUT = 30
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class EventClient:
+    """Socket.IO client connected to one instance, recording the events it receives."""
+
+    def __init__(self, url: str):
+        self.events: List[Dict[str, Any]] = []
+        self._changed = threading.Condition()
+        self.sio = socketio.Client(reconnection=False)
+        for name in ("job_status", "video_ready"):
+            self.sio.on(name, lambda data, name=name: self._record(name, data))
+        self.sio.connect(url, transports=["polling"])
+
+    def _record(self, name: str, data: Dict[str, Any]) -> None:
+        with self._changed:
+            self.events.append({"event": name, **data})
+            self._changed.notify_all()
+
+    def subscribe(self, **rooms: str) -> None:
+        self.sio.call("subscribe", rooms, timeout=TIMEOUT)
+
+    def wait_for(self, event: str, **fields: Any) -> Dict[str, Any]:
+        def match():
+            return next((e for e in self.events if e["event"] == event
+                         and all(e.get(name) == value for name, value in fields.items())), None)
+
+        with self._changed:
+            found = self._changed.wait_for(match, TIMEOUT)
+        assert found, f"no {event} {fields} within {TIMEOUT}s; got {self.events}"
+        return found
+
+    def close(self) -> None:
+        self.sio.disconnect()
+
+
+@pytest.fixture(scope="module")
+def cluster(tmp_path_factory):
+    workdir = tmp_path_factory.mktemp("cluster")
+    shared = workdir / "shared"
+    upstreams = MockUpstreams(free_port(), tts_latency=0.05, did_latency=0.05, render_time=0.5).start()
+    upstream_url = f"http://127.0.0.1:{upstreams.server_port}"
+    ports = [free_port(), free_port()]
+    balancer = LoadBalancer(free_port(), [f"http://127.0.0.1:{port}" for port in ports]).start()
+    env = {
+        "SERVER_URL": f"http://127.0.0.1:{balancer.server_port}",
+        "WARMUP": "false",
+        "DURABLE_JOBS": "true",
+        "DATA_DIR": str(shared / "data"),
+        "MEDIA_STORE": f"file://{shared / 'media'}",
+        "SOCKETIO_MESSAGE_QUEUE": f"sqlite:///{shared / 'socketio.db'}",
+    }
+    processes = []
+    try:
+        for port in ports:
+            processes.append(start_server(port, upstream_url, str(workdir / f"instance{port}"), env))
+        processes.append(start_worker(ports[0], upstream_url, str(workdir / f"instance{ports[0]}"), 1, env))
+        yield [f"http://127.0.0.1:{port}" for port in ports]
+    finally:
+        for process in processes:
+            stop_server(process)
+        balancer.shutdown()
+        balancer.server_close()
+        upstreams.shutdown()
+        upstreams.server_close()
+
+
+@pytest.fixture(scope="module")
+def generated(cluster):
+    """A job submitted on instance A by a client connected to A, run to audio_ready."""
+    a, _ = cluster
+    client = EventClient(a)
+    try:
+        response = requests.post(f"{a}/api/generate", json={
+            "text": f"Scale-out test {uuid.uuid4().hex[:8]}.", "socket_id": client.sio.get_sid()
+        }, timeout=TIMEOUT)
+        assert response.status_code == 202, response.text
+        job_id = response.json()["job_id"]
+        client.subscribe(job_id=job_id)
+        audio_ready = client.wait_for("job_status", job_id=job_id, status="audio_ready")
+        yield {"job_id": job_id, "audio_url": audio_ready["audio_url"]}
+    finally:
+        client.close()
+
+
+def test_audio_from_instance_a_is_served_by_instance_b(cluster, generated):
+    a, b = cluster
+    filename = generated["audio_url"].rsplit("/", 1)[1]
+    original = requests.get(f"{a}/api/audio/{filename}", timeout=TIMEOUT)
+    assert original.status_code == 200
+
+    full = requests.get(f"{b}/api/audio/{filename}", timeout=TIMEOUT)
+    assert full.status_code == 200
+    assert full.content == original.content
+
+    partial = requests.get(f"{b}/api/audio/{filename}", headers={"Range": "bytes=100-299"}, timeout=TIMEOUT)
+    assert partial.status_code == 206
+    assert partial.headers["Content-Range"] == f"bytes 100-299/{len(original.content)}"
+    assert partial.content == original.content[100:300]
+
+
+def test_job_submitted_on_a_is_readable_on_b(cluster, generated):
+    _, b = cluster
+    response = requests.get(f"{b}/api/generate/{generated['job_id']}", timeout=TIMEOUT)
+    assert response.status_code == 200
+    job = response.json()
+    assert job["job_id"] == generated["job_id"]
+    assert job["status"] in ("running", "done")
+    assert job["attempts"] == 1
+
+
+def test_webhook_on_b_reaches_client_on_a(cluster):
+    a, b = cluster
+    talk_id = f"tlk_{uuid.uuid4().hex}"
+    client = EventClient(a)
+    try:
+        client.subscribe(talk_id=talk_id)
+        response = requests.post(f"{b}/api/webhook", json={
+            "id": talk_id, "status": "done", "result_url": f"https://example.com/{talk_id}.mp4"
+        }, timeout=TIMEOUT)
+        assert response.status_code == 200
+
+        ready = client.wait_for("video_ready", id=talk_id)
+        assert ready["status"] == "done"
+        assert requests.get(f"{a}/api/jobs/{talk_id}", timeout=TIMEOUT).json()["status"] == "done"
+    finally:
+        client.close()
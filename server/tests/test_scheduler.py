@@ -0,0 +1,145 @@
+import threading
+import time
+import types
+
+import pytest
+
+from services.rate_limit import TokenBucket
+from services.scheduler import JobScheduler, LimiterChain, Overloaded, UpstreamLimiter, raise_if_throttled
+
+
+def spawn(fn):
+    threading.Thread(target=fn, daemon=True).start()
+
+
+@pytest.mark.parametrize("rate", [0, -1])
+def test_token_bucket_rejects_non_positive_rates(rate):
+    with pytest.raises(ValueError, match="must be positive"):
+        TokenBucket(rate)
+
+
+def test_token_bucket_allows_a_burst_then_reports_the_wait():
+    bucket = TokenBucket(rate=10, capacity=2)
+    assert bucket.try_acquire() == 0
+    assert bucket.try_acquire() == 0
+    assert 0 < bucket.try_acquire() <= 0.1
+    assert not bucket.acquire(timeout=0)
+    assert bucket.acquire(timeout=1)
+
+
+def test_limiter_rejects_past_the_concurrency_limit():
+    limiter = UpstreamLimiter("tts", max_concurrent=1, rate=100, wait_timeout=0.05)
+
+    with limiter.slot():
+        assert limiter.stats()["in_flight"] == 1
+        with pytest.raises(Overloaded, match="tts is at its concurrency limit") as error:
+            with limiter.slot():
+                pass
+
+    assert error.value.retry_after == 1
+    assert limiter.stats() == {"in_flight": 0, "waiting": 0, "rejected": 1, "max_concurrent": 1, "rate": 100}
+    with limiter.slot():
+        pass
+
+
+def test_limiter_rejects_past_the_rate_limit_and_frees_the_slot():
+    limiter = UpstreamLimiter("did", max_concurrent=1, rate=0.25, burst=1, wait_timeout=0.05)
+
+    with limiter.slot():
+        pass
+    with pytest.raises(Overloaded, match="did is at its request rate limit") as error:
+        with limiter.slot():
+            pass
+
+    # One caller in line at 0.25 requests per second.
+    assert error.value.retry_after == 4
+    assert limiter._slots.acquire(blocking=False)
+
+
+def test_limiter_waits_for_a_slot_within_the_timeout():
+    limiter = UpstreamLimiter("tts", max_concurrent=1, rate=100, wait_timeout=5)
+    entered, release = threading.Event(), threading.Event()
+
+    def hold():
+        with limiter.slot():
+            entered.set()
+            release.wait()
+
+    spawn(hold)
+    entered.wait()
+    threading.Timer(0.05, release.set).start()
+    with limiter.slot():
+        assert limiter.stats()["rejected"] == 0
+
+
+def test_limiter_chain_releases_earlier_slots_when_a_later_one_is_full():
+    profile = UpstreamLimiter("tts:joaquin", max_concurrent=1, rate=100, wait_timeout=0.05)
+    shared = UpstreamLimiter("tts", max_concurrent=1, rate=100, wait_timeout=0.05)
+
+    with shared.slot():
+        with pytest.raises(Overloaded):
+            with LimiterChain(profile, None, shared).slot():
+                pass
+
+    assert profile.stats()["in_flight"] == 0
+    with LimiterChain(profile, shared).slot():
+        assert profile.stats()["in_flight"] == shared.stats()["in_flight"] == 1
+
+
+def test_upstream_429_becomes_overloaded_with_its_retry_after():
+    throttled = types.SimpleNamespace(status_code=429, headers={"Retry-After": "7"})
+    with pytest.raises(Overloaded, match="elevenlabs is rate limiting requests") as error:
+        raise_if_throttled(throttled, "elevenlabs")
+    assert error.value.retry_after == 7
+
+    with pytest.raises(Overloaded) as error:
+        raise_if_throttled(types.SimpleNamespace(status_code=429, headers={"Retry-After": "soon"}), "did")
+    assert error.value.retry_after == 1
+
+    raise_if_throttled(types.SimpleNamespace(status_code=200, headers={}), "did")
+    raise_if_throttled(None, "did")
+
+
+def test_scheduler_rejects_when_the_queue_is_full():
+    scheduler = JobScheduler(workers=2, max_queued=2)
+    assert scheduler.submit("a", print) == 1
+    assert scheduler.submit("b", print) == 2
+
+    with pytest.raises(Overloaded, match="queue is full") as error:
+        scheduler.submit("c", print)
+
+    # Two jobs of 5 s on average ahead, shared by two workers.
+    assert error.value.retry_after == 5
+    assert scheduler.stats()["queued"] == 2
+    assert scheduler.stats()["rejected"] == 1
+
+
+def test_scheduler_runs_jobs_in_order_and_announces_positions():
+    scheduler = JobScheduler(workers=1, max_queued=10)
+    positions, ran, done = [], [], threading.Event()
+    release = threading.Event()
+
+    def job(name):
+        if name == "a":
+            release.wait()
+        ran.append(name)
+        if name == "boom":
+            raise RuntimeError("failed")
+        if name == "d":
+            done.set()
+
+    for name in ("a", "b", "boom", "d"):
+        scheduler.submit(name, job, name)
+    scheduler.start(spawn, on_position=lambda job_id, position: positions.append((job_id, position)))
+    # Started once; a second start does not add workers.
+    scheduler.start(spawn)
+
+    deadline = time.monotonic() + 5
+    while scheduler.stats()["running"] == 0 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert positions == [("b", 1), ("boom", 2), ("d", 3)]
+    release.set()
+
+    assert done.wait(5)
+    assert ran == ["a", "b", "boom", "d"]
+    assert positions[3:] == [("boom", 1), ("d", 2), ("d", 1)]
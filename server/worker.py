@@ -0,0 +1,159 @@
+"""
+Run durable generation jobs (DURABLE_JOBS=true) in worker processes.
+
+The web process (run.py) only queues /api/generate jobs in JOB_QUEUE_PATH
+and relays their progress to Socket.IO clients; the TTS and D-ID steps run
+here, so web and worker capacity scale separately and a redeploy of either
+loses no jobs.
+
+    python worker.py                          # WORKER_PROCESSES x WORKER_THREADS jobs at once
+    python worker.py --processes 4 --threads 2
+    python worker.py --dead                   # list dead-lettered jobs
+    python worker.py --requeue all            # retry every dead-lettered job (or pass a job ID)
+
+Each process gets an equal share of the ElevenLabs and D-ID limits, so all
+of them together stay within ELEVENLABS_* and DID_* limits. Workers that
+exit unexpectedly are restarted; on SIGTERM each one finishes its current
+jobs first.
+"""
+import os
+import sys
+import json
+import time
+import signal
+import socket
+import logging
+import argparse
+import threading
+import multiprocessing
+
+from config import Config
+from services.logs import configure_logging
+
+logger = logging.getLogger(__name__)
+
+PRUNE_INTERVAL = 600  # Seconds between clean-ups of old finished jobs
+
+
+def share_upstream_limits(app, processes: int) -> None:
+    """Replace the upstream limiters with this process's share of them."""
+    from services.scheduler import UpstreamLimiter
+    for name, limiter in list(app.extensions["upstream_limits"].items()):
+        app.extensions["upstream_limits"][name] = UpstreamLimiter(
+            name,
+            max_concurrent=max(1, limiter.max_concurrent // processes),
+            rate=limiter.bucket.rate / processes,
+            wait_timeout=limiter.wait_timeout
+        )
+
+
+def work(app, worker: str, stop: threading.Event) -> None:
+    """Claim and run jobs until stop is set."""
+    from services.pipeline import run_queued_job
+    queue = app.extensions["job_queue"]
+    interval = app.config["WORKER_POLL_INTERVAL"]
+    while not stop.is_set():
+        try:
+            job = queue.claim(worker)
+        except Exception as e:
+            logger.error(f"Worker {worker} could not claim a job: {e}")
+            job = None
+        if job is None:
+            stop.wait(interval)
+            continue
+        logger.info(f"Worker {worker} running job {job['job_id']} (attempt {job['attempts']})")
+        try:
+            run_queued_job(app, job, worker)
+        except Exception as e:
+            # Left running; another worker picks it up once the lease expires.
+            logger.error(f"Worker {worker} crashed on job {job['job_id']}: {e}")
+
+
+def run_process(index: int, processes: int, threads: int) -> None:
+    """Entry point of one worker process."""
+    from app import app
+    from services.container import warm_up
+    share_upstream_limits(app, processes)
+    if app.config["WARMUP"]:
+        warm_up(app, [app.config["ELEVENLABS_API_URL"], app.config["DID_API_URL"]])
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    signal.signal(signal.SIGINT, lambda *_: stop.set())
+
+    name = f"{socket.gethostname()}:{os.getpid()}"
+    workers = [
+        threading.Thread(target=work, args=(app, f"{name}/{n}", stop), name=f"worker-{n}")
+        for n in range(threads)
+    ]
+    for thread in workers:
+        thread.start()
+    logger.info(f"Worker process {index} ({name}) started with {threads} threads")
+    while not stop.wait(PRUNE_INTERVAL):
+        pruned = app.extensions["job_queue"].prune()
+        if pruned:
+            logger.info(f"Pruned {pruned} finished jobs")
+    for thread in workers:
+        thread.join()
+    logger.info(f"Worker process {index} ({name}) stopped")
+
+
+def supervise(processes: int, threads: int) -> None:
+    """Start the worker processes and restart any that exit until told to stop."""
+    context = multiprocessing.get_context("spawn")
+    stopping = threading.Event()
+
+    def start(index: int):
+        process = context.Process(target=run_process, args=(index, processes, threads), name=f"worker-{index}")
+        process.start()
+        return process
+
+    def shutdown(*_):
+        stopping.set()
+
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+    running = {index: start(index) for index in range(processes)}
+    while not stopping.wait(1):
+        for index, process in running.items():
+            if not process.is_alive():
+                logger.warning(f"Worker process {index} exited with {process.exitcode}; restarting it")
+                running[index] = start(index)
+    for process in running.values():
+        process.terminate()
+    for process in running.values():
+        process.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run durable generation jobs.")
+    parser.add_argument("--processes", type=int, default=Config.WORKER_PROCESSES)
+    parser.add_argument("--threads", type=int, default=Config.WORKER_THREADS, help="Jobs per process at once")
+    parser.add_argument("--dead", action="store_true", help="List dead-lettered jobs and exit")
+    parser.add_argument("--requeue", metavar="JOB_ID", help="Requeue a dead-lettered job, or 'all'")
+    args = parser.parse_args()
+
+    if args.dead or args.requeue:
+        from services.job_queue import JobQueue
+        queue = JobQueue(Config.JOB_QUEUE_PATH, max_attempts=Config.JOB_MAX_ATTEMPTS)
+        if args.requeue:
+            count = queue.requeue(None if args.requeue == "all" else args.requeue)
+            print(json.dumps({"requeued": count}))
+        else:
+            for job in queue.dead_letters():
+                print(json.dumps({
+                    "job_id": job["job_id"],
+                    "attempts": job["attempts"],
+                    "error": job["error"],
+                    "failed_at": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(job["updated_at"])),
+                    "text": job["payload"].get("text", "")[:80],
+                }))
+        return
+
+    if not Config.DURABLE_JOBS:
+        logger.warning("DURABLE_JOBS is off, so the web process runs jobs itself; this worker will stay idle")
+    supervise(args.processes, args.threads)
+
+
+if __name__ == "__main__":
+    configure_logging(vars(Config))
+    sys.exit(main())